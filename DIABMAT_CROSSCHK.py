@@ -0,0 +1,29 @@
+#!/usr/bin/python3
+
+'''
+This script checks for crossings of the diabatic states over the diabatic state matrices of a scan and sets their
+energies relative to a reference SCF energy, as CROSSOVER-CHECK+EREL.m but for the whole scan in one process
+
+The matrices must be named BLABLA_123_05l.diabmat, each with the output [BLABLA_123_05l].out of its calculation.
+Each point is compared to the (already checked) points one and two steps closer to Q = 0, [prefix]_[name].diabmat is
+written for each
+'''
+
+import argparse
+import diabatFUNCS as dF
+
+
+parser = argparse.ArgumentParser(description="This script checks the diabatic state matrices of a scan for crossings")
+parser.add_argument("-p", dest="prefix", metavar="prefix", help="prefix of the outputs", required=True)
+parser.add_argument("-e", dest="energy", metavar="energy", help="SCF energy in a.u. which will be the relative 0", required=True, type=float)
+parser.add_argument("-l", dest="list", metavar="list", help="file listing the matrices. Default: perm.lst", required=False, default='perm.lst')
+parser.add_argument("files", metavar="file", nargs='*', help="the matrices, instead of -l")
+args = vars(parser.parse_args())
+
+files = args["files"]
+if not files:
+    with open(args["list"]) as listing:
+        files = listing.read().split()
+
+dF.crossover_scan(files, args["prefix"], args["energy"])
+print('Checked {} matrices for crossovers'.format(len(files)))
@@ -0,0 +1,27 @@
+#!/usr/bin/python3
+
+'''
+This script fixes arbitrary sign changes in the diabatic state matrices of a scan, due to phase changes in the orbitals,
+by imposing the signs of a mask matrix on all of them, as SIGNFIX-DIABMAT.m but for the whole scan in one process
+
+For each [name].diabmat, [prefix][name].diabmat and [prefix][name].adiabex (the eigenvalues) are written
+'''
+
+import argparse
+import diabatFUNCS as dF
+
+
+parser = argparse.ArgumentParser(description="This script fixes the signs of the diabatic state matrices of a scan")
+parser.add_argument("-m", dest="mask", metavar="mask", help="the mask matrix", required=True)
+parser.add_argument("-p", dest="prefix", metavar="prefix", help="prefix of the outputs. Default: none", required=False, default='')
+parser.add_argument("-l", dest="list", metavar="list", help="file listing the matrices, named BLABLA_123_05l.extension. Default: sign.lst", required=False, default='sign.lst')
+parser.add_argument("files", metavar="file", nargs='*', help="the matrices, instead of -l")
+args = vars(parser.parse_args())
+
+files = args["files"]
+if not files:
+    with open(args["list"]) as listing:
+        files = listing.read().split()
+
+dF.signfix_scan(files, args["mask"], args["prefix"])
+print('Fixed the signs of {} matrices with {}'.format(len(files), args["mask"]))
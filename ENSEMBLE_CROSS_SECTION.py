@@ -0,0 +1,45 @@
+#!/usr/bin/python3
+
+'''
+This script calculates the photoabsorption cross section of a nuclear ensemble from the excited state
+calculations of each of its geometries (see batchFUNCS.ensemble_cross_section)
+'''
+
+
+import numpy as np
+import argparse
+import batchFUNCS as bF
+
+
+_bohr2toangstr2 = 0.529177**2
+
+parser = argparse.ArgumentParser(description="This script calculates the photoabsorption cross section (in angstrom^2) of a nuclear ensemble")
+parser.add_argument("files", metavar="file", nargs='+', help="output files, one per geometry of the ensemble")
+parser.add_argument("-t", dest="turbomole", help="the outputs are from Turbomole escf, by default Gaussian or Q-Chem outputs parsed by cclib are expected", required=False, default=False, action='store_true')
+parser.add_argument("-b", dest="begin", metavar="begin", help="lowest energy in eV. Default: 1.0 eV", type=float, required=False, default=1.0)
+parser.add_argument("-e", dest="end", metavar="end", help="highest energy in eV. Default: 10.0 eV", type=float, required=False, default=10.0)
+parser.add_argument("-p", dest="points", metavar="points", help="number of points in spectrum. Default: 2000", type=int, required=False, default=2000)
+parser.add_argument("-f", dest="fwhm", metavar="fwhm", help="full width at half maximum in eV. Default: 0.1 eV", type=float, required=False, default=0.1)
+parser.add_argument("-L", dest="Lorentzian", help="by default, a Gaussian broadening function is applied, use -L to change this to Lorentzian", required=False, default=False, action='store_true')
+parser.add_argument("-B", dest="bootstrap", metavar="samples", help="number of bootstrap resamplings for the uncertainty. Default: 200", type=int, required=False, default=200)
+parser.add_argument("-s", dest="seed", metavar="seed", help="random seed for the bootstrap", type=int, required=False, default=None)
+parser.add_argument("-n", dest="workers", metavar="N", help="number of processes used to parse the files. Default: all CPUs", type=int, required=False, default=None)
+parser.add_argument("-o", dest="output", metavar="output", help="name of the output file. Default: ensemble_cross_section.dat", required=False, default='ensemble_cross_section.dat')
+args = vars(parser.parse_args())
+
+if args["turbomole"]:
+    function = bF.turbo_excitation_data
+else:
+    function = bF.excitation_data
+if args["Lorentzian"]:
+    shape = 'Lorentzian'
+else:
+    shape = 'Gaussian'
+
+x = np.linspace(args["begin"], args["end"], args["points"])
+mean, error, lower, upper, errors = bF.ensemble_cross_section(args["files"], x, args["fwhm"], function, shape,
+                                                              args["bootstrap"], args["seed"], args["workers"])
+bF.report_errors(errors)
+
+header = 'Energy / eV, cross section / angstrom^2, bootstrap standard error, 2.5 %, 97.5 % ({} of {} geometries)'.format(len(args["files"]) - len(errors), len(args["files"]))
+np.savetxt(args["output"], np.column_stack((x, np.column_stack((mean, error, lower, upper)) * _bohr2toangstr2)), header=header)
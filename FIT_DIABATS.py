@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+
+'''
+This script fits polynomials of Q to every element of the diabatic state (or rotation) matrices of the scans of any
+number of modes, and optionally Morse potentials to the diabatic energies, replacing REFIT-DIABATS.m and ROTMAT-FIT.m
+
+The files must be named BLABLA_123_05l.extension (mode 123 at Q = -0.05), see fitFUNCS. All of the fits are written to
+[output].fit.npz, and the fitted matrices at the values of Q of -q to [output]_[mode]_[Q].extension
+'''
+
+import argparse
+import numpy as np
+import fitFUNCS as fF
+
+
+parser = argparse.ArgumentParser(description="This script fits polynomials and Morse potentials to the matrices of scans")
+parser.add_argument("files", metavar="file", nargs='*', help="the matrices, instead of -l")
+parser.add_argument("-l", dest="list", metavar="list", help="file listing the matrices. Default: fitting.lst", required=False, default='fitting.lst')
+parser.add_argument("-n", dest="order", metavar="order", help="order of the polynomials. Default: 4", required=False, type=int, default=4)
+parser.add_argument("-c", dest="select", help="choose the order of each element from 1 to -n by leave-one-out cross validation", required=False, default=False, action='store_true')
+parser.add_argument("-m", dest="morse", help="also fit Morse potentials to the diagonal elements", required=False, default=False, action='store_true')
+parser.add_argument("-s", dest="signfix", help="impose the signs of the matrix at Q = 0 on the others before fitting, as ROTMAT-FIT.m", required=False, default=False, action='store_true')
+parser.add_argument("-q", dest="Q", metavar="Q", nargs='+', help="values of Q at which to write the fitted matrices", required=False, type=float, default=[])
+parser.add_argument("-d", dest="step", metavar="step", help="Q of one step in the names of the files. Default: {}".format(fF._Q_step), required=False, type=float, default=fF._Q_step)
+parser.add_argument("-o", dest="output", metavar="output", help="basename of the output. Default: fit", required=False, default='fit')
+args = vars(parser.parse_args())
+
+files = args["files"]
+if not files:
+    with open(args["list"]) as listing:
+        files = listing.read().split()
+
+scans = fF.load_scan(files, args["step"], args["signfix"])
+coefficients = fF.fit_scan(scans, args["order"], args["select"])
+modes = sorted(coefficients)
+FIT = {'modes': np.array(modes), 'coefficients': np.stack([coefficients[mode] for mode in modes])}
+if args["morse"]:
+    parameters, errors = fF.Morse_scan(scans)
+    FIT['Morse'] = np.stack([parameters[mode] for mode in modes])
+    FIT['Morse_errors'] = np.stack([errors[mode] for mode in modes])
+np.savez('{}.fit.npz'.format(args["output"]), **FIT)
+print('Fitted {} modes, written to {}.fit.npz'.format(len(modes), args["output"]))
+
+extension = files[0].split('.')[-1]
+for mode in modes:
+    for Q, matrix in zip(args["Q"], fF.polynomial_evaluate(coefficients[mode], args["Q"])):
+        np.savetxt('{}_{}_{}.{}'.format(args["output"], mode, Q, extension), matrix, fmt='% 1.11f', delimiter='\t')
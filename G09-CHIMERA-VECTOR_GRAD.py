@@ -66,7 +66,7 @@ args = vars(parser.parse_args())
 
 infile = cclib.parser.ccopen(args["file"]).parse()
 
-gradvec = pG.gradient(args["file"])
+gradvec = pG.gradient(args["file"], steps='last')
 
 bild = GRADbilder(gradvec)
 if not args["quiet"]:
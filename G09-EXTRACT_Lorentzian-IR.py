@@ -27,11 +27,8 @@ parsedfile = incoming.parse()
 # Create the x axis using the settings
 x = np.linspace(args["begin"], args["end"], args["points"])
 
-# Make the Lorentzians and add them together
-composite = 0
-for count, peak in enumerate(parsedfile.vibfreqs):
-    thispeak = lineshapes.IRLorentzian(x, peak, parsedfile.vibirs[count], args["fwhm"])
-    composite += thispeak
+# Make the Lorentzians and add them together, every one over the whole axis (no truncated tails)
+composite = lineshapes.broaden(x, parsedfile.vibfreqs, parsedfile.vibirs, args["fwhm"], 'Lorentzian', 'IR', method='direct')
 
 # If saving has been asked for
 if args["save"] is not None:
@@ -0,0 +1,37 @@
+#!/usr/bin/python3
+
+'''
+This script uses parseGAUSSIAN to extract the high-precision, (Frobenius) normalized cartesian displacement matrices for
+the normal modes from a Gaussian 09 calculation run with freq=hpmodes, reading the file only once. The displacements are
+not mass-weighted: the reduced masses are written alongside them (vibrmasses) for that.
+
+The modes are written to [log-file-name].hpmodes.npz, with the displacements also in [log-file-name].vibdisps.npy
+which may be memory-mapped, see parseGAUSSIAN.load_hpmodes
+'''
+
+
+import os
+import argparse
+import numpy as np
+import parseGAUSSIAN as pG
+
+
+parser = argparse.ArgumentParser(description="This script extracts freq=hpmodes normal modes from a Gaussian 09 file")
+parser.add_argument("-i", dest="file", metavar="file", help="input Gaussian 09 frequency calculation, including the keyword freq=hpmodes", required=True)
+parser.add_argument("-l", dest="legacy", help="also write the [name].m[n].dat and [name].freqlist files of G09-EXTRACT_hpmodes.sh and G09-EXTRACT_hpmodes_freqlist.sh", required=False, default=False, action='store_true')
+args = vars(parser.parse_args())
+
+# Same naming as the shell scripts: the input without its extension, next to it
+basename = os.path.splitext(args["file"])[0]
+
+HPMODES = pG.hpmodes(args["file"])
+pG.write_hpmodes(HPMODES, basename)
+print('Extracted {} modes to {}.hpmodes.npz and {}.vibdisps.npy'.format(len(HPMODES['vibfreqs']), basename, basename))
+
+if args["legacy"]:
+    with open('{}.freqlist'.format(basename), 'w') as freqlist:
+        for mode, frequency in enumerate(HPMODES['vibfreqs']):
+            freqlist.write('{:4d}\t{: 11.5f}\n'.format(mode + 1, frequency))
+    for mode, displacement in enumerate(HPMODES['vibdisps']):
+        np.savetxt('{}.m{}.dat'.format(basename, mode + 1), displacement, fmt='\t% 1.5f', delimiter='')
+    print('Legacy files written')
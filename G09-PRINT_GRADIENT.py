@@ -15,7 +15,7 @@ parser.add_argument("-i", dest="file", metavar="file", help="input Gaussian 09 c
 parser.add_argument("-s", dest="show", help="print the vector to the screen", required=False, default=False, action='store_true')
 args = vars(parser.parse_args())
 
-gradvec = pG.gradient(args["file"])
+gradvec = pG.gradient(args["file"], steps='last')
 gradMAG = np.linalg.norm(gradvec, 'fro')
 
 print('|force| = {:0.4f} eV bohr-1'.format(pG.hartreetoeV(gradMAG)))
@@ -21,8 +21,8 @@ args = vars(parser.parse_args())
 infileI = cclib.parser.ccopen(args["state1"]).parse()
 infileJ = cclib.parser.ccopen(args["state2"]).parse()
 
-gradvecI = pG.gradient(args["state1"])
-gradvecJ = pG.gradient(args["state2"])
+gradvecI = pG.gradient(args["state1"], steps='last')
+gradvecJ = pG.gradient(args["state2"], steps='last')
 
 graddiffvec = gradvecI - gradvecJ
 graddiffMAG = np.linalg.norm(graddiffvec)
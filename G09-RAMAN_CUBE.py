@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+
+'''
+This script calculates non-resonant Raman spectra for every combination of a set of temperatures and laser excitation
+wavelengths, for any number of Gaussian 09 frequency calculations (see lineshapes.Raman_cube)
+
+For each input, the spectra are written as one (temperature x wavelength x wavenumber) array to [log-file-name].Raman_cube.npz,
+together with the axes
+'''
+
+
+import os
+import numpy as np
+import argparse
+import batchFUNCS as bF
+import lineshapes
+
+
+parser = argparse.ArgumentParser(description="This script calculates Raman spectra for several temperatures and laser lines from Gaussian 09 frequency calculations")
+parser.add_argument("files", metavar="file", nargs='+', help="Gaussian 09 frequency calculations including Raman activities")
+parser.add_argument("-T", dest="temperatures", metavar="T", nargs='+', help="temperatures in K. Default: 298.15 K", type=float, required=False, default=[298.15])
+parser.add_argument("-X", dest="excitations", metavar="nm", nargs='+', help="excitation wavelengths in nm. Default: 1064 nm (Nd:YAG)", type=float, required=False, default=[1064.0])
+parser.add_argument("-b", dest="begin", metavar="begin", help="start of plot in cm-1. Default: 0 cm-1", type=float, required=False, default=0.0)
+parser.add_argument("-e", dest="end", metavar="end", help="end of plot in cm-1. Default: 4000 cm-1", type=float, required=False, default=4000.0)
+parser.add_argument("-p", dest="points", metavar="points", help="number of points in spectrum. Default: 10000", type=int, required=False, default=10000)
+parser.add_argument("-f", dest="fwhm", metavar="FWHM", help="the FWHM in cm-1 of the desired broadening functions. Default: 8 cm-1", type=float, required=False, default=8.0)
+parser.add_argument("-L", dest="Lorentzian", help="by default, a Gaussian broadening function is applied, use -L to change this to Lorentzian", required=False, default=False, action='store_true')
+parser.add_argument("-n", dest="workers", metavar="N", help="number of processes used to parse the files. Default: all CPUs", type=int, required=False, default=None)
+args = vars(parser.parse_args())
+
+if args["Lorentzian"]:
+    shape = 'Lorentzian'
+else:
+    shape = 'Gaussian'
+
+x = np.linspace(args["begin"], args["end"], args["points"])
+temperatures = np.array(args["temperatures"])
+excitations = np.array(args["excitations"])
+
+parsed, errors = bF.batch_parse(args["files"], bF.vibration_data, workers=args["workers"])
+bF.report_errors(errors)
+
+for file, data in zip(args["files"], parsed):
+    if data is None:
+        continue
+    if not hasattr(data, 'vibramans'):
+        print('Warning, no Raman activities in {}'.format(file))
+        continue
+    cube = lineshapes.Raman_cube(x, data.vibfreqs, data.vibramans, args["fwhm"], excitations, temperatures, shape)
+    # Same naming as G09-EXTRACT_hpmodes.py: the file without its extension, next to it
+    basename = os.path.splitext(file)[0]
+    np.savez('{}.Raman_cube.npz'.format(basename), cube=cube, temperatures=temperatures, excitations=excitations, wavenumbers=x)
+    print('{}: {} temperatures x {} excitation wavelengths written to {}.Raman_cube.npz'.format(file, len(temperatures), len(excitations), basename))
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+
+'''
+This script calculates resonance Raman spectra within the short time approximation for a scan of excitation
+wavelengths, from Gaussian 09 calculations (see resonanceraman.STA_map)
+
+It needs a freq=hpmodes calculation for the normal modes, a TD calculation for the excitation energies and oscillator
+strengths, and one excited state gradient calculation per state, given in the order of the states.
+
+The map (excitation wavelength x Raman shift), the stick intensities and the axes are written to a single .npz file
+'''
+
+
+import argparse
+import numpy as np
+import cclib
+import parseFUNCS as pF
+import parseGAUSSIAN as pG
+import resonanceraman as RR
+
+
+parser = argparse.ArgumentParser(description="This script calculates short time approximation resonance Raman spectra for a scan of excitation wavelengths")
+parser.add_argument("-i", dest="freq", metavar="file", help="Gaussian 09 frequency calculation, including the keyword freq=hpmodes", required=True)
+parser.add_argument("-t", dest="excited", metavar="file", help="Gaussian 09 TD calculation with the excitation energies and oscillator strengths", required=True)
+parser.add_argument("-g", dest="gradients", metavar="file", nargs='+', help="Gaussian 09 excited state gradient calculations, one per state starting from the first", required=True)
+parser.add_argument("-x", dest="begin", metavar="begin", help="shortest excitation wavelength in nm. Default: 200 nm", type=float, required=False, default=200.0)
+parser.add_argument("-y", dest="end", metavar="end", help="longest excitation wavelength in nm. Default: 600 nm", type=float, required=False, default=600.0)
+parser.add_argument("-n", dest="lasers", metavar="number", help="number of excitation wavelengths. Default: 200", type=int, required=False, default=200)
+parser.add_argument("-d", dest="damping", metavar="damping", help="homogeneous linewidth of the excited states in cm-1. Default: 1000 cm-1", type=float, required=False, default=1000.0)
+parser.add_argument("-f", dest="fwhm", metavar="FWHM", help="the FWHM in cm-1 of the Raman bands. Default: 10 cm-1", type=float, required=False, default=10.0)
+parser.add_argument("-L", dest="Lorentzian", help="by default, the Raman bands are Gaussian, use -L to change this to Lorentzian", required=False, default=False, action='store_true')
+parser.add_argument("-b", dest="shiftbegin", metavar="begin", help="lowest Raman shift in cm-1. Default: 0 cm-1", type=float, required=False, default=0.0)
+parser.add_argument("-e", dest="shiftend", metavar="end", help="highest Raman shift in cm-1. Default: 4000 cm-1", type=float, required=False, default=4000.0)
+parser.add_argument("-p", dest="points", metavar="points", help="number of Raman shift points. Default: 4000", type=int, required=False, default=4000)
+parser.add_argument("-o", dest="output", metavar="output", help="name of the output file. Default: RR_STA_map.npz", required=False, default='RR_STA_map.npz')
+args = vars(parser.parse_args())
+
+if args["Lorentzian"]:
+    shape = 'Lorentzian'
+else:
+    shape = 'Gaussian'
+
+HPMODES = pG.hpmodes(args["freq"])
+excited = cclib.io.ccread(args["excited"])
+nstates = len(args["gradients"])
+if nstates > len(excited.etenergies):
+    raise ValueError('{} gradients given but only {} excited states in {}'.format(nstates, len(excited.etenergies), args["excited"]))
+gradients = np.stack([pG.gradient(gradfile, steps='last') for gradfile in args["gradients"]])
+
+shifts = np.linspace(args["shiftbegin"], args["shiftend"], args["points"])
+wavelengths = np.linspace(args["begin"], args["end"], args["lasers"])
+intensity_map, sticks = RR.STA_map(shifts, wavelengths, pF.cmtohartree(excited.etenergies[:nstates]), excited.etoscs[:nstates],
+                                   gradients, HPMODES['vibdisps'], HPMODES['vibrmasses'], HPMODES['vibfreqs'],
+                                   pF.cmtohartree(args["damping"]), args["fwhm"], shape)
+
+np.savez(args["output"], map=intensity_map, sticks=sticks, wavelengths=wavelengths, shifts=shifts, vibfreqs=HPMODES['vibfreqs'])
+print('Resonance Raman map for {} excitation wavelengths and {} modes written to {}'.format(len(wavelengths), len(HPMODES['vibfreqs']), args["output"]))
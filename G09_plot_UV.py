@@ -7,20 +7,7 @@ import matplotlib as mpl
 import matplotlib.pyplot as plt
 import cclib
 import argparse
-
-
-# def UVLorentzian(x, band, strength, FWHM):
-#     # Lorentzian lineshape function with UV prefactor
-#     # This is based on a document by Jens Spanget-Larsen, which may be found at dx.doi.org/10.13140/RG.2.1.4181.6160
-#     HWHM = FWHM / 2
-#     bandshape = (2.175e8) * (strength / FWHM) / (1 + ((x - band) / HWHM)**2)
-#     return bandshape
-
-
-def UVGaussian(x, band, strength, FWHM):
-    # Gaussian lineshape function with UV prefactor
-    bandshape = (2.175e8) * (strength / FWHM) * np.exp(-2.772 * ((x - band) / FWHM)**2)
-    return bandshape
+import lineshapes
 
 
 def tenthousands(x, pos):
@@ -54,13 +41,8 @@ parsed_input.etenergies = parsed_input.etenergies + args["shift"]
 # Basename
 base_fname = args["file"].replace('.log', '')
 
-# Peak fitting: make a np array of the correct dimension first
-composite_G_abs = np.zeros([1, args["points"]])
-for count, peak in enumerate(parsed_input.etenergies):
-    thispeak = UVGaussian(x, peak, parsed_input.etoscs[count], args["fwhm"])
-    composite_G_abs += thispeak
-# Have to transpose
-composite_G_abs = np.transpose(composite_G_abs)
+# Broaden all the peaks at once, each over the whole axis (no truncated tails), as a column
+composite_G_abs = lineshapes.broaden(x, parsed_input.etenergies, parsed_input.etoscs, args["fwhm"], 'Gaussian', 'UV', method='direct')[:, np.newaxis]
 
 if args["data"] is True:
     # Include shift in header if necessary
@@ -7,63 +7,7 @@ import matplotlib as mpl
 import matplotlib.pyplot as plt
 import cclib
 import argparse
-
-
-_daltontokg = 1.660539040e-27
-_kBoltzmann = 1.38064852e-23
-_hPlanck = 6.62607004e-34
-_cSpeedOfLight = 299792458
-
-
-def _Lorentzian(x, band, FWHM):
-    HWHM = FWHM / 2
-    probability = 1 / (1 + ((x - band) / HWHM)**2)
-    return probability
-
-
-def _Gaussian(x, band, FWHM):
-    probability = np.exp(-2.772 * ((x - band) / FWHM)**2)
-    return probability
-
-
-def _IRprefac(strength, FWHM):
-    # This is based on a document by Jens Spanget-Larsen, which may be found at dx.doi.org/10.13140/RG.2.1.4181.6160
-    HWHM = FWHM / 2
-    prefac = ((100 / np.log(10) / np.pi * strength) / HWHM)
-    return prefac
-
-
-def _Ramanprefac(band, activity, excitation, temperature):
-    # This is based on eqn. 1 of V. Krishnakumar et al., J. Mol. Struct. 2004, 702, 9
-    # dx.doi.org/10.1016/j.molstruc.2004.06.004
-    prefac_num = (100 * (1e7 / excitation - band))**4 * (1e-40 * activity / _daltontokg)
-    prefac_denom = (100 * band) * (1 - np.exp(-(_hPlanck * _cSpeedOfLight * 100 * band) / (_kBoltzmann * temperature)))
-    prefac = prefac_num / prefac_denom
-    return prefac
-
-
-def IRLorentzian(x, band, strength, FWHM):
-    # Lorentzian lineshape function with IR prefactor
-    epsilon = _IRprefac(strength, FWHM) * _Lorentzian(x, band, FWHM)
-    return epsilon
-
-
-def IRGaussian(x, band, strength, FWHM):
-    # Gaussian lineshape function with IR prefactor
-    epsilon = _IRprefac(strength, FWHM) * _Gaussian(x, band, FWHM)
-    return epsilon
-
-
-def RamanLorentzian(x, band, activity, excitation, temperature, FWHM):
-    # Lorentzian lineshape function with Raman prefactor
-    intensity = _Ramanprefac(band, activity, excitation, temperature) * _Lorentzian(x, band, FWHM)
-    return intensity
-
-
-def RamanGaussian(x, band, activity, excitation, temperature, FWHM):
-    # Gaussian lineshape function with Raman prefactor
-    intensity = _Ramanprefac(band, activity, excitation, temperature) * _Gaussian(x, band, FWHM)
-    return intensity
+import lineshapes
 
 
 def tenthousands(x, pos):
@@ -81,8 +25,9 @@ parser.add_argument("-s", dest="save", metavar="save", help="file in which plot
 parser.add_argument("-d", dest="data", help="should the sticks and plot data be saved? (optional)", required=False, default=None, action='store_true')
 parser.add_argument("-q", dest="quiet", help="by default a matplotlib window will appear, use -q to prevent this", required=False, default=None, action='store_true')
 parser.add_argument("-L", dest="Lorentzian", help="by default, a Gaussian broadening function is applied, use -L to change this to Lorentzian", required=False, default=False, action='store_true')
+parser.add_argument("-V", dest="Voigt", metavar="Lorentzian_FWHM", help="use a Voigt broadening function, with a Gaussian part of FWHM from -f and a Lorentzian part of this FWHM in cm-1", type=float, required=False, default=None)
 parser.add_argument("-R", dest="Raman", help="by default, the IR spectrum is plotted, use -R to change this to non-resonant Raman", required=False, default=False, action='store_true')
-parser.add_argument("-T", dest="temperature", help="T used in Raman intensity calculations. Default: 298.15 K", required=False, default=298.15)
+parser.add_argument("-T", dest="temperature", help="T used in Raman intensity calculations. Default: 298.15 K", required=False, default=298.15, type=float)
 parser.add_argument("-X", dest="excitation", help="Excitation wavelength (in nm) used in non-resonant Raman. Default: 1064 nm (Nd:YAG)", required=False, default=1064.0, type=float)
 parser.add_argument("-n", dest="normalize", help="Set this to normalize the y-axis to 1", required=False, default=False, action='store_true')
 parser.add_argument("-a", "--no-latex", dest="allergy", help="disable plotting with LaTeX", required=False, default=None, action='store_true')
@@ -106,12 +51,7 @@ if args["Raman"]:
         signal_name = 'Normalized Raman intensity / arb. units'
     else:
         signal_name = 'Raman intensity / m kg^-1'
-    if args["Lorentzian"]:
-        broadening_function = RamanLorentzian
-        broadening_function_name = 'Lorentzian'
-    else:
-        broadening_function = RamanGaussian
-        broadening_function_name = 'Gaussian'
+    spectrum_kind = 'Raman'
 else:
     spectrum_type = 'Infrared absorption'
     intensities = parsed_input.vibirs
@@ -120,23 +60,18 @@ else:
         signal_name = 'Normalized molar absorption coefficient (epsilon) / arb. units'
     else:
         signal_name = 'Molar absorption coefficient (epsilon) / L mol^-1 cm^-1'
-    if args["Lorentzian"]:
-        broadening_function = IRLorentzian
-        broadening_function_name = 'Lorentzian'
-    else:
-        broadening_function = IRGaussian
-        broadening_function_name = 'Gaussian'
+    spectrum_kind = 'IR'
+if args["Voigt"] is not None:
+    broadening_function_name = 'Voigt'
+elif args["Lorentzian"]:
+    broadening_function_name = 'Lorentzian'
+else:
+    broadening_function_name = 'Gaussian'
 
-# Peak fitting: make a np array of the correct dimension first
-composite_spectrum = np.zeros([1, args["points"]])
-for count, peak in enumerate(parsed_input.vibfreqs):
-    if args["Raman"]:
-        thispeak = broadening_function(x, peak, intensities[count], args["excitation"], args["temperature"], args["fwhm"])
-    else:
-        thispeak = broadening_function(x, peak, intensities[count], args["fwhm"])
-    composite_spectrum += thispeak
-# Have to transpose
-composite_spectrum = np.transpose(composite_spectrum)
+# Broaden all the peaks at once, each over the whole axis (no truncated tails)
+composite_spectrum = lineshapes.broaden(x, parsed_input.vibfreqs, intensities, args["fwhm"], broadening_function_name, spectrum_kind, args["excitation"], args["temperature"], shape_parameter=args["Voigt"], method='direct')
+# Have to make a column
+composite_spectrum = composite_spectrum[:, np.newaxis]
 
 # Normalize if necessary
 if args["normalize"]:
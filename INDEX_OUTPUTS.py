@@ -0,0 +1,23 @@
+#!/usr/bin/python3
+
+'''
+This script writes sidecar section indices (see parseINDEX) for output files, so later parsing can seek straight to the sections it needs
+'''
+
+
+import argparse
+import parseINDEX as pI
+
+
+parser = argparse.ArgumentParser(description="This script indexes the sections of G09, Q-Chem, Turbomole and ORCA output files")
+parser.add_argument("files", metavar="file", nargs='+', help="output files to index")
+parser.add_argument("-v", dest="verbose", help="print the number of each section found", required=False, default=False, action='store_true')
+args = vars(parser.parse_args())
+
+for thisfile in args["files"]:
+    sections = pI.build(thisfile)
+    print('Indexed {}'.format(thisfile))
+    if args["verbose"]:
+        for header, entries in sections.items():
+            if entries:
+                print('    {}: {}'.format(header, len(entries)))
@@ -1,47 +1,68 @@
 #!/usr/bin/python3
 
+'''
+This script projects the couplings between every pair of states onto the vibrational normal modes
+(see projectFUNCS), scaling the projections by frequency and normalising them as SCALE_PROJ.m
+
+The couplings are read from a Qchem output, or from [name].[MI]-to-[MJ].[type].mat files as written by
+Qchem44-CONVERT_DCwithETF-to-NACV.py. The normal modes are read from a Gaussian 09 freq=hpmodes calculation, or from
+the files written by G09-EXTRACT_hpmodes.py, which are memory-mapped.
+
+All of the projections are written to [output].projections.npz
+'''
+
+
+import os
+import argparse
 import numpy as np
-from numpy import linalg as LA
-
-
-NACVs = {}
-NACVs['T1toT2'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T1-to-T2.NACV.mat')
-NACVs['T1toT3'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T1-to-T3.NACV.mat')
-NACVs['T1toT4'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T1-to-T4.NACV.mat')
-NACVs['T1toT5'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T1-to-T5.NACV.mat')
-NACVs['T1toT6'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T1-to-T6.NACV.mat')
-NACVs['T2toT3'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T2-to-T3.NACV.mat')
-NACVs['T2toT4'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T2-to-T4.NACV.mat')
-NACVs['T2toT5'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T2-to-T5.NACV.mat')
-NACVs['T2toT6'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T2-to-T6.NACV.mat')
-NACVs['T3toT4'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T3-to-T4.NACV.mat')
-NACVs['T3toT5'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T3-to-T5.NACV.mat')
-NACVs['T3toT6'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T3-to-T6.NACV.mat')
-NACVs['T4toT5'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T4-to-T5.NACV.mat')
-NACVs['T4toT6'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T4-to-T6.NACV.mat')
-NACVs['T5toT6'] = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.T5-to-T6.NACV.mat')
-
-nNACVs = {}
-for key in NACVs.keys():
-    nNACVs[key] = np.divide(NACVs[key], LA.norm(NACVs[key], 'fro'))
-
-natoms = len(NACVs['T1toT2'])
-
-freqlist = np.genfromtxt('B3LYP_CRENBL-Pt-6311Gdp-HCNOPS_CPCM_S0_NAPme_CC_Pt2PBu3_CC_Ph_CH2_PTZ_freq-hpmodes.freqlist')
-
-freqvecs = {}
-print("Reading modes")
-for i in range(len(freqlist)):
-    thismode = np.int(freqlist[i][0])
-    freqvecs[thismode] = np.genfromtxt('B3LYP_CRENBL-Pt-6-311Gdp-HCNOPS_CPCM_S0_NAPme_CC_Pt2PBu3_CC_Ph_CH2_PTZ_freq-hpmodes.m{}.dat'.format(thismode))
-print("Modes read")
-
-for pairs in NACVs.keys():
-    similarities = {}
-    for mode in freqvecs.keys():
-        sim = 0
-        for atom in range(natoms):
-            sim += np.abs(np.dot(nNACVs[pairs][atom, :], freqvecs[mode][atom, :]))
-        similarities[mode] = sim
-    combined = np.column_stack((freqlist, np.array(list(similarities.values()))))
-    np.savetxt('B3LYP_CRENBL-Pt-6311Gdp_CPCM_TDA6_T_S0_MeNAP-CC-PtPBu3-CC-Ph-CH2-PTZ_NACME-6_c10+t14_175-974.{}.NACV.scaled.dist'.format(pairs), combined, delimiter='\t')
+import parseQCHEM as pQ
+import parseGAUSSIAN as pG
+import projectFUNCS as pP
+
+
+parser = argparse.ArgumentParser(description="This script projects coupling vectors onto vibrational normal modes")
+parser.add_argument("-i", dest="file", metavar="input", help="the Qchem output with the couplings", required=False, default=None)
+parser.add_argument("-t", dest="type", metavar="type", help="which of the couplings in the Qchem output to project: DCnoETF, NACV, DCwithETF or NACVwithETF. Default: NACVwithETF", required=False, default='NACVwithETF', choices=['DCnoETF', 'NACV', 'DCwithETF', 'NACVwithETF'])
+parser.add_argument("-c", dest="vectors", metavar="file", nargs='+', help="coupling vectors in text files, instead of -i", required=False, default=None)
+parser.add_argument("-m", dest="modes", metavar="modes", help="Gaussian 09 freq=hpmodes calculation, or the [name] of the [name].hpmodes.npz written by G09-EXTRACT_hpmodes.py", required=True)
+parser.add_argument("-k", dest="kind", metavar="kind", help="signed, absolute, squared, sqrt or atomwise projections, see projectFUNCS.project. atomwise, the sum of the magnitudes of the projections of each atom, is what the original script calculated. Default: atomwise", required=False, default='atomwise', choices=['signed', 'absolute', 'squared', 'sqrt', 'atomwise'])
+parser.add_argument("-o", dest="output", metavar="output", help="basename of the output. Default: the basename of the couplings", required=False, default=None)
+parser.add_argument("-l", dest="legacy", help="also write one [output].[pair].[type].scaled.dist text file per pair as SCALE_PROJ.m: frequency, scaled, normalised", required=False, default=False, action='store_true')
+args = vars(parser.parse_args())
+
+if (args["file"] is None) == (args["vectors"] is None):
+    print("Either -i or -c must be given")
+    exit()
+
+# Couplings
+if args["file"] is not None:
+    couplings = pQ.couplings(args["file"])
+    vectors = couplings[args["type"]]
+    labels = ['{0}{1}-to-{0}{2}'.format(couplings['calc_mult'], J, K) for J, K in couplings['pairs']]
+    basename = os.path.splitext(args["file"])[0]
+    kind = args["type"]
+else:
+    vectors = np.stack([np.loadtxt(vector) for vector in args["vectors"]])
+    labels = [os.path.basename(vector).split('.')[-3] for vector in args["vectors"]]
+    # [name].[pair].[type].mat
+    stem, kind = os.path.splitext(os.path.splitext(args["vectors"][0])[0])
+    basename = os.path.splitext(stem)[0]
+    kind = kind[1:]
+if args["output"] is not None:
+    basename = args["output"]
+
+# Modes
+if os.path.exists('{}.hpmodes.npz'.format(args["modes"])):
+    HPMODES = pG.load_hpmodes(args["modes"])
+else:
+    HPMODES = pG.hpmodes(args["modes"])
+
+TABLE = pP.projection_table(vectors, HPMODES['vibdisps'], HPMODES['vibfreqs'], args["kind"])
+np.savez('{}.projections.npz'.format(basename), pairs=np.array(labels), vibfreqs=HPMODES['vibfreqs'], **TABLE)
+print('Projected {} couplings onto {} modes, written to {}.projections.npz'.format(len(labels), len(HPMODES['vibfreqs']), basename))
+
+if args["legacy"]:
+    # Same columns and format as SCALE_PROJ.m
+    for pair, label in enumerate(labels):
+        combined = np.column_stack((HPMODES['vibfreqs'], TABLE['scaled'][pair], TABLE['normalised'][pair]))
+        np.savetxt('{}.{}.{}.scaled.dist'.format(basename, label, kind), combined, fmt='% 1.7e', delimiter='\t')
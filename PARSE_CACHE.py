@@ -0,0 +1,29 @@
+#!/usr/bin/python3
+
+'''
+This script manages the on-disk cache used by the parsers in pyfuncs (see parseCACHE)
+'''
+
+
+import argparse
+import parseCACHE as pC
+
+
+parser = argparse.ArgumentParser(description="This script reports on or invalidates the pyfuncs parse cache")
+parser.add_argument("-d", dest="directory", metavar="directory", help="cache directory. Default: $CHEMSCRIPTS_CACHE", required=False, default=None)
+parser.add_argument("-c", dest="clear", help="remove every entry from the cache", required=False, default=False, action='store_true')
+parser.add_argument("-i", dest="files", metavar="file", nargs='+', help="remove the entries for these output files only", required=False, default=None)
+args = vars(parser.parse_args())
+
+if args["directory"] is not None:
+    pC.enable(args["directory"])
+
+if args["clear"] or args["files"] is not None:
+    removed = pC.clear(args["files"])
+    print('Removed {} cache entries'.format(removed))
+
+directory, entries, size = pC.info()
+if directory is None:
+    print('The cache is switched off, set CHEMSCRIPTS_CACHE or use -d')
+else:
+    print('{}: {} entries, {:0.1f} MB'.format(directory, entries, size / 1024 / 1024))
@@ -2,8 +2,9 @@
 
 import numpy as np
 import re
-import cclib
 import os
+import argparse
+import batchFUNCS as bF
 import glob
 import matplotlib as mpl
 import matplotlib.pyplot as plt
@@ -20,14 +21,19 @@ def getstaten(n, excitations):
 angstrtobohr = 1.88973
 cmtoeV = 1 / 8000
 
-# Create a list of the files ending with .out in the working directory
-list = glob.glob("{}/*.log".format(os.getcwd()))
+parser = argparse.ArgumentParser(description="This script plots potential energy curves from the *.log files in the working directory")
+parser.add_argument("-n", dest="workers", metavar="N", help="number of processes used to parse the files. Default: all CPUs", type=int, required=False, default=None)
+args = vars(parser.parse_args())
 
-# Create an array containing ccread objects of the files found
-files = []
-for i in range(0, len(list)):
-    incoming = cclib.parser.ccopen(i)
-    files.append(incoming.parse())
+# Create a list of the files ending with .log in the working directory
+list = sorted(glob.glob("{}/*.log".format(os.getcwd())))
+
+# Parse the files in parallel, keeping only the energies and final geometries
+files, errors = bF.batch_parse(list, bF.pec_data, workers=args["workers"])
+# Report, then drop, any files that could not be parsed
+bF.report_errors(errors)
+list = [thisfile for thisfile, parsed in zip(list, files) if parsed is not None]
+files = [parsed for parsed in files if parsed is not None]
 
 # Prepare the dictionary which will contain ccread objects with keys of Q
 pointsdict = {}
@@ -1,15 +1,9 @@
 #!/bin/bash
 
-EXSTATES=20
 PADDING=8
 
-SOCARRAY=($(awk '{ print $4 }' soc_out.dat))
+# Number of excited states, from the number of triplet energies in ene_out.dat
+EXSTATES=$(awk 'NR == 2 { print NF - 1 }' ene_out.dat)
 
-for SINGLET in $(seq 0 $EXSTATES); do
-	SINDEX=$( echo "$SINGLET*$EXSTATES" | bc )
-	for TRIPLET in $(seq 1 $EXSTATES); do
-		TINDEX=$( echo "$SINDEX+$TRIPLET-1" | bc )
-		printf "%${PADDING}.5f\t" "${SOCARRAY[$TINDEX]}"
-	done
-	printf "\n"
-done
+# soc_out.dat lists the SOC of S0, S1, ... with T1 to TEXSTATES in turn, print one singlet per row
+awk -v exstates="$EXSTATES" -v format="%${PADDING}.5f\t" '{ printf format, $4 } NR % exstates == 0 { printf "\n" }' soc_out.dat
@@ -4,47 +4,54 @@
 This script takes the output from a pysoc calculation and
 calculates the mixing parameter between states from
 2nd order perturbation theory
+
+Any number of calculations (e.g. one per geometry, each in its own directory) may be given,
+the mixing parameters of all of them can be written to a single .npy file as an (ngeom, nS, nT) array
 '''
 
 import numpy as np
 import argparse
-import parseFUNCS as pF
+import parsePYSOC as pS
 
 
-def lambda_print(S, T):
-    mixing = lambdas[S, T]
+def lambda_line(S, T, mixing):
     if mixing > 0.1:
-        print('S{}-T{}:\t{:.6e}\tWarning, lambda is large, perturbation theory is probably invalid here!'.format(S + 1, T + 1, mixing))
-    else:
-        print('S{}-T{}:\t{:.6e}'.format(S + 1, T + 1, mixing))
+        return 'S{}-T{}:\t{:.6e}\tWarning, lambda is large, perturbation theory is probably invalid here!'.format(S, T, mixing)
+    return 'S{}-T{}:\t{:.6e}'.format(S, T, mixing)
 
 
 parser = argparse.ArgumentParser(description="This script calculates mixing parameters")
 specify = parser.add_mutually_exclusive_group()
 specify.add_argument("-s", dest="state", metavar="N", help="Only print the Nth state", required=False, type=int)
 specify.add_argument("-r", dest="range", metavar="N", help="Print up to the Nth state", required=False, type=int)
+parser.add_argument("-t", dest="threshold", metavar="lambda", help="Only print mixing parameters larger than this", required=False, type=float, default=None)
+parser.add_argument("-d", dest="directories", metavar="dir", nargs='+', help="directories containing the pysoc outputs. Default: the working directory", required=False, default=['.'])
+parser.add_argument("-o", dest="output", metavar="output", help="write all of the mixing parameters to this .npy file", required=False, default=None)
+parser.add_argument("-q", dest="quiet", help="do not print the mixing parameters", required=False, default=False, action='store_true')
 args = vars(parser.parse_args())
 
 
-ene_out = np.genfromtxt('./ene_out.dat')[:, 1:]
-soc_out = pF.cmtoeV(np.genfromtxt('./soc_out.dat', usecols=3))
-n_states = ene_out.shape[-1]
-lambdas = np.zeros([n_states, n_states])
-for S in range(n_states):
-    for T in range(n_states):
-        deltaE_ST = np.abs(ene_out[0, S] - ene_out[1, T])
-        soc_ST = soc_out[n_states * (S + 1) + T]
-        lambdas[S, T] = (soc_ST / deltaE_ST)**2  # 2nd order perturbation theory
-
-
-if args["state"]:
-    for T in range(n_states):
-        lambda_print(args["state"] - 1, T)
-elif args["range"]:
-    for S in range(args["range"]):
-        for T in range(n_states):
-            lambda_print(S, T)
-else:
-    for S in range(n_states):
-        for T in range(n_states):
-            lambda_print(S, T)
+lambdas = pS.stack_lambdas(args["directories"])
+
+if args["output"] is not None:
+    np.save(args["output"], lambdas)
+
+if not args["quiet"]:
+    # Select the singlets to print
+    selected = lambdas
+    first = 0
+    if args["state"]:
+        first = args["state"] - 1
+        selected = lambdas[:, first:args["state"]]
+    elif args["range"]:
+        selected = lambdas[:, :args["range"]]
+    threshold = -np.inf if args["threshold"] is None else args["threshold"]
+    indices, values = pS.significant(selected, threshold)
+    lines = []
+    for (geom, S, T), mixing in zip(indices, values):
+        line = lambda_line(S + first, T, mixing)
+        if len(args["directories"]) > 1:
+            line = '{}\t{}'.format(args["directories"][geom], line)
+        lines.append(line)
+    if lines:
+        print('\n'.join(lines))
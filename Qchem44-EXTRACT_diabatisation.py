@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+
+'''
+This script extracts the results of Qchem CIS/TDA diabatisations (Boys or ER localisations) of many geometries at once,
+reading each output once (see parseQCHEM.diabatisation) in a pool of worker processes, replacing
+Qchem44-EXTRACT_Loewdin.sh, Qchem44-EXTRACT_diabat.sh, Qchem44-EXTRACT_adiabat.sh and Qchem44-EXTRACT_scf.sh
+
+For each [name] in the list, [name].out is parsed and the legacy [name].rotmat, .adiabmat, .diabmat, .adiabex, .scf,
+.dipoles and .diadipoles files are written (files that already exist are left alone unless -f), and/or everything is
+appended to a scan store (see scanSTORE)
+'''
+
+import os
+import argparse
+import numpy as np
+import parseQCHEM as pQ
+import batchFUNCS as bF
+import scanSTORE as sS
+
+
+# Legacy files -> quantity of parseQCHEM.diabatisation
+_legacy_quantities = {'rotmat': 'rotation', 'adiabmat': 'adiabatic_H', 'diabmat': 'diabatic_H', 'adiabex': 'excitations', 'scf': 'scf'}
+
+
+def legacy_dipoles(dipoles, nstates):
+    # As the awk loop of the shell scripts, state by state, each time the multipoles were printed
+    return dipoles[:, :nstates].T.ravel()
+
+
+parser = argparse.ArgumentParser(description="This script extracts Qchem diabatisations in parallel")
+parser.add_argument("files", metavar="file", nargs='*', help="the Qchem outputs, instead of -l")
+parser.add_argument("-l", dest="list", metavar="list", help="file listing the calculations, any extension is replaced by .out. Default: diabats.lst", required=False, default='diabats.lst')
+parser.add_argument("-s", dest="store", metavar="store", help="append everything to this scan store, e.g. scan.npz or scan.h5. The calculations must be named BLABLA_123_05l", required=False, default=None)
+parser.add_argument("-n", dest="legacy", help="do not write the legacy text files", required=False, default=True, action='store_false')
+parser.add_argument("-f", dest="force", help="overwrite legacy text files that already exist", required=False, default=False, action='store_true')
+parser.add_argument("-w", dest="workers", metavar="workers", help="number of worker processes. Default: the number of CPUs", required=False, type=int, default=None)
+args = vars(parser.parse_args())
+
+files = args["files"]
+if not files:
+    with open(args["list"]) as listing:
+        files = listing.read().split()
+# The legacy files are named after the output, without its directory or extension, in the current directory
+stems = [os.path.splitext(file)[0] for file in files]
+names = [os.path.basename(stem) for stem in stems]
+outputs = ['{}.out'.format(stem) for stem in stems]
+
+results, errors = bF.batch_parse(outputs, pQ.diabatisation, args["workers"])
+bF.report_errors(errors)
+parsed = [(name, DIABAT) for name, DIABAT in zip(names, results) if DIABAT is not None]
+
+if args["legacy"]:
+    for name, DIABAT in parsed:
+        LEGACY = {extension: DIABAT[quantity] for extension, quantity in _legacy_quantities.items()}
+        LEGACY['dipoles'] = legacy_dipoles(DIABAT['dipoles'], DIABAT['nroots'])
+        LEGACY['diadipoles'] = legacy_dipoles(DIABAT['dipoles'], DIABAT['nstates'])
+        for extension, value in LEGACY.items():
+            if os.path.exists('{}.{}'.format(name, extension)) and not args["force"]:
+                print('{}.{} already extracted from {}.out'.format(name, extension, name))
+                continue
+            sS.write_legacy(name, extension, value)
+
+if args["store"] is not None and parsed:
+    STORE = {}
+    for extension, quantity in list(_legacy_quantities.items()) + [('dipoles', 'dipoles')]:
+        values = [DIABAT[quantity] for name, DIABAT in parsed]
+        if len(set(np.shape(value) for value in values)) != 1:
+            print('Warning, {} differs in shape between the calculations and is not stored'.format(extension))
+            continue
+        STORE[extension] = np.stack(values)
+    sS.ScanStore(args["store"]).append([name for name, DIABAT in parsed], **STORE)
+    print('Appended {} calculations to {}'.format(len(parsed), args["store"]))
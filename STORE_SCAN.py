@@ -0,0 +1,39 @@
+#!/usr/bin/python3
+
+'''
+This script converts the legacy text files of a scan ([name].diabmat, [name].rotmat, ...) into a single scan store
+(see scanSTORE), lists what is in a store, or exports quantities from a store back to the legacy text files
+
+The store is HDF5 if its name ends in .h5 or .hdf5 (requires h5py), otherwise an .npz
+'''
+
+import argparse
+import scanSTORE as sS
+
+
+parser = argparse.ArgumentParser(description="This script builds, lists and exports scan stores")
+parser.add_argument("store", metavar="store", help="the scan store, e.g. scan.npz or scan.h5")
+parser.add_argument("-a", dest="add", metavar="quantity", nargs='+', help="add these quantities from the legacy text files of the points in -l, e.g. diabmat rotmat adiabex", required=False, default=None)
+parser.add_argument("-l", dest="list", metavar="list", help="file listing the points, only the part of each line before the first . is used. Default: diabats.lst", required=False, default='diabats.lst')
+parser.add_argument("-x", dest="export", metavar="quantity", nargs='+', help="export these quantities to legacy text files", required=False, default=None)
+parser.add_argument("-d", dest="directory", metavar="directory", help="directory for the exported files. Default: the working directory", required=False, default='.')
+args = vars(parser.parse_args())
+
+store = sS.ScanStore(args["store"])
+
+if args["add"] is not None:
+    with open(args["list"]) as listing:
+        names = [name.split('.')[0] for name in listing.read().split()]
+    sS.from_legacy(store, names, args["add"])
+    print('Added {} for {} points to {}'.format(', '.join(args["add"]), len(names), args["store"]))
+
+if args["export"] is not None:
+    for quantity in args["export"]:
+        written = store.export(quantity, args["directory"])
+        print('Exported {} {} files'.format(len(written), quantity))
+
+POINTS = store.points()
+print('{}: {} points of {} modes'.format(args["store"], len(POINTS['name']), len(set(POINTS['mode']))))
+for quantity in store.quantities():
+    indices, values = store.get(quantity)
+    print('{}\t{} points, shaped {}'.format(quantity, len(indices), values.shape[1:]))
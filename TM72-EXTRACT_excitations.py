@@ -8,16 +8,17 @@ These are intended to emulate the types of array you get from cclib
 import argparse
 import numpy as np
 import re
+import parseFUNCS as pF
 
 
 parser = argparse.ArgumentParser()
 parser.add_argument("escffile", help="name of escf output file")
 args = parser.parse_args()
 
-excitations = np.loadtxt(re.findall('(?<=Excitation energy \/ cm\^\(-1\)\:).*', open(args.escffile).read()))
-velrep = np.loadtxt(re.findall('(?<=Oscillator strength\:\n\n    velocity representation\:).*', open(args.escffile).read()))
-lenrep = np.loadtxt(re.findall('(?<=length representation\:).*', open('escf.out').read()))[0::2]
-mixedrep = np.loadtxt(re.findall('(?<=mixed representation\:).*', open(args.escffile).read()))
+excitations = np.loadtxt(re.findall('(?<=Excitation energy \/ cm\^\(-1\)\:).*', pF.read_output(args.escffile)))
+velrep = np.loadtxt(re.findall('(?<=Oscillator strength\:\n\n    velocity representation\:).*', pF.read_output(args.escffile)))
+lenrep = np.loadtxt(re.findall('(?<=length representation\:).*', pF.read_output(args.escffile)))[0::2]
+mixedrep = np.loadtxt(re.findall('(?<=mixed representation\:).*', pF.read_output(args.escffile)))
 
 print("{}".format(excitations))
 print("{}".format(velrep))
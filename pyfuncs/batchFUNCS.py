@@ -0,0 +1,253 @@
+import os
+import sys
+import multiprocessing
+import numpy as np
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+import parseFUNCS as pF
+import lineshapes
+
+
+'''
+
+batchFUNCS provides tools for parsing many output files at once in a pool of worker processes
+
+'''
+
+
+def _pool(workers):
+    # Workers are forked where possible, so that scripts without a __main__ guard can use the pool
+    if 'fork' in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def _guarded(function, file):
+    try:
+        return function(file), None
+    except Exception as error:
+        return None, '{}: {}'.format(type(error).__name__, error)
+
+
+def batch_parse(files, function, workers=None, progress=True):
+    '''
+    Apply function to each of files in a pool of worker processes
+
+    function must be importable (i.e. defined at the top level of a module) and should return only the small
+    arrays that are actually needed, as everything it returns is sent back from the workers
+    workers is the number of processes, by default the number of CPUs. With workers=1 no pool is started.
+    progress prints a running count of the files done to stderr
+
+    A file that cannot be parsed does not stop the others
+
+    returns a list of results in the same order as files (None where parsing failed),
+    and a dictionary of error messages keyed on the files that failed
+    '''
+    results = [None] * len(files)
+    errors = {}
+    done = 0
+
+    def collect(index, outcome):
+        result, error = outcome
+        if error is None:
+            results[index] = result
+        else:
+            errors[files[index]] = error
+        if progress:
+            sys.stderr.write('\rParsed {} of {} files'.format(done, len(files)))
+            sys.stderr.flush()
+
+    if workers == 1:
+        for index, file in enumerate(files):
+            done += 1
+            collect(index, _guarded(function, file))
+    else:
+        with _pool(workers) as pool:
+            futures = {pool.submit(_guarded, function, file): index for index, file in enumerate(files)}
+            for future in as_completed(futures):
+                done += 1
+                collect(futures[future], future.result())
+    if progress and files:
+        sys.stderr.write('\n')
+
+    return results, errors
+
+
+def report_errors(errors):
+    '''
+    Print one line per file that could not be parsed
+    '''
+    for file, error in errors.items():
+        print('Warning, could not parse {}: {}'.format(file, error))
+
+
+def pec_data(file):
+    '''
+    Parse a file with cclib and keep only what is needed to plot a potential energy curve
+
+    returns an object with the scfenergies, atomcoords (final geometry only) and,
+    if excited states were calculated, etenergies attributes of the cclib data
+    '''
+    import cclib
+
+    parsed = cclib.io.ccread(file)
+    data = SimpleNamespace(scfenergies=parsed.scfenergies, atomcoords=parsed.atomcoords[-1])
+    if hasattr(parsed, 'etenergies'):
+        data.etenergies = parsed.etenergies
+    return data
+
+
+def vibration_data(file):
+    '''
+    Parse a frequency calculation with cclib and keep only the vibrational frequencies and intensities
+
+    returns an object with the vibfreqs, vibirs and, if Raman activities were calculated, vibramans attributes of the cclib data
+    '''
+    import cclib
+
+    parsed = cclib.io.ccread(file)
+    data = SimpleNamespace(vibfreqs=np.asarray(parsed.vibfreqs), vibirs=np.asarray(parsed.vibirs))
+    if hasattr(parsed, 'vibramans'):
+        data.vibramans = np.asarray(parsed.vibramans)
+    return data
+
+
+def excitation_data(file):
+    '''
+    Parse a Gaussian or Q-Chem excited state calculation with cclib and keep only the excitations
+
+    returns an object with the etenergies (cm-1) and etoscs attributes of the cclib data
+    '''
+    import cclib
+
+    parsed = cclib.io.ccread(file)
+    return SimpleNamespace(etenergies=np.asarray(parsed.etenergies), etoscs=np.asarray(parsed.etoscs))
+
+
+def turbo_excitation_data(file):
+    '''
+    Parse a Turbomole escf calculation and keep only the excitations
+
+    returns an object with etenergies (cm-1) and etoscs (length representation) attributes, as from excitation_data
+    '''
+    import parseTURBO as pT
+
+    escf = pT.escf(file)
+    return SimpleNamespace(etenergies=np.atleast_1d(escf.excitations), etoscs=np.atleast_1d(escf.osclenrep))
+
+
+def _ensemble_chunk(files, counts, grid, FWHM, function, shape):
+    '''
+    Broaden the excitations of a chunk of the ensemble, keeping only running sums
+
+    counts holds the number of times each file is drawn in each bootstrap sample (bootstrap samples x files)
+
+    returns the sum of the spectra, the sum of the bootstrap spectra and weights, the number of files parsed and any errors
+    '''
+    total = np.zeros(grid.size)
+    bootstrap = np.zeros((counts.shape[0], grid.size))
+    weights = np.zeros(counts.shape[0])
+    parsed = 0
+    errors = {}
+    for index, file in enumerate(files):
+        data, error = _guarded(function, file)
+        if error is not None:
+            errors[file] = error
+            continue
+        energies = pF.cmtohartree(np.asarray(data.etenergies, dtype=float))
+        spectrum = lineshapes.broaden(grid, energies, data.etoscs, FWHM, shape, 'crosssection')
+        total += spectrum
+        bootstrap += counts[:, index, np.newaxis] * spectrum
+        weights += counts[:, index]
+        parsed += 1
+    return total, bootstrap, weights, parsed, errors
+
+
+def _bootstrap_counts(rng, nfiles, nbootstrap, chunks):
+    '''
+    Draw the bootstrap resamplings of nfiles files with replacement one chunk of files at a time: the number of draws
+    landing in each chunk is binomial in what is left, then spread over its files, which is the same as one multinomial
+    draw over all of the files but never holds more than one chunk of counts
+
+    yields the counts of each chunk, shaped (nbootstrap, files in the chunk)
+    '''
+    remaining = np.full(nbootstrap, nfiles)
+    left = nfiles
+    for chunk in chunks:
+        size = len(range(nfiles)[chunk])
+        drawn = rng.binomial(remaining, size / left)
+        remaining -= drawn
+        left -= size
+        yield rng.multinomial(drawn, np.full(size, 1 / size))
+
+
+def ensemble_cross_section(files, grid, FWHM, function=excitation_data, shape='Gaussian', nbootstrap=200, seed=None,
+                           workers=None, chunksize=32, progress=True):
+    '''
+    Photoabsorption cross section of a nuclear ensemble (e.g. geometries sampled from a Wigner distribution)
+
+    This is based on equation 87 in Crespo-Otero & Barbatti's Chem. Rev., 2018, 118, 7026 dx.doi/10.1021/acs.chemrev.7b00577
+    The cross section is averaged over the geometries, each contributing the broadened excitations of one output file
+
+    grid and FWHM are in eV. function extracts the excitations of one file, e.g. excitation_data (Gaussian and Q-Chem)
+    or turbo_excitation_data (Turbomole), and must be importable
+    The files are processed in chunks of chunksize by a pool of workers (see batch_parse), which only send back
+    running sums, and no more than two chunks per worker are in flight at once, so the memory used does not grow with
+    the number of files
+    The uncertainty is estimated from nbootstrap resamplings of the geometries with replacement, whose counts are
+    drawn one chunk at a time as the chunks are handed out, so that the workers can accumulate them too
+
+    returns the mean cross section in atomic units (bohr**2), its bootstrap standard error and 95 % interval
+    (lower, upper), and a dictionary of error messages keyed on the files that could not be parsed
+    '''
+    grid = pF.eVtohartree(np.asarray(grid, dtype=float))
+    FWHM = pF.eVtohartree(FWHM)
+    chunks = [slice(start, start + chunksize) for start in range(0, len(files), chunksize)]
+    counts = _bootstrap_counts(np.random.default_rng(seed), len(files), nbootstrap, chunks)
+
+    total = np.zeros(grid.size)
+    bootstrap = np.zeros((nbootstrap, grid.size))
+    weights = np.zeros(nbootstrap)
+    parsed = 0
+    errors = {}
+
+    def collect(outcome):
+        nonlocal total, parsed
+        total += outcome[0]
+        bootstrap[:] += outcome[1]
+        weights[:] += outcome[2]
+        parsed += outcome[3]
+        errors.update(outcome[4])
+        if progress:
+            sys.stderr.write('\rParsed {} of {} files'.format(parsed + len(errors), len(files)))
+            sys.stderr.flush()
+
+    if workers == 1:
+        for chunk, chunk_counts in zip(chunks, counts):
+            collect(_ensemble_chunk(files[chunk], chunk_counts, grid, FWHM, function, shape))
+    else:
+        # Only a few chunks per worker are in flight at once, each dropped as soon as it has been collected
+        window = 2 * (workers or os.cpu_count() or 1)
+        with _pool(workers) as pool:
+            futures = set()
+            for chunk, chunk_counts in zip(chunks, counts):
+                futures.add(pool.submit(_ensemble_chunk, files[chunk], chunk_counts, grid, FWHM, function, shape))
+                if len(futures) < window:
+                    continue
+                done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future.result())
+            for future in as_completed(futures):
+                collect(future.result())
+    if progress and files:
+        sys.stderr.write('\n')
+
+    if parsed == 0:
+        raise ValueError('None of the {} files could be parsed'.format(len(files)))
+    mean = total / parsed
+    # Resamplings that only drew files which failed to parse are left out
+    drawn = weights > 0
+    resampled = bootstrap[drawn] / weights[drawn, np.newaxis]
+    error = resampled.std(axis=0, ddof=1) if drawn.sum() > 1 else np.zeros(grid.size)
+    lower, upper = np.percentile(resampled, [2.5, 97.5], axis=0) if drawn.any() else (mean, mean)
+    return mean, error, lower, upper, errors
@@ -0,0 +1,211 @@
+import os
+import re
+import numpy as np
+import parseFUNCS as pF
+
+
+'''
+
+diabatFUNCS post-processes the diabatic matrices (.diabmat) of a potential energy scan in a single process,
+replacing one Octave session per point of signfix.sh (SIGNFIX-DIABMAT.m) and crosschk.sh (CROSSOVER-CHECK+EREL.m)
+
+The matrices of a scan are stacked into one (npoints, nstate, nstate) array, the sign masking and the eigenvalues are
+applied to the whole stack at once and the crossover check is done for every point at the same step of the scan at once
+
+The points of a scan are named BLABLA_123_05l.extension, 123 being the number of the vibrational mode and 05l the value
+of the dimensionless coordinate Q: l(eft) for negative Q, r(ight) for positive Q and q for Q = 0
+
+'''
+
+_scan_point = re.compile(r'_(\d+)_(\d+)([lrq])$')
+
+
+def scan_point(file):
+    '''
+    Read the mode and the value of Q from the name of a point of a scan, see above
+
+    returns the mode number, the signed value of Q (negative on the left) and the side ('l', 'r' or 'q')
+    '''
+    basename = os.path.basename(file).split('.')[0]
+    match = _scan_point.search(basename)
+    if match is None:
+        raise ValueError('{} is not named as a point of a scan, e.g. BLABLA_123_05l.diabmat'.format(file))
+    mode, step, side = match.groups()
+    Q = int(step) * (-1 if side == 'l' else 1)
+    return int(mode), Q, side
+
+
+def load_stack(files):
+    '''
+    Read the diabatic matrices of a scan
+
+    returns an (npoints, nstate, nstate) array
+    '''
+    stack = np.stack([np.loadtxt(file, ndmin=2) for file in files])
+    return stack
+
+
+def write_diabmat(file, matrix):
+    # Same format as the Octave scripts: tab separated, '% 1.10f'
+    np.savetxt(file, matrix, fmt='% 1.10f', delimiter='\t')
+
+
+def write_adiabex(file, eigenvalues):
+    # Same format as SIGNFIX-DIABMAT.m: one eigenvalue per line, '% 1.12f'
+    np.savetxt(file, eigenvalues, fmt='% 1.12f')
+
+
+def signfix(stack, mask):
+    '''
+    Impose the signs of mask on every matrix of stack, fixing arbitrary sign changes from phase changes in the orbitals
+
+    Elements where the mask is zero are set to zero
+
+    returns the sign-fixed stack and its eigenvalues (the adiabatic energies), calculated for the whole stack at once
+    '''
+    fixed = np.sign(mask) * np.abs(stack)
+    eigenvalues = np.linalg.eigvalsh(fixed)
+    return fixed, eigenvalues
+
+
+def _offdiagonal(stack):
+    '''
+    For each state, the couplings to all of the other states, as in CROSSOVER-CHECK+EREL.m (from the lower triangle)
+
+    returns an array shaped (npoints, nstate, nstate - 1)
+    '''
+    nstate = stack.shape[-1]
+    lower = np.tril(stack) + np.swapaxes(np.tril(stack, -1), -1, -2)
+    others = np.array([[j for j in range(nstate) if j != k] for k in range(nstate)], dtype=int).reshape(nstate, -1)
+    return np.take_along_axis(lower, others[np.newaxis], axis=-1)
+
+
+def crossover(stack, previous, before_previous, erel=0.0):
+    '''
+    Reorder the states of each matrix of stack to follow the states of the previous two steps of the scan, checking for
+    crossings of the diabatic states, as CROSSOVER-CHECK+EREL.m
+
+    For each state k, in order, the state l of the previous step that is most similar is found, the similarity being
+    the squared cosine between their couplings to the other states divided by the fourth power of the difference between
+    the energy of k and that of l linearly extrapolated from the previous two steps. If l is not k they are swapped.
+
+    stack, previous and before_previous are (npoints, nstate, nstate), erel is added to the diagonal of stack first
+    (a single value or one per point)
+
+    returns the reordered stack
+    '''
+    stack = np.array(stack, dtype=float)
+    npoints, nstate = stack.shape[:2]
+    points = np.arange(npoints)
+    stack[:, np.arange(nstate), np.arange(nstate)] += np.broadcast_to(np.asarray(erel, dtype=float), (npoints,))[:, np.newaxis]
+
+    previous_couplings = _offdiagonal(previous)
+    previous_norms = np.linalg.norm(previous_couplings, axis=-1)
+    # El = m x + c through the previous two steps, at the next step
+    extrapolated = 2 * np.diagonal(previous, axis1=-2, axis2=-1) - np.diagonal(before_previous, axis1=-2, axis2=-1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for k in range(nstate):
+            couplings = _offdiagonal(stack)[:, k]
+            cosines = np.einsum('pi,pli->pl', couplings, previous_couplings) / (np.linalg.norm(couplings, axis=-1)[:, np.newaxis] * previous_norms)
+            similarity = np.abs(cosines**2 / (stack[:, k, k][:, np.newaxis] - extrapolated)**4)
+            # As Octave's max, NaNs are ignored and the first state taken if there is nothing else
+            similarity = np.where(np.isnan(similarity), -np.inf, similarity)
+            most_similar = np.argmax(similarity, axis=-1)
+            order = np.tile(np.arange(nstate), (npoints, 1))
+            order[points, k] = most_similar
+            order[points, most_similar] = k
+            stack = stack[points[:, np.newaxis, np.newaxis], order[:, :, np.newaxis], order[:, np.newaxis, :]]
+    return stack
+
+
+def signfix_scan(files, mask_file, prefix=''):
+    '''
+    Sign-fix every matrix of a scan with the signs of mask_file, writing [prefix][name].diabmat and [prefix][name].adiabex
+    as signfix.sh, [name] being the file without its directory or extension (see _point_name)
+
+    returns the sign-fixed stack and its eigenvalues
+    '''
+    basenames = [_point_name(file) for file in files]
+    fixed, eigenvalues = signfix(load_stack(['{}.diabmat'.format(os.path.splitext(file)[0]) for file in files]), np.loadtxt(mask_file, ndmin=2))
+    for basename, matrix, adiabats in zip(basenames, fixed, eigenvalues):
+        write_diabmat('{}{}.diabmat'.format(prefix, basename), matrix)
+        write_adiabex('{}{}.adiabex'.format(prefix, basename), adiabats)
+    return fixed, eigenvalues
+
+
+def _point_name(file):
+    # The name of a point of a scan, the same in every pass: the file without its directory or extension
+    return os.path.splitext(os.path.basename(file))[0]
+
+
+def _step_name(prefix, basename, offset):
+    # As crosschk.sh: the output name of the point |Q| - offset on the same side, 00q once past zero
+    head, step, side = basename.rsplit('_', 1)[0], int(basename.rsplit('_', 1)[1][:-1]), basename[-1]
+    step -= offset
+    if step <= 0:
+        step, side = 0, 'q'
+    return '{}_{}_{:02d}{}.diabmat'.format(prefix, head, step, side)
+
+
+def _scf_energy(file):
+    # As crosschk.sh, the energy on the (last) line containing 'ion met', the output may be compressed
+    energy = None
+    with pF.open_output(file) as incoming:
+        for line in incoming:
+            if 'ion met' in line:
+                energy = float(line.split()[1])
+    if energy is None:
+        raise ValueError('No converged SCF energy found in {}'.format(file))
+    return energy
+
+
+def crossover_scan(files, prefix, scf_energy):
+    '''
+    Check every matrix of a scan for crossings of the diabatic states, as crosschk.sh, writing [prefix]_[name].diabmat
+
+    The points are processed in order of |Q|, all of those at the same |Q| at once, each against the already reordered
+    points one and two steps closer to Q = 0. The energy of the SCF in [name].out relative to scf_energy (in hartree)
+    is added to the diagonal, the points at Q = 0 are copied unchanged. crosschk.sh's awk printed every converged SCF
+    energy of an output, here only the last one is taken (see _scf_energy).
+
+    returns a dictionary of the reordered matrices keyed on the output names
+    '''
+    done = {}
+
+    def step_matrix(name, fallback):
+        if name in done:
+            return done[name]
+        if os.path.exists(name):
+            return np.loadtxt(name, ndmin=2)
+        return fallback
+
+    points = [(abs(scan_point(file)[1]), file) for file in files]
+    for step in sorted(set(step for step, file in points)):
+        batch = [file for point_step, file in points if point_step == step]
+        basenames = [_point_name(file) for file in batch]
+        stack = load_stack(batch)
+        outputs = ['{}_{}.diabmat'.format(prefix, basename) for basename in basenames]
+        if step == 0:
+            for output, matrix, file in zip(outputs, stack, batch):
+                print('{} cannot be checked for a crossover, copying {} to {}'.format(file, file, output))
+                done[output] = matrix
+                write_diabmat(output, matrix)
+            continue
+        previous = []
+        before_previous = []
+        for basename, matrix in zip(basenames, stack):
+            # If step |Q| - 1 does not exist, compare to the point itself, and if |Q| - 2 does not, to |Q| - 1
+            N = step_matrix(_step_name(prefix, basename, 1), None)
+            if N is None:
+                N = O = matrix
+            else:
+                O = step_matrix(_step_name(prefix, basename, 2), N)
+            previous.append(N)
+            before_previous.append(O)
+        erel = [_scf_energy('{}.out'.format(basename)) - scf_energy for basename in basenames]
+        reordered = crossover(stack, np.stack(previous), np.stack(before_previous), erel)
+        for output, matrix in zip(outputs, reordered):
+            done[output] = matrix
+            write_diabmat(output, matrix)
+    return done
@@ -0,0 +1,258 @@
+import numpy as np
+import diabatFUNCS as dF
+
+
+'''
+
+fitFUNCS fits polynomials and Morse potentials along Q to every element of the diabatic state (or rotation) matrices of
+a scan at once, replacing REFIT-DIABATS.m and ROTMAT-FIT.m
+
+The values of Q are read from the names of the files (BLABLA_123_05l.extension is Q = -0.05, see diabatFUNCS), the
+matrices are flattened into the columns of one (npoints, nelements) array so that all of the polynomial fits are one
+least squares problem with many right hand sides, and the Morse fits are Levenberg-Marquardt with analytic Jacobians
+done for all of the elements together
+
+'''
+
+# Q of BLABLA_123_05l is -0.05, as REFIT-DIABATS.m
+_Q_step = 0.01
+
+
+def scan_Q(files, step=_Q_step):
+    '''
+    Read the vibrational mode and the value of Q from the names of the files of a scan
+
+    returns an array of the mode numbers and an array of the values of Q
+    '''
+    points = [dF.scan_point(file) for file in files]
+    modes = np.array([mode for mode, Q, side in points], dtype=int)
+    Q = np.array([Q for mode, Q, side in points], dtype=float) * step
+    return modes, Q
+
+
+def design_matrix(Q, order):
+    '''
+    The design matrix of a polynomial fit, [1, Q, Q**2, ..., Q**order] for each point
+
+    returns an (npoints, order + 1) array
+    '''
+    return np.vander(np.asarray(Q, dtype=float), order + 1, increasing=True)
+
+
+def polynomial_fit(Q, values, order):
+    '''
+    Fit polynomials of Q to every element of values, all with one least squares call
+
+    values are shaped (npoints, ...), e.g. (npoints, nstate, nstate) for a stack of matrices
+
+    returns the coefficients shaped (order + 1, ...), constant first
+    '''
+    values = np.asarray(values, dtype=float)
+    if order >= len(values):
+        raise ValueError('The order of the polynomial ({}) must be lower than the number of points being fit ({})'.format(order, len(values)))
+    coefficients = np.linalg.lstsq(design_matrix(Q, order), values.reshape(len(values), -1), rcond=None)[0]
+    return coefficients.reshape((order + 1,) + values.shape[1:])
+
+
+def polynomial_evaluate(coefficients, Q):
+    '''
+    Evaluate the polynomials of polynomial_fit at Q
+
+    returns an array shaped (len(Q), ...), or (...) for a single Q
+    '''
+    coefficients = np.asarray(coefficients, dtype=float)
+    Q = np.asarray(Q, dtype=float)
+    values = design_matrix(Q.ravel(), len(coefficients) - 1) @ coefficients.reshape(len(coefficients), -1)
+    return values.reshape(Q.shape + coefficients.shape[1:])
+
+
+def cross_validate(Q, values, orders):
+    '''
+    Leave-one-out cross validation of polynomial fits of each order in orders, for every element of values at once
+
+    The leave-one-out residuals come from a single fit with all of the points, r / (1 - h) with h the diagonal of the
+    hat matrix, so no refitting is needed
+
+    returns the root mean square leave-one-out errors shaped (len(orders), ...) and the best order for each element
+    '''
+    values = np.asarray(values, dtype=float)
+    flat = values.reshape(len(values), -1)
+    errors = []
+    for order in orders:
+        if order >= len(values) - 1:
+            raise ValueError('Cross validation of order {} needs more than {} points'.format(order, order + 2))
+        X = design_matrix(Q, order)
+        pseudoinverse = np.linalg.pinv(X)
+        hat = np.einsum('ij,ji->i', X, pseudoinverse)
+        residuals = (flat - X @ (pseudoinverse @ flat)) / (1 - hat)[:, np.newaxis]
+        errors.append(np.sqrt(np.mean(residuals**2, axis=0)))
+    errors = np.array(errors)
+    best = np.asarray(orders)[np.argmin(errors, axis=0)]
+    return errors.reshape((len(orders),) + values.shape[1:]), best.reshape(values.shape[1:])
+
+
+def Morse(Q, parameters):
+    '''
+    Morse potentials V = De * (1 - exp(-a * (Q - Qe)))**2 + V0, for any number of sets of parameters
+
+    parameters are shaped (..., 4): De, a, Qe, V0
+
+    returns an array shaped (..., len(Q))
+    '''
+    parameters = np.asarray(parameters, dtype=float)
+    De, a, Qe, V0 = [parameters[..., i, np.newaxis] for i in range(4)]
+    return De * (1 - np.exp(-a * (np.asarray(Q, dtype=float) - Qe)))**2 + V0
+
+
+def _Morse_jacobian(Q, parameters):
+    # Analytic derivatives of Morse with respect to De, a, Qe and V0, shaped (..., npoints, 4)
+    De, a, Qe, V0 = [parameters[..., i, np.newaxis] for i in range(4)]
+    shifted = Q - Qe
+    exponential = np.exp(-a * shifted)
+    bond = 1 - exponential
+    jacobian = np.stack((bond**2,
+                         2 * De * bond * exponential * shifted,
+                         -2 * De * bond * exponential * a,
+                         np.ones_like(bond)), axis=-1)
+    return jacobian
+
+
+def Morse_guess(Q, values, depth=None):
+    '''
+    Starting parameters for Morse fits from quadratic fits, as REFIT-DIABATS.m: the harmonic force constant k of the
+    quadratic gives a = sqrt(k / 2De), its minimum gives Qe and V0
+
+    values are shaped (npoints, nelements), depth is De for all elements, by default ten times the largest range of
+    values of each element
+
+    returns the parameters shaped (nelements, 4)
+    '''
+    c, b, halfk = polynomial_fit(Q, values, 2)
+    halfk = np.where(halfk == 0, np.finfo(float).eps, halfk)
+    if depth is None:
+        depth = 10 * np.maximum(np.ptp(values, axis=0), np.finfo(float).eps)
+    De = np.sign(halfk) * np.broadcast_to(np.abs(depth), halfk.shape)
+    a = np.sqrt(halfk / De)
+    Qe = -b / (2 * halfk)
+    V0 = c - b**2 / (4 * halfk)
+    return np.stack((De, a, Qe, V0), axis=-1)
+
+
+def Morse_fit(Q, values, guess=None, iterations=1000, tolerance=1e-12):
+    '''
+    Fit Morse potentials of Q to every element of values, with Levenberg-Marquardt for all of the elements at once
+
+    values are shaped (npoints, ...), guess shaped (..., 4) defaults to Morse_guess
+
+    returns the parameters De, a, Qe and V0 shaped (..., 4) and the root mean square errors of the fits shaped (...)
+    '''
+    values = np.asarray(values, dtype=float)
+    Q = np.asarray(Q, dtype=float)
+    flat = values.reshape(len(values), -1).T
+    parameters = Morse_guess(Q, flat.T) if guess is None else np.array(guess, dtype=float).reshape(-1, 4)
+    damping = np.full(len(flat), 1e-3)
+    residuals = flat - Morse(Q, parameters)
+    cost = np.sum(residuals**2, axis=-1)
+    converged = cost == 0
+    with np.errstate(over='ignore', invalid='ignore'):
+        for iteration in range(iterations):
+            jacobian = _Morse_jacobian(Q, parameters)
+            JTJ = np.einsum('epi,epj->eij', jacobian, jacobian)
+            JTr = np.einsum('epi,ep->ei', jacobian, residuals)
+            scaled = JTJ + damping[:, np.newaxis, np.newaxis] * (JTJ * np.eye(4) + np.finfo(float).eps * np.eye(4))
+            step = np.linalg.solve(scaled, JTr[..., np.newaxis])[..., 0]
+            trial = parameters + step
+            trial_residuals = flat - Morse(Q, trial)
+            trial_cost = np.sum(trial_residuals**2, axis=-1)
+            # Only take steps that lower the cost, and stop once they barely do or the damping has run away
+            better = (trial_cost < cost) & ~converged
+            converged |= better & (cost - trial_cost <= tolerance * cost) | (damping > 1e16) | (trial_cost == 0)
+            parameters = np.where(better[:, np.newaxis], trial, parameters)
+            residuals = np.where(better[:, np.newaxis], trial_residuals, residuals)
+            cost = np.where(better, trial_cost, cost)
+            damping = np.where(better, damping / 10, damping * 10)
+            if np.all(converged):
+                break
+    errors = np.sqrt(cost / len(Q))
+    return parameters.reshape(values.shape[1:] + (4,)), errors.reshape(values.shape[1:])
+
+
+def polynomial_select(Q, values, orders):
+    '''
+    Fit polynomials of Q to every element of values with the order chosen for each element by cross_validate
+
+    returns the coefficients shaped (max(orders) + 1, ...), zero above the chosen order, and the chosen orders
+    '''
+    errors, best = cross_validate(Q, values, orders)
+    coefficients = np.zeros((max(orders) + 1,) + np.shape(values)[1:])
+    for order in orders:
+        chosen = best == order
+        if np.any(chosen):
+            coefficients[:order + 1, chosen] = polynomial_fit(Q, np.asarray(values, dtype=float)[:, chosen], order)
+    return coefficients, best
+
+
+def load_scan(files, step=_Q_step, signfix=False):
+    '''
+    Read the matrices of the scans of any number of modes, grouping together the modes scanned over the same values of Q
+
+    If signfix, the signs of the matrix at Q = 0 of each mode are imposed on its other matrices, as ROTMAT-FIT.m, with
+    elements that are zero at Q = 0 taken as positive
+
+    returns a dictionary keyed on the values of Q (as a tuple, in increasing order) of the mode numbers scanned over them
+    and their matrices, shaped (npoints, nmodes, nstate, nstate)
+    '''
+    modes, Q = scan_Q(files, step)
+    stack = dF.load_stack(files)
+    grids = {}
+    for mode in np.unique(modes):
+        points = np.flatnonzero(modes == mode)
+        points = points[np.argsort(Q[points])]
+        matrices = stack[points]
+        if signfix:
+            if not np.any(Q[points] == 0):
+                raise ValueError('Mode {} has no point at Q = 0 to take the signs from'.format(mode))
+            # As the mask of ROTMAT-FIT.m, elements that are zero at Q = 0 keep their magnitude (and are positive)
+            mask = matrices[np.flatnonzero(Q[points] == 0)[0]]
+            matrices = np.where(mask < 0, -1, 1) * np.abs(matrices)
+        grids.setdefault(tuple(Q[points]), []).append((int(mode), matrices))
+    scans = {}
+    for grid, scanned in grids.items():
+        scans[grid] = ([mode for mode, matrices in scanned], np.stack([matrices for mode, matrices in scanned], axis=1))
+    return scans
+
+
+def fit_scan(scans, order, select=False):
+    '''
+    Fit polynomials of Q to the matrices of load_scan, all of the modes scanned over the same values of Q (and all of
+    their elements) in one least squares call. If select, the order of each element is chosen from 1 to order by
+    cross_validate.
+
+    returns a dictionary of the coefficients, shaped (order + 1, nstate, nstate), keyed on the mode numbers
+    '''
+    coefficients = {}
+    for grid, (modes, stack) in scans.items():
+        if select:
+            fitted = polynomial_select(np.array(grid), stack, range(1, order + 1))[0]
+        else:
+            fitted = polynomial_fit(np.array(grid), stack, order)
+        for i, mode in enumerate(modes):
+            coefficients[mode] = fitted[:, i]
+    return coefficients
+
+
+def Morse_scan(scans):
+    '''
+    Fit Morse potentials of Q to the diagonal elements (the diabatic energies) of the matrices of load_scan, all of the
+    modes scanned over the same values of Q at once
+
+    returns dictionaries of the parameters, shaped (nstate, 4), and the root mean square errors keyed on the mode numbers
+    '''
+    parameters = {}
+    errors = {}
+    for grid, (modes, stack) in scans.items():
+        fitted, error = Morse_fit(np.array(grid), np.diagonal(stack, axis1=-2, axis2=-1))
+        for i, mode in enumerate(modes):
+            parameters[mode] = fitted[i]
+            errors[mode] = error[i]
+    return parameters, errors
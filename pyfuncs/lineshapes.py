@@ -1,3 +1,4 @@
+import numpy as np
 from numpy import pi, exp, log, sqrt
 import parseFUNCS as pF
 
@@ -6,6 +7,10 @@ _daltontokg = 1.660539040e-27
 _kBoltzmann = 1.38064852e-23
 _hPlanck = 6.62607004e-34
 _cSpeedOfLight = 299792458
+# Default cap on the memory used for the (peaks x grid) intermediate in broaden, in bytes
+_broaden_memory = 64 * 1024**2
+# Default bound on the relative error of the FFT convolution in broaden, compared to the direct sum
+_broaden_tolerance = 1e-3
 
 
 def _IRprefac(oscillator_strength, FWHM):
@@ -26,17 +31,28 @@ def _Ramanprefac(transition_energy, activity, laser_excitation, temperature):
     return prefac
 
 
+def _STA_displacement(frequency, gradient):
+    '''
+    Dimensionless displacement of the excited state minimum along a normal mode, equation 6 of
+    Kane & Jansen, J. Phys. Chem. C, 2010, 114, 5541 dx.doi.org/10.1021/jp906152q (IMDHO model)
+
+    frequency is in cm-1 and gradient is the excited state gradient along the mass-weighted normal coordinate Q,
+    in atomic units. The dimensionless normal mode coordinate is q = sqrt(frequency / h-bar) * Q
+    '''
+    omega = pF.cmtohartree(frequency)
+    dimless_gradient = gradient / sqrt(omega)
+    displacement = dimless_gradient / -omega
+    return displacement
+
+
 def _STA_resonance_raman_prefac(transition_energy, tdm, gradient):
     '''
     Equation 8 from Kane & Jansen, J. Phys. Chem. C, 2010, 114, 5541 dx.doi.org/10.1021/jp906152q
     "Short time approximation" or ES-gradient approximation
 
-    dimensionless normal mode coordinate q = sqrt(h-bar / frequency) * Normalmode
-    displacement from equation 6 of same paper (IMDHO model)
+    transition_energy is the frequency of the mode in cm-1, see _STA_displacement for gradient
     '''
-    normal_mode_to_dimless_factor = sqrt(1 / pF.cmtohartree(transition_energy))
-    dimless_gradient = gradient / normal_mode_to_dimless_factor
-    displacement = dimless_gradient / -pF.cmtohartree(transition_energy)
+    displacement = _STA_displacement(transition_energy, gradient)
     scattering_factor = 12 * tdm**4 * transition_energy**2 * displacement**2
     return scattering_factor
 
@@ -172,7 +188,7 @@ def STA_RR_Gaussian(x, transition_energy, tdm, gradient, FWHM):
 
     returns intensity (float)
     '''
-    intensity = _STA_resonance_raman_prefac(transition_energy, tdm) * _Gaussian(x, transition_energy, FWHM)
+    intensity = _STA_resonance_raman_prefac(transition_energy, tdm, gradient) * _Gaussian(x, transition_energy, FWHM)
     return intensity
 
 
@@ -182,5 +198,401 @@ def STA_RR_Lorentzian(x, transition_energy, tdm, gradient, FWHM):
 
     returns intensity (float)
     '''
-    intensity = _STA_resonance_raman_prefac(transition_energy, tdm) * _Lorentzian(x, transition_energy, FWHM)
+    intensity = _STA_resonance_raman_prefac(transition_energy, tdm, gradient) * _Lorentzian(x, transition_energy, FWHM)
     return intensity
+
+
+def _IRbroadprefac(grid, transition_energy, oscillator_strength, FWHM, **kwargs):
+    return _IRprefac(oscillator_strength, FWHM), 1
+
+
+def _UVbroadprefac(grid, transition_energy, oscillator_strength, FWHM, **kwargs):
+    return _UVprefac(oscillator_strength, FWHM), 1
+
+
+def _Ramanbroadprefac(grid, transition_energy, activity, FWHM, laser_excitation=None, temperature=None):
+    if laser_excitation is None or temperature is None:
+        raise ValueError('Raman spectra need laser_excitation and temperature')
+    return _Ramanprefac(transition_energy, activity, laser_excitation, temperature), 1
+
+
+def _embroadprefac(grid, transition_energy, oscillator_strength, FWHM, **kwargs):
+    # _emprefac is x**3 * f / FWHM, the x**3 is taken out of the sum over peaks
+    return _emprefac(1, oscillator_strength, FWHM), grid**3
+
+
+def _crosssecbroadprefac(grid, transition_energy, oscillator_strength, FWHM, **kwargs):
+    # _PhotoAbsCrossSec goes as 1 / x, which is taken out of the sum over peaks
+    return _PhotoAbsCrossSec(1, transition_energy, oscillator_strength), 1 / grid
+
+
+def _weideman_coefficients(N=32):
+    '''
+    Coefficients of the rational approximation of the Faddeeva function by J. A. C. Weideman,
+    SIAM J. Numer. Anal., 1994, 31, 1497 dx.doi.org/10.1137/0731077
+    '''
+    M = 2 * N
+    L = sqrt(N / sqrt(2))
+    t = L * np.tan(np.arange(-M + 1, M) * pi / M / 2)
+    f = np.append(0, exp(-t**2) * (L**2 + t**2))
+    a = np.real(np.fft.fft(np.fft.fftshift(f))) / (2 * M)
+    return L, a[1:N + 1][::-1]
+
+
+_weideman_L, _weideman_a = _weideman_coefficients()
+
+
+def _weideman_faddeeva(z):
+    '''
+    Faddeeva function w(z) = exp(-z**2) erfc(-iz) for Im(z) >= 0, accurate to about 1e-13
+    '''
+    denominator = _weideman_L - 1j * z
+    Z = (_weideman_L + 1j * z) / denominator
+    # Far out in the tails denominator**2 overflows and only the 1 / denominator term is left, as it should be
+    with np.errstate(over='ignore', invalid='ignore'):
+        w = 2 * np.polyval(_weideman_a, Z) / denominator**2 + 1 / sqrt(pi) / denominator
+    return w
+
+
+try:
+    from scipy.special import wofz as _faddeeva
+except ImportError:
+    _faddeeva = _weideman_faddeeva
+
+
+def _Voigt(x, transition_energy, FWHM, lorentzian_FWHM):
+    '''
+    Voigt profile, the convolution of a Gaussian of FWHM with a Lorentzian of lorentzian_FWHM,
+    scaled to a height of 1 like _Gaussian and _Lorentzian
+    '''
+    scale = FWHM / sqrt(log(2)) / 2
+    gamma = lorentzian_FWHM / 2 / scale
+    probability = _faddeeva((x - transition_energy) / scale + 1j * gamma).real / _faddeeva(1j * gamma).real
+    return probability
+
+
+def _pseudoVoigt(x, transition_energy, FWHM, eta):
+    '''
+    Pseudo-Voigt profile, a fraction eta of a Lorentzian and 1 - eta of a Gaussian with the same FWHM
+    '''
+    probability = eta * _Lorentzian(x, transition_energy, FWHM) + (1 - eta) * _Gaussian(x, transition_energy, FWHM)
+    return probability
+
+
+def Voigt_FWHM(FWHM, lorentzian_FWHM):
+    '''
+    Width of a Voigt profile from those of its Gaussian and Lorentzian parts,
+    from J. J. Olivero & R. L. Longbothum, J. Quant. Spectrosc. Radiat. Transfer, 1977, 17, 233
+    dx.doi.org/10.1016/0022-4073(77)90161-3
+
+    returns FWHM (float or array)
+    '''
+    voigt_FWHM = 0.5346 * lorentzian_FWHM + sqrt(0.2166 * lorentzian_FWHM**2 + FWHM**2)
+    return voigt_FWHM
+
+
+def _sigmoidal_FWHM(x, transition_energy, FWHM, asymmetry):
+    '''
+    Width varying across the band, which makes any of the lineshapes asymmetric.
+    This is based on A. L. Stancik & E. B. Brauns, Vib. Spectrosc., 2008, 47, 66 dx.doi.org/10.1016/j.vibspec.2008.02.009
+    '''
+    # The exponent is capped so that the width stays finite and positive far out in the narrow tail
+    width = 2 * FWHM / (1 + exp(np.minimum(asymmetry * (x - transition_energy), 50)))
+    return width
+
+
+def _asymmetric(lineshape):
+    def asymmetric_lineshape(x, transition_energy, FWHM, asymmetry, *parameters):
+        return lineshape(x, transition_energy, _sigmoidal_FWHM(x, transition_energy, FWHM, asymmetry), *parameters)
+    return asymmetric_lineshape
+
+
+def _Gaussian_support(FWHM, tolerance):
+    # Half-width beyond which a Gaussian is below tolerance times its height
+    return FWHM * sqrt(log(1 / tolerance) / 2.772)
+
+
+def _Lorentzian_support(FWHM, tolerance):
+    # Half-width beyond which a Lorentzian is below tolerance times its height, its tails are cut off there
+    return FWHM / 2 * sqrt(np.maximum(1 / tolerance - 1, 0))
+
+
+def _Voigt_support(FWHM, tolerance, lorentzian_FWHM):
+    # The Gaussian core plus the Lorentzian tail
+    return _Gaussian_support(FWHM, tolerance) + _Lorentzian_support(lorentzian_FWHM, tolerance)
+
+
+def _pseudoVoigt_support(FWHM, tolerance, eta):
+    return np.maximum(_Gaussian_support(FWHM, tolerance), _Lorentzian_support(FWHM, tolerance / np.maximum(eta, tolerance)))
+
+
+_broaden_shapes = {'Gaussian': _Gaussian, 'Lorentzian': _Lorentzian, 'Voigt': _Voigt, 'pseudo-Voigt': _pseudoVoigt}
+_broaden_support = {'Gaussian': _Gaussian_support, 'Lorentzian': _Lorentzian_support,
+                    'Voigt': _Voigt_support, 'pseudo-Voigt': _pseudoVoigt_support}
+# Shapes taking a second width or mixing parameter, given as shape_parameter to broaden
+_broaden_parameters = {'Voigt': 'the Lorentzian FWHM', 'pseudo-Voigt': 'the Lorentzian fraction eta'}
+# Cost of evaluating each shape relative to a Gaussian, for the choice of method in broaden
+_broaden_cost = {'Voigt': 10}
+# Shapes whose cut off tails are negligible even summed over many peaks, for which 'auto' uses windows
+_broaden_compact = ('Gaussian',)
+_broaden_kinds = {'IR': _IRbroadprefac, 'UV': _UVbroadprefac, 'Raman': _Ramanbroadprefac,
+                  'emission': _embroadprefac, 'crosssection': _crosssecbroadprefac}
+
+
+def _uniform_spacing(grid):
+    '''
+    returns the spacing of a 1D evenly spaced grid, or None if the grid is not evenly spaced
+    '''
+    if grid.ndim != 1 or grid.size < 2:
+        return None
+    steps = np.diff(grid)
+    spacing = (grid[-1] - grid[0]) / (grid.size - 1)
+    if spacing == 0 or not np.allclose(steps, spacing, rtol=1e-6, atol=0):
+        return None
+    return spacing
+
+
+def _fft_error(spacing, FWHM):
+    '''
+    Estimate of the largest error of the FFT convolution relative to the peak height
+
+    Linear binning interpolates the exact sum between grid points, the error of which is bounded by
+    spacing**2 / 8 times the curvature at the top of the peak: 0.69 (spacing / FWHM)**2 for a Gaussian and
+    (spacing / FWHM)**2 for a Lorentzian. Voigt and pseudo-Voigt profiles lie in between.
+    '''
+    return (spacing / FWHM)**2
+
+
+def _fft_size(npoints):
+    # Length of the transforms: the sticks (3 * npoints + 1) and kernel (4 * npoints + 1) padded to a power of 2
+    return 1 << int(np.ceil(np.log2(7 * npoints + 1)))
+
+
+def _fft_broaden(grid, spacing, centers, peak_prefac, widths, lineshape):
+    '''
+    Project the sticks onto the grid by linear binning and convolve them with a single sampled lineshape by FFT
+
+    Sticks within one grid length either side of the grid are binned. Sticks further away only reach the grid
+    with their tails and are summed directly.
+    '''
+    npoints = grid.size
+    position = (centers - grid[0]) / spacing
+    binned = (position >= -npoints) & (position < 2 * npoints)
+    spectrum = np.zeros(npoints)
+    if not binned.all():
+        far = ~binned
+        spectrum += peak_prefac[far] @ lineshape(grid, centers[far, np.newaxis], *widths)
+
+    # Linear binning keeps the weight and the centre of each stick between two neighbouring grid points
+    # sticks cover grid indices -npoints to 2 * npoints, stored from 0
+    lower = np.floor(position[binned]).astype(int)
+    fraction = position[binned] - lower
+    sticks = np.bincount(lower + npoints, peak_prefac[binned] * (1 - fraction), minlength=3 * npoints + 1)
+    sticks += np.bincount(lower + npoints + 1, peak_prefac[binned] * fraction, minlength=3 * npoints + 1)
+
+    # The kernel is sampled at offsets of -2 * npoints to 2 * npoints grid points, in the direction of the grid
+    # so that asymmetric lineshapes come out the right way round
+    offsets = np.arange(-2 * npoints, 2 * npoints + 1) * spacing
+    kernel = lineshape(offsets, 0, *widths)
+
+    size = _fft_size(npoints)
+    convolved = np.fft.irfft(np.fft.rfft(sticks, size) * np.fft.rfft(kernel, size), size)
+    # Grid point j lies at index j + 3 * npoints of the full convolution
+    spectrum += convolved[3 * npoints:4 * npoints]
+    return spectrum
+
+
+def _windows(grid, centers, halfwidth):
+    '''
+    Locate the grid points within halfwidth of each center by binary search
+
+    returns the first and one past the last index of each window, on grid sorted in ascending order,
+    or None if grid is not 1D and monotonic
+    '''
+    if grid.ndim != 1:
+        return None
+    steps = np.diff(grid)
+    if not ((steps > 0).all() or (steps < 0).all()):
+        return None
+    ascending = grid if grid.size < 2 or steps[0] > 0 else grid[::-1]
+    first = np.searchsorted(ascending, centers - halfwidth, side='left')
+    last = np.searchsorted(ascending, centers + halfwidth, side='right')
+    return first, last
+
+
+def _window_broaden(grid, windows, centers, peak_prefac, widths, lineshape, max_memory):
+    '''
+    Evaluate each peak only on the grid points of its window and add them up with np.bincount
+    '''
+    first, last = windows
+    npoints = grid.size
+    descending = npoints > 1 and grid[0] > grid[-1]
+    ascending = grid[::-1] if descending else grid
+    lengths = last - first
+    ends = np.cumsum(lengths)
+    spectrum = np.zeros(npoints)
+    # Four (chunk points) temporaries of 8 bytes are alive at once
+    chunk = max(1, int(max_memory // 32))
+    start = 0
+    while start < centers.size:
+        done = ends[start - 1] if start else 0
+        # Take as many peaks as fit, but at least one
+        stop = max(start + 1, int(np.searchsorted(ends, done + chunk, side='right')))
+        count = lengths[start:stop]
+        total = int(count.sum())
+        if total:
+            peak = np.repeat(np.arange(start, stop), count)
+            index = np.repeat(first[start:stop] - (ends[start:stop] - count - done), count) + np.arange(total)
+            values = peak_prefac[peak] * lineshape(ascending[index], centers[peak], *[width[peak] for width in widths])
+            spectrum += np.bincount(index, values, minlength=npoints)
+        start = stop
+    return spectrum[::-1] if descending else spectrum
+
+
+def _use_fft(spacing, npeaks, npoints, widths, tolerance, cost=1):
+    '''
+    Automatic choice of broaden: FFT when the grid is evenly spaced, the widths are shared by all peaks, the
+    estimated error is within tolerance and the N log N convolution is cheaper than the direct sum
+    '''
+    if spacing is None or any(np.ndim(width) != 0 for width in widths):
+        return False
+    if _fft_error(spacing, widths[0]) > tolerance:
+        return False
+    size = _fft_size(npoints)
+    # One Gaussian evaluation costs about four times as much as one point of one FFT pass
+    return cost * npeaks * npoints > size * np.log2(size) / 4
+
+
+def broaden(grid, centers, weights, FWHM, shape='Gaussian', kind='IR', laser_excitation=None, temperature=None,
+            max_memory=_broaden_memory, method='auto', tolerance=_broaden_tolerance, shape_parameter=None, asymmetry=None):
+    '''
+    Broaden a whole stick spectrum onto grid in one go, rather than one transition at a time
+
+    centers are the transition energies and weights the oscillator strengths (IR, UV, emission, crosssection)
+    or Raman activities (Raman)
+    FWHM may be a single width, one per peak, or a function returning the widths for an array of transition energies
+    shape is 'Gaussian', 'Lorentzian', 'Voigt' or 'pseudo-Voigt'. For Voigt, FWHM is the width of the Gaussian part
+    and shape_parameter that of the Lorentzian part, for pseudo-Voigt shape_parameter is the Lorentzian fraction eta.
+    Like FWHM, shape_parameter may be a single value or one per peak.
+    asymmetry (units of 1 / energy), if given, makes the width vary sigmoidally across each band,
+    see _sigmoidal_FWHM
+    kind is 'IR', 'UV', 'Raman', 'emission' or 'crosssection', with the same prefactors and units as the single transition
+    functions above. Raman also needs laser_excitation (nm) and temperature (K). For Voigt profiles the prefactors use
+    the overall width from Voigt_FWHM.
+
+    method is
+        'direct': every peak is evaluated on the whole grid, in chunks so that the (peaks x grid) intermediate
+                  never takes more than max_memory bytes
+        'fft': the sticks are binned onto the grid and convolved with one lineshape by FFT, which needs an evenly
+               spaced 1D grid and widths shared by all peaks. The relative error is about (grid spacing / FWHM)**2.
+        'window': each peak is only evaluated on the grid points where it is above tolerance times its height,
+                  found by binary search on the sorted grid. Lorentzian tails beyond that are cut off.
+                  Falls back to 'direct' on an unsorted grid.
+        'auto': 'fft' when it is possible, its estimated error is below tolerance and there are enough peaks, otherwise
+                'window' for Gaussians, whose tails vanish quickly, and 'direct' for the shapes with Lorentzian tails, which add up
+    The emission and cross section prefactors depend on the grid only through a common factor (x**3 and 1 / x),
+    which is applied after the sum, so every kind may use the FFT.
+
+    returns the spectrum (array the same shape as grid)
+    '''
+    grid = np.asarray(grid, dtype=float)
+    centers = np.atleast_1d(np.asarray(centers, dtype=float))
+    weights = np.broadcast_to(np.asarray(weights, dtype=float), centers.shape)
+    lineshape = _broaden_shapes[shape]
+    support = _broaden_support[shape]
+    if callable(FWHM):
+        FWHM = FWHM(centers)
+    widths = [np.asarray(FWHM, dtype=float)]
+    if shape in _broaden_parameters:
+        if shape_parameter is None:
+            raise ValueError('{} broadening needs shape_parameter, {}'.format(shape, _broaden_parameters[shape]))
+        widths.append(np.asarray(shape_parameter, dtype=float))
+    if asymmetry is not None:
+        lineshape = _asymmetric(lineshape)
+        widths.insert(1, np.asarray(asymmetry, dtype=float))
+
+    if shape == 'Voigt':
+        prefac_FWHM = Voigt_FWHM(widths[0], widths[-1])
+    else:
+        prefac_FWHM = widths[0]
+    peak_prefac, grid_prefac = _broaden_kinds[kind](grid, centers, weights, np.broadcast_to(prefac_FWHM, centers.shape),
+                                                   laser_excitation=laser_excitation, temperature=temperature)
+    peak_prefac = np.broadcast_to(peak_prefac, centers.shape)
+
+    spacing = _uniform_spacing(grid)
+    if method == 'auto':
+        if _use_fft(spacing, centers.size, grid.size, widths, tolerance, _broaden_cost.get(shape, 1)):
+            method = 'fft'
+        elif shape in _broaden_compact:
+            method = 'window'
+        else:
+            method = 'direct'
+    if method == 'fft':
+        if spacing is None:
+            raise ValueError('FFT broadening needs an evenly spaced 1D grid')
+        if any(np.ndim(width) != 0 for width in widths):
+            raise ValueError('FFT broadening needs the same widths for all peaks')
+        spectrum = _fft_broaden(grid, spacing, centers, peak_prefac, [float(width) for width in widths], lineshape)
+        method = None
+    widths = [np.broadcast_to(width, centers.shape) for width in widths]
+    if method == 'window':
+        halfwidth = support(widths[0] if asymmetry is None else 2 * widths[0], tolerance, *widths[2 if asymmetry is not None else 1:])
+        windows = _windows(grid, centers, halfwidth)
+        if windows is not None:
+            spectrum = _window_broaden(grid, windows, centers, peak_prefac, widths, lineshape, max_memory)
+            method = None
+        else:
+            # Unsorted or multidimensional grid
+            method = 'direct'
+    if method == 'direct':
+        spectrum = np.zeros(grid.size)
+        # A few (chunk x grid) temporaries are alive at once while evaluating the lineshape
+        chunk = max(1, int(max_memory // (32 * max(grid.size, 1))))
+        flatgrid = grid.ravel()
+        for start in range(0, centers.size, chunk):
+            stop = start + chunk
+            peaks = lineshape(flatgrid, centers[start:stop, np.newaxis], *[width[start:stop, np.newaxis] for width in widths])
+            spectrum += peak_prefac[start:stop] @ peaks
+    elif method is not None:
+        raise ValueError('Unknown broadening method {}'.format(method))
+
+    spectrum = grid_prefac * spectrum.reshape(grid.shape)
+    return spectrum
+
+
+def Raman_cube(grid, transition_energies, activities, FWHM, laser_excitations, temperatures, shape='Gaussian',
+               shape_parameter=None, max_memory=_broaden_memory):
+    '''
+    Non-resonant Raman spectra for every combination of temperature and laser excitation wavelength at once
+
+    The prefactor of _Ramanprefac is evaluated as one broadcast over (temperatures x laser_excitations x modes),
+    the bands of the modes are evaluated once, in chunks so that they never take more than max_memory bytes,
+    and contracted with the prefactors
+    Every band covers the whole grid, so each spectrum matches broaden(kind='Raman', method='direct') to round-off,
+    not the default method='auto', which may cut off the tails or use the FFT
+    laser_excitations are in nm, temperatures in K, see broaden for the other arguments
+
+    returns the spectra, shaped (temperatures, laser_excitations, grid points)
+    '''
+    grid = np.asarray(grid, dtype=float)
+    transition_energies = np.atleast_1d(np.asarray(transition_energies, dtype=float))
+    activities = np.broadcast_to(np.asarray(activities, dtype=float), transition_energies.shape)
+    laser_excitations = np.atleast_1d(np.asarray(laser_excitations, dtype=float))
+    temperatures = np.atleast_1d(np.asarray(temperatures, dtype=float))
+    lineshape = _broaden_shapes[shape]
+    widths = [FWHM]
+    if shape in _broaden_parameters:
+        if shape_parameter is None:
+            raise ValueError('{} broadening needs shape_parameter, {}'.format(shape, _broaden_parameters[shape]))
+        widths.append(shape_parameter)
+    widths = [np.broadcast_to(np.asarray(width, dtype=float), transition_energies.shape) for width in widths]
+
+    prefac = _Ramanprefac(transition_energies, activities, laser_excitations[:, np.newaxis], temperatures[:, np.newaxis, np.newaxis])
+
+    cube = np.zeros((temperatures.size, laser_excitations.size, grid.size))
+    chunk = max(1, int(max_memory // (32 * max(grid.size, 1))))
+    for start in range(0, transition_energies.size, chunk):
+        stop = start + chunk
+        bands = lineshape(grid, transition_energies[start:stop, np.newaxis], *[width[start:stop, np.newaxis] for width in widths])
+        cube += prefac[..., start:stop] @ bands
+    return cube
@@ -0,0 +1,240 @@
+import numpy as np
+import os
+import json
+import hashlib
+import inspect
+from collections import OrderedDict
+from functools import wraps
+
+
+'''
+
+parseCACHE provides an opt-in on-disk cache for the results of the parsers in this collection
+
+Results are stored as .npz files keyed on the path, size, modification time and a hash of the content of the parsed file,
+so a cache hit skips re-reading the output entirely. The cache is switched off unless a cache directory is set, either
+with enable() or with the CHEMSCRIPTS_CACHE environment variable. The total size of the cache is bounded, the least
+recently used entries are evicted first. The default bound is 1024 MB, which may be changed with enable() or with
+the CHEMSCRIPTS_CACHE_MAXSIZE environment variable (in MB).
+
+'''
+
+# globals
+_settings = {'directory': None, 'maxsize': None}
+_default_maxsize = 1024
+_hash_chunk = 1 << 20
+
+
+def enable(directory, maxsize=None):
+    '''
+    Switch the cache on, storing entries in directory, which is created if necessary
+
+    maxsize is the maximum total size of the cache in MB
+    '''
+    os.makedirs(directory, exist_ok=True)
+    _settings['directory'] = directory
+    _settings['maxsize'] = maxsize
+
+
+def disable():
+    '''
+    Switch the cache off, overriding CHEMSCRIPTS_CACHE. Existing entries are kept on disk.
+    '''
+    _settings['directory'] = False
+
+
+def cache_dir():
+    '''
+    returns the current cache directory, or None if caching is switched off
+    '''
+    directory = _settings['directory']
+    if directory is None:
+        directory = os.environ.get('CHEMSCRIPTS_CACHE')
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    return directory or None
+
+
+def _maxsize():
+    maxsize = _settings['maxsize']
+    if maxsize is None:
+        maxsize = float(os.environ.get('CHEMSCRIPTS_CACHE_MAXSIZE', _default_maxsize))
+    return maxsize * 1024 * 1024
+
+
+def _path_key(file):
+    return hashlib.blake2b(os.path.abspath(file).encode(), digest_size=8).hexdigest()
+
+
+def _content_hash(file, filestat):
+    '''
+    Hash of the first and last MB of the file, which together with the size and mtime identifies the contents
+    without reading the whole of a large output
+    '''
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file, 'rb') as incoming:
+        digest.update(incoming.read(_hash_chunk))
+        if filestat.st_size > _hash_chunk:
+            incoming.seek(max(_hash_chunk, filestat.st_size - _hash_chunk))
+            digest.update(incoming.read(_hash_chunk))
+    return digest.hexdigest()
+
+
+def _entry_name(function, file, args, kwargs):
+    # The arguments are bound to the parameters with their defaults, so that passing an argument by position, by
+    # keyword or not at all (the default) gives the same entry
+    bound = inspect.signature(function).bind(file, *args, **kwargs)
+    bound.apply_defaults()
+    arguments = list(bound.arguments.items())[1:]
+    filestat = os.stat(file)
+    identity = [function.__module__, function.__qualname__, os.path.abspath(file), filestat.st_size,
+                filestat.st_mtime_ns, _content_hash(file, filestat), repr(arguments)]
+    key = hashlib.blake2b(json.dumps(identity).encode(), digest_size=16).hexdigest()
+    return '{}-{}.npz'.format(_path_key(file), key)
+
+
+def _encode(obj, arrays):
+    '''
+    Flatten a parser result into arrays for np.savez, returning a JSON-able description of its structure
+    '''
+    if isinstance(obj, np.ndarray):
+        key = 'a{}'.format(len(arrays))
+        arrays[key] = obj
+        return {'t': 'array', 'k': key}
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return {'t': 'scalar', 'v': obj}
+    if isinstance(obj, dict):
+        return {'t': 'odict' if isinstance(obj, OrderedDict) else 'dict',
+                'v': [[key, _encode(value, arrays)] for key, value in obj.items()]}
+    if isinstance(obj, (list, tuple)):
+        return {'t': type(obj).__name__, 'v': [_encode(value, arrays) for value in obj]}
+    raise TypeError('Cannot cache objects of type {}'.format(type(obj).__name__))
+
+
+def _decode(node, arrays):
+    kind = node['t']
+    if kind == 'array':
+        return arrays[node['k']]
+    if kind == 'scalar':
+        return node['v']
+    if kind in ('dict', 'odict'):
+        items = [(key, _decode(value, arrays)) for key, value in node['v']]
+        return OrderedDict(items) if kind == 'odict' else dict(items)
+    values = [_decode(value, arrays) for value in node['v']]
+    return tuple(values) if kind == 'tuple' else values
+
+
+def _load(path):
+    with np.load(path, allow_pickle=False) as stored:
+        arrays = {key: stored[key] for key in stored.files}
+    manifest = json.loads(str(arrays.pop('manifest')))
+    # Mark as recently used for the LRU eviction
+    os.utime(path)
+    return _decode(manifest, arrays)
+
+
+def _store(path, result):
+    arrays = {}
+    manifest = _encode(result, arrays)
+    arrays['manifest'] = np.array(json.dumps(manifest))
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(temporary, 'wb') as outgoing:
+            np.savez(outgoing, **arrays)
+        os.replace(temporary, path)
+    except OSError:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def _entries(directory):
+    entries = []
+    for name in os.listdir(directory):
+        if name.endswith('.npz'):
+            path = os.path.join(directory, name)
+            try:
+                entries.append((os.stat(path), path))
+            except FileNotFoundError:
+                continue
+    return entries
+
+
+def _evict(directory):
+    '''
+    Remove the least recently used entries until the cache fits in its maximum size
+    '''
+    entries = sorted(_entries(directory), key=lambda entry: entry[0].st_mtime)
+    total = sum(entry[0].st_size for entry in entries)
+    limit = _maxsize()
+    for filestat, path in entries:
+        if total <= limit:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= filestat.st_size
+
+
+def cached(function):
+    '''
+    Decorator for parsers taking the output file as their first argument
+
+    When the cache is switched on, results are looked up in and saved to the cache directory
+    '''
+    @wraps(function)
+    def wrapper(file, *args, **kwargs):
+        directory = cache_dir()
+        if directory is None:
+            return function(file, *args, **kwargs)
+        path = os.path.join(directory, _entry_name(function, file, args, kwargs))
+        if os.path.exists(path):
+            try:
+                return _load(path)
+            except (OSError, ValueError, KeyError):
+                # Damaged entry, parse again
+                pass
+        result = function(file, *args, **kwargs)
+        try:
+            _store(path, result)
+            _evict(directory)
+        except (TypeError, OSError):
+            # Uncacheable result or unwritable cache, which never stops the parse
+            pass
+        return result
+    return wrapper
+
+
+def clear(files=None):
+    '''
+    Invalidate cache entries, either for the given list of output files or, if files is None, all of them
+
+    returns the number of entries removed
+    '''
+    directory = cache_dir()
+    if directory is None:
+        return 0
+    if files is None:
+        prefixes = None
+    else:
+        prefixes = tuple('{}-'.format(_path_key(file)) for file in files)
+    removed = 0
+    for filestat, path in _entries(directory):
+        if prefixes is None or os.path.basename(path).startswith(prefixes):
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def info():
+    '''
+    returns the cache directory, the number of entries and their total size in bytes
+    '''
+    directory = cache_dir()
+    if directory is None:
+        return None, 0, 0
+    entries = _entries(directory)
+    return directory, len(entries), sum(entry[0].st_size for entry in entries)
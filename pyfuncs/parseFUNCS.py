@@ -1,4 +1,14 @@
 import numpy as np
+import os
+import re
+import mmap
+import shutil
+import tempfile
+import gzip
+import bz2
+import lzma
+from contextlib import contextmanager
+from itertools import islice
 
 
 '''
@@ -23,6 +33,9 @@ SI_planck = 6.62607015e-34
 SI_hbar = 1.054571800e-34
 SI_vacuumperm = 8.854187817e-12
 SI_boltzmann = 1.38064852e-23
+_compression_magic = [(b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz'), (b'\x28\xb5\x2f\xfd', 'zstd')]
+# Compressed outputs are decompressed into a temporary file for map_output this many bytes at a time
+_spool_chunk = 1 << 24
 
 
 def DebyetoCm(x):
@@ -135,6 +148,172 @@ def kgtodalton(x):
     return converted
 
 
+def compression(file):
+    """
+    This function detects whether an output file has been compressed, from the magic bytes at its start
+
+    returns 'gzip', 'bz2', 'xz', 'zstd' or None for uncompressed files
+    """
+    with open(file, 'rb') as incoming:
+        start = incoming.read(6)
+    for magic, kind in _compression_magic:
+        if start.startswith(magic):
+            return kind
+    return None
+
+
+def open_output(file, mode='r'):
+    """
+    This function opens an output file for reading, decompressing it on the fly if it is a
+    .gz, .bz2, .xz or .zst archive (detected from the content, not the file name)
+
+    mode is 'r' for text or 'rb' for bytes
+
+    returns a file object
+    """
+    kind = compression(file)
+    binary = 'b' in mode
+    if kind is None:
+        return open(file, 'rb' if binary else 'r')
+    if kind == 'gzip':
+        opener = gzip.open
+    elif kind == 'bz2':
+        opener = bz2.open
+    elif kind == 'xz':
+        opener = lzma.open
+    else:
+        opener = _zstd_open()
+    return opener(file, 'rb' if binary else 'rt')
+
+
+def read_output(file):
+    """
+    This function reads the whole of a (possibly compressed) output file
+
+    returns a string
+    """
+    with open_output(file) as incoming:
+        text = incoming.read()
+    return text
+
+
+@contextmanager
+def map_output(file):
+    """
+    This function gives random access to the bytes of an output file, e.g. for searching backwards from the end
+
+    uncompressed files are memory-mapped, compressed files are streamed through the decompressor into an anonymous
+    temporary file (in tempfile.gettempdir(), see TMPDIR), which is memory-mapped instead, so that a multi-GB output is
+    never held in memory. Either way the object supports find, rfind and slicing.
+    """
+    if compression(file) is None:
+        with open(file, 'rb') as incoming, _map(incoming) as mapped:
+            yield mapped
+    else:
+        with open_output(file, 'rb') as incoming, tempfile.TemporaryFile() as spooled:
+            shutil.copyfileobj(incoming, spooled, _spool_chunk)
+            spooled.flush()
+            with _map(spooled) as mapped:
+                yield mapped
+
+
+@contextmanager
+def _map(incoming):
+    # mmap cannot map an empty file
+    if os.fstat(incoming.fileno()).st_size == 0:
+        yield b''
+        return
+    with mmap.mmap(incoming.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
+
+
+def _zstd_open():
+    try:
+        from compression.zstd import open as zstd_open
+    except ImportError:
+        try:
+            from zstandard import open as zstd_open
+        except ImportError:
+            raise ImportError('Reading .zst files requires python >= 3.14 or the zstandard package')
+    return zstd_open
+
+
+def read_block(source, nrows, columns=slice(None)):
+    """
+    This function reads a fixed-format table of nrows lines and converts the requested columns to floats in one go,
+    e.g. for reading gradients, NACVs or coordinates printed one atom per line
+
+    source may be an open file (or any iterator over lines, text or bytes), in which case exactly nrows lines are consumed from it,
+    or a str/bytes buffer whose first nrows lines are used
+    columns is a slice (or list of indices) selecting the columns to keep
+
+    returns a numpy array of floats with shape (nrows, ncolumns)
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = bytes(source).decode()
+    if isinstance(source, str):
+        lines = source.splitlines()[:nrows]
+    else:
+        lines = list(islice(source, nrows))
+        if lines and isinstance(lines[0], bytes):
+            lines = [line.decode() for line in lines]
+    if len(lines) != nrows:
+        raise ValueError('Expected {} rows but only {} could be read'.format(nrows, len(lines)))
+
+    tokens = ' '.join(lines).split()
+    if nrows == 0 or len(tokens) % nrows != 0:
+        raise ValueError('The block of {} rows does not have a constant number of columns'.format(nrows))
+    block = np.array(tokens).reshape(nrows, -1)[:, columns].astype(float)
+
+    return block
+
+
+class LineClassifier:
+    """
+    Classifies lines of an output file against a set of triggers, e.g. the section headers a parser is looking for
+
+    triggers is a sequence of (trigger_id, literal) or (trigger_id, literal, regex) tuples
+        literal is a substring that must be present for the trigger to fire
+        regex (optional) is a compiled pattern which is searched for in the line once the literal has been found,
+        for triggers that need more than a substring test (anchoring, case-insensitivity, ...)
+
+    All literals are combined into one compiled alternation, so the vast majority of lines, which match nothing,
+    are rejected by a single test before any per-trigger matching is done.
+
+    classify(line) returns the trigger_id of the first trigger that fires, or None
+    literals are the literals of all of the triggers, e.g. for looking the lines up in a section index (see parseINDEX)
+    """
+
+    __slots__ = ['_triggers', '_prefilter']
+
+    def __init__(self, triggers):
+        self._triggers = []
+        ignorecase = False
+        for trigger in triggers:
+            trigger_id, literal = trigger[0], trigger[1]
+            regex = trigger[2] if len(trigger) > 2 else None
+            if regex is not None and regex.flags & re.IGNORECASE:
+                ignorecase = True
+            self._triggers.append((trigger_id, literal, regex))
+        alternation = '|'.join(re.escape(literal) for trigger_id, literal, regex in self._triggers)
+        self._prefilter = re.compile(alternation, re.IGNORECASE if ignorecase else 0)
+
+    @property
+    def literals(self):
+        return [literal for trigger_id, literal, regex in self._triggers]
+
+    def classify(self, line):
+        if self._prefilter.search(line) is None:
+            return None
+        for trigger_id, literal, regex in self._triggers:
+            if regex is None:
+                if literal in line:
+                    return trigger_id
+            elif regex.search(line):
+                return trigger_id
+        return None
+
+
 def atomwise_dot(vector1, vector2):
     """
     This function takes the dot product between two vectors row by row, e.g. for comparing two sets of molecular coordinates
@@ -150,68 +329,118 @@ def atomwise_dot(vector1, vector2):
     return total_dot
 
 
-def mass_weight(vector, atoms):
+def atom_masses(atoms, isotopes=None):
+    """
+    Masses of a list of atoms, looked up all at once
+
+    atoms is a list (or array) of atomic numbers
+    isotopes optionally overrides the standard atomic mass of some of the atoms, as a dictionary of
+    atom index (counting from 0): mass number, e.g. {0: 2} for a deuterium as the first atom, see isotope_mass
+
+    returns a numpy array of masses in amu
+    """
+    masses = np.array(z_to_mass(atoms), dtype=float, ndmin=1)
+    if isotopes:
+        for index, mass_number in isotopes.items():
+            masses[index] = isotope_mass(atoms[index], mass_number)
+    return masses
+
+
+def mass_weight(vector, atoms, isotopes=None):
     """
     This function takes in a vector (i.e. NACV or gradient) and returns the mass-weighted version of it,
     where mass weighting does the following for each atom: mass weighted displacement = sqrt(mass) * displacement
 
     this reads in a vector and a list of atomic numbers
-        the vector should be an array of cartesian displacements, one for each atom
+        the vector should be an array of cartesian displacements, one for each atom, or a stack of such
+        arrays (nvec, natom, 3), which are all weighted at once
         the list of atomic numbers should be a list of integers
     these must be in the same order, atom wise
+    isotopes is passed on to atom_masses
 
     the mass-weighted vector is returned as a numpy array and has been normalised back to it's previous length
+    (each vector of a stack to its own length)
     """
-
-    # Obtain masses from atom list
-    masses = np.array([z_to_mass(Z) for Z in atoms])
-
-    # Obtain the norm of the original vector
-    orig_vec_norm = np.linalg.norm(vector, 'fro')
-
-    # Generate the un-normalised mw_vector
-    raw_mw_vector = np.array([]).reshape(0, 3)
-    for row in range(len(vector)):
-        thisatom = np.multiply(np.sqrt(masses[row]), vector[row, :])
-        raw_mw_vector = np.append(raw_mw_vector, [thisatom], axis=0)
-
-    # Normalise the mw vector to match the original norm
-    raw_mw_vector_norm = np.linalg.norm(raw_mw_vector, 'fro')
-    mw_vector = np.multiply(np.divide(raw_mw_vector, raw_mw_vector_norm), orig_vec_norm)
-
+    vector = np.asarray(vector, dtype=float)
+    sqrt_masses = np.sqrt(atom_masses(atoms, isotopes))[:, np.newaxis]
+    mw_vector = _renormalise(vector * sqrt_masses, vector)
     return mw_vector
 
 
-def unmass_weight(vector, atoms):
+def unmass_weight(vector, atoms, isotopes=None):
     """
     This function takes in a mass-weighted vector (i.e. NACV or gradient) and returns the unmass-weighted version of it,
     where mass weighting does the following for each atom: mass weighted displacement = sqrt(mass) * displacement
 
     this reads in a vector and a list of atomic numbers
-        the vector should be an array of cartesian displacements, one for each atom
+        the vector should be an array of cartesian displacements, one for each atom, or a stack of such
+        arrays (nvec, natom, 3), which are all unweighted at once
         the list of atomic numbers should be a list of integers
     these must be in the same order, atom wise
+    isotopes is passed on to atom_masses
 
-    the mass-weighted vector is returned as a numpy array and has been normalised back to it's previous length
+    the unmass-weighted vector is returned as a numpy array and has been normalised back to it's previous length
+    (each vector of a stack to its own length)
     """
+    vector = np.asarray(vector, dtype=float)
+    sqrt_masses = np.sqrt(atom_masses(atoms, isotopes))[:, np.newaxis]
+    umw_vector = _renormalise(vector / sqrt_masses, vector)
+    return umw_vector
 
-    # Obtain masses from atom list
-    masses = np.array([z_to_mass(Z) for Z in atoms])
-
-    # Obtain the norm of the original vector
-    orig_mw_vec_norm = np.linalg.norm(vector, 'fro')
-
-    # Generate the un-normalised mw_vector
-    raw_umw_vector = np.array([]).reshape(0, 3)
-    for row in range(len(vector)):
-        thisatom = np.divide(vector[row, :], np.sqrt(masses[row]))
-        raw_umw_vector = np.append(raw_umw_vector, [thisatom], axis=0)
 
-    # Normalise the mw vector to match the original norm
-    raw_umw_vector_norm = np.linalg.norm(raw_umw_vector, 'fro')
-    umw_vector = np.multiply(np.divide(raw_umw_vector, raw_umw_vector_norm), orig_mw_vec_norm)
+def _renormalise(vector, reference):
+    # Scale each (natom, 3) vector to the Frobenius norm of the matching vector of reference
+    vector_norm = np.linalg.norm(vector, axis=(-2, -1), keepdims=True)
+    reference_norm = np.linalg.norm(reference, axis=(-2, -1), keepdims=True)
+    return vector / vector_norm * reference_norm
+
+
+# Standard atomic masses indexed by atomic number, see z_to_mass
+_atomic_masses = np.array([
+    np.nan,
+    1.0080, 4.0026, 6.9675, 9.0122, 10.8135, 12.0105, 14.007, 16.000,
+    18.998, 20.180, 22.990, 24.306, 26.982, 28.085, 30.974, 32.068,
+    35.452, 39.948, 39.098, 40.078, 44.956, 47.867, 50.942, 51.996,
+    54.938, 55.845, 58.933, 58.693, 63.546, 65.380, 69.723, 72.630,
+    74.922, 78.971, 79.904, 83.798, 85.468, 87.620, 88.906, 91.224,
+    92.906, 95.950, 98.000, 101.07, 102.91, 106.42, 107.87, 112.41,
+    114.82, 118.71, 121.76, 127.60, 126.90, 131.29, 132.91, 137.33,
+    138.91, 140.12, 140.91, 144.24, 144.91, 150.36, 151.96, 157.25,
+    158.93, 162.50, 164.93, 167.26, 168.93, 173.05, 174.97, 178.49,
+    180.95, 183.84, 186.21, 190.23, 192.22, 195.08, 196.97, 200.59,
+    204.39, 207.20, 208.98, 208.98, 209.99, 222.02, 223.02, 226.03,
+    227.03, 232.04, 231.04, 238.03, 237.05, 244.06, 243.06, 247.07,
+    247.07, 251.08, 252.08, 257.10, 258.10, 259.10, 262.11, 267.12,
+    270.13, 269.13, 270.13, 269.13, 278.16, 281.17, 281.17, 285.18,
+    286.18, 289.19, 289.20, 293.20, 293.21, 294.21,
+])
+
+# Masses of common isotopes in amu, keyed on (atomic number, mass number), from the AME2016 atomic mass evaluation
+_isotope_masses = {(1, 1): 1.00783, (1, 2): 2.01410, (1, 3): 3.01605,
+                   (6, 12): 12.00000, (6, 13): 13.00335, (6, 14): 14.00324,
+                   (7, 14): 14.00307, (7, 15): 15.00011,
+                   (8, 16): 15.99491, (8, 17): 16.99913, (8, 18): 17.99916,
+                   (9, 19): 18.99840, (15, 31): 30.97376,
+                   (16, 32): 31.97207, (16, 34): 33.96787,
+                   (17, 35): 34.96885, (17, 37): 36.96590,
+                   (35, 79): 78.91834, (35, 81): 80.91629}
+
+
+def _atomic_numbers(atomic_number):
+    """
+    Atomic numbers as integers, accepting floats that are whole numbers (e.g. the atomnos of cclib)
 
-    return umw_vector
+    returns an integer numpy array
+    """
+    atomic_number = np.asarray(atomic_number)
+    if atomic_number.dtype.kind in 'biu':
+        return atomic_number.astype(int)
+    if atomic_number.dtype.kind != 'f':
+        raise ValueError('Error reading atomic number: {}'.format(atomic_number))
+    rounded = np.rint(atomic_number)
+    if not np.all(np.isfinite(rounded) & (rounded == atomic_number)):
+        raise ValueError('Error reading atomic number: {}'.format(atomic_number))
+    return rounded.astype(int)
 
 
 def z_to_mass(atomic_number):
@@ -225,251 +454,30 @@ def z_to_mass(atomic_number):
     For atoms with no stable isotopes, the mass of the most stable isotope was used as obtained from webelements
     www.webelements.com
 
-    returns a float
-    """
+    atomic_number may also be an array of atomic numbers, which are all looked up at once
 
-    if atomic_number == 1:
-        atomic_mass = 1.0080
-    elif atomic_number == 2:
-        atomic_mass = 4.0026
-    elif atomic_number == 3:
-        atomic_mass = 6.9675
-    elif atomic_number == 4:
-        atomic_mass = 9.0122
-    elif atomic_number == 5:
-        atomic_mass = 10.8135
-    elif atomic_number == 6:
-        atomic_mass = 12.0105
-    elif atomic_number == 7:
-        atomic_mass = 14.007
-    elif atomic_number == 8:
-        atomic_mass = 16.000
-    elif atomic_number == 9:
-        atomic_mass = 18.998
-    elif atomic_number == 10:
-        atomic_mass = 20.180
-    elif atomic_number == 11:
-        atomic_mass = 22.990
-    elif atomic_number == 12:
-        atomic_mass = 24.306
-    elif atomic_number == 13:
-        atomic_mass = 26.982
-    elif atomic_number == 14:
-        atomic_mass = 28.085
-    elif atomic_number == 15:
-        atomic_mass = 30.974
-    elif atomic_number == 16:
-        atomic_mass = 32.068
-    elif atomic_number == 17:
-        atomic_mass = 35.452
-    elif atomic_number == 18:
-        atomic_mass = 39.948
-    elif atomic_number == 19:
-        atomic_mass = 39.098
-    elif atomic_number == 20:
-        atomic_mass = 40.078
-    elif atomic_number == 21:
-        atomic_mass = 44.956
-    elif atomic_number == 22:
-        atomic_mass = 47.867
-    elif atomic_number == 23:
-        atomic_mass = 50.942
-    elif atomic_number == 24:
-        atomic_mass = 51.996
-    elif atomic_number == 25:
-        atomic_mass = 54.938
-    elif atomic_number == 26:
-        atomic_mass = 55.845
-    elif atomic_number == 27:
-        atomic_mass = 58.933
-    elif atomic_number == 28:
-        atomic_mass = 58.693
-    elif atomic_number == 29:
-        atomic_mass = 63.546
-    elif atomic_number == 30:
-        atomic_mass = 65.380
-    elif atomic_number == 31:
-        atomic_mass = 69.723
-    elif atomic_number == 32:
-        atomic_mass = 72.630
-    elif atomic_number == 33:
-        atomic_mass = 74.922
-    elif atomic_number == 34:
-        atomic_mass = 78.971
-    elif atomic_number == 35:
-        atomic_mass = 79.904
-    elif atomic_number == 36:
-        atomic_mass = 83.798
-    elif atomic_number == 37:
-        atomic_mass = 85.468
-    elif atomic_number == 38:
-        atomic_mass = 87.620
-    elif atomic_number == 39:
-        atomic_mass = 88.906
-    elif atomic_number == 40:
-        atomic_mass = 91.224
-    elif atomic_number == 41:
-        atomic_mass = 92.906
-    elif atomic_number == 42:
-        atomic_mass = 95.950
-    elif atomic_number == 43:
-        atomic_mass = 98.000
-    elif atomic_number == 44:
-        atomic_mass = 101.07
-    elif atomic_number == 45:
-        atomic_mass = 102.91
-    elif atomic_number == 46:
-        atomic_mass = 106.42
-    elif atomic_number == 47:
-        atomic_mass = 107.87
-    elif atomic_number == 48:
-        atomic_mass = 112.41
-    elif atomic_number == 49:
-        atomic_mass = 114.82
-    elif atomic_number == 50:
-        atomic_mass = 118.71
-    elif atomic_number == 51:
-        atomic_mass = 121.76
-    elif atomic_number == 52:
-        atomic_mass = 127.60
-    elif atomic_number == 53:
-        atomic_mass = 126.90
-    elif atomic_number == 54:
-        atomic_mass = 131.29
-    elif atomic_number == 55:
-        atomic_mass = 132.91
-    elif atomic_number == 56:
-        atomic_mass = 137.33
-    elif atomic_number == 57:
-        atomic_mass = 138.91
-    elif atomic_number == 58:
-        atomic_mass = 140.12
-    elif atomic_number == 59:
-        atomic_mass = 140.91
-    elif atomic_number == 60:
-        atomic_mass = 144.24
-    elif atomic_number == 61:
-        atomic_mass = 144.91
-    elif atomic_number == 62:
-        atomic_mass = 150.36
-    elif atomic_number == 63:
-        atomic_mass = 151.96
-    elif atomic_number == 64:
-        atomic_mass = 157.25
-    elif atomic_number == 65:
-        atomic_mass = 158.93
-    elif atomic_number == 66:
-        atomic_mass = 162.50
-    elif atomic_number == 67:
-        atomic_mass = 164.93
-    elif atomic_number == 68:
-        atomic_mass = 167.26
-    elif atomic_number == 69:
-        atomic_mass = 168.93
-    elif atomic_number == 70:
-        atomic_mass = 173.05
-    elif atomic_number == 71:
-        atomic_mass = 174.97
-    elif atomic_number == 72:
-        atomic_mass = 178.49
-    elif atomic_number == 73:
-        atomic_mass = 180.95
-    elif atomic_number == 74:
-        atomic_mass = 183.84
-    elif atomic_number == 75:
-        atomic_mass = 186.21
-    elif atomic_number == 76:
-        atomic_mass = 190.23
-    elif atomic_number == 77:
-        atomic_mass = 192.22
-    elif atomic_number == 78:
-        atomic_mass = 195.08
-    elif atomic_number == 79:
-        atomic_mass = 196.97
-    elif atomic_number == 80:
-        atomic_mass = 200.59
-    elif atomic_number == 81:
-        atomic_mass = 204.39
-    elif atomic_number == 82:
-        atomic_mass = 207.20
-    elif atomic_number == 83:
-        atomic_mass = 208.98
-    elif atomic_number == 84:
-        atomic_mass = 208.98
-    elif atomic_number == 85:
-        atomic_mass = 209.99
-    elif atomic_number == 86:
-        atomic_mass = 222.02
-    elif atomic_number == 87:
-        atomic_mass = 223.02
-    elif atomic_number == 88:
-        atomic_mass = 226.03
-    elif atomic_number == 89:
-        atomic_mass = 227.03
-    elif atomic_number == 90:
-        atomic_mass = 232.04
-    elif atomic_number == 91:
-        atomic_mass = 231.04
-    elif atomic_number == 92:
-        atomic_mass = 238.03
-    elif atomic_number == 93:
-        atomic_mass = 237.05
-    elif atomic_number == 94:
-        atomic_mass = 244.06
-    elif atomic_number == 95:
-        atomic_mass = 243.06
-    elif atomic_number == 96:
-        atomic_mass = 247.07
-    elif atomic_number == 97:
-        atomic_mass = 247.07
-    elif atomic_number == 98:
-        atomic_mass = 251.08
-    elif atomic_number == 99:
-        atomic_mass = 252.08
-    elif atomic_number == 100:
-        atomic_mass = 257.10
-    elif atomic_number == 101:
-        atomic_mass = 258.10
-    elif atomic_number == 102:
-        atomic_mass = 259.10
-    elif atomic_number == 103:
-        atomic_mass = 262.11
-    elif atomic_number == 104:
-        atomic_mass = 267.12
-    elif atomic_number == 105:
-        atomic_mass = 270.13
-    elif atomic_number == 106:
-        atomic_mass = 269.13
-    elif atomic_number == 107:
-        atomic_mass = 270.13
-    elif atomic_number == 108:
-        atomic_mass = 269.13
-    elif atomic_number == 109:
-        atomic_mass = 278.16
-    elif atomic_number == 110:
-        atomic_mass = 281.17
-    elif atomic_number == 111:
-        atomic_mass = 281.17
-    elif atomic_number == 112:
-        atomic_mass = 285.18
-    elif atomic_number == 113:
-        atomic_mass = 286.18
-    elif atomic_number == 114:
-        atomic_mass = 289.19
-    elif atomic_number == 115:
-        atomic_mass = 289.20
-    elif atomic_number == 116:
-        atomic_mass = 293.20
-    elif atomic_number == 117:
-        atomic_mass = 293.21
-    elif atomic_number == 118:
-        atomic_mass = 294.21
-    else:
-        print('Error reading atomic number: {}'.format(atomic_number))
-        exit()
+    returns a float (or an array of floats)
+    """
+    atomic_number = _atomic_numbers(atomic_number)
+    if np.any((atomic_number < 1) | (atomic_number >= len(_atomic_masses))):
+        raise ValueError('Error reading atomic number: {}'.format(atomic_number))
+    atomic_mass = _atomic_masses[atomic_number]
+    if atomic_mass.ndim == 0:
+        atomic_mass = float(atomic_mass)
     return atomic_mass
 
 
+def isotope_mass(atomic_number, mass_number):
+    """
+    returns the mass in amu of the isotope mass_number of the element atomic_number
+    """
+    try:
+        isotope = _isotope_masses[(int(atomic_number), int(mass_number))]
+    except KeyError:
+        raise ValueError('No mass known for isotope {} of element {}'.format(mass_number, atomic_number)) from None
+    return isotope
+
+
 def osc_to_tdm(f, Ei, Ef):
     '''
     Convert oscillator strength to transition dipole moment
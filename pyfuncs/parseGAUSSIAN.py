@@ -1,6 +1,8 @@
 import numpy as np
-import re
+from collections import OrderedDict
 from parseFUNCS import *
+from parseCACHE import cached
+import parseINDEX
 
 
 '''
@@ -8,69 +10,169 @@ parseGAUSSIAN provides some additional functionality to, and is meant to work in
 '''
 
 
-def gradient(file):
+@cached
+def gradient(file, steps=None):
     """
     Parse a Gaussian 09 file and recover gradient vector
 
+    steps selects which Forces blocks are returned:
+        'last' : only the final gradient, found by searching backwards through the memory-mapped file (or the decompressed contents of a compressed one)
+        'all' : every gradient in the file, as an (nsteps, natom, 3) array
+        None : every gradient in the file, concatenated into an (nsteps * natom, 3) array
+
     returns a numpy array containing the gradient vector
     """
 
-    vector = np.array([]).reshape(0, 3)
-
-    with open(file, 'r') as incoming:
-        line = next(incoming)
-
-        while line:
-            reg_match = _G09_GRAD_reg(line)
-            # Orientation printed multiple times. Always use the last one.
-            if reg_match.INPO_flag:
-                # skip 5 lines
-                for N in range(5):
-                    line = next(incoming, None)
-                # Count lines until the end of the table is printed
-                atomcount = 0
-                while '------------' not in line:
-                    atomcount += 1
-                    line = next(incoming, None)
-
-            if reg_match.SNO_flag:
-                # skip 5 lines
-                for N in range(5):
-                    line = next(incoming, None)
-                # Count lines until the end of the table is printed
-                atomcount = 0
-                while '------------' not in line:
-                    atomcount += 1
-                    line = next(incoming, None)
-
-            # Figure out which coupling is being printed
-            if reg_match.deriv_flag:
-                # skip the flag line and next 2
-                for N in range(3):
-                    line = next(incoming, None)
-                # Once at gradient itself, capture the next natom lines
-                for i in range(atomcount):
-                    vector = np.append(vector, [np.array(line.split()[2:], dtype=float)], axis=0)
-                    line = next(incoming, None)
-
-            # End of regex
-            line = next(incoming, None)
+    with map_output(file) as mapped:
+        if steps == 'last':
+            deriv_positions = [mapped.rfind(_G09_deriv_flag)]
+            if deriv_positions[0] == -1:
+                raise ValueError('No forces found in {}'.format(file))
+        else:
+            # Use the sidecar index if there is one
+            deriv_positions = parseINDEX.offsets(file, _G09_deriv_flag.decode())
+            if deriv_positions is None:
+                deriv_positions = _find_all(mapped, _G09_deriv_flag)
+            if not deriv_positions:
+                raise ValueError('No forces found in {}'.format(file))
+
+        # Orientation printed multiple times. Always use the last one before the (first) gradient
+        orient_position = max(mapped.rfind(_G09_nuclei_flag_SNO, 0, deriv_positions[0]),
+                              mapped.rfind(_G09_nuclei_flag_INP, 0, deriv_positions[0]))
+        if orient_position == -1:
+            raise ValueError('No orientation found before the forces in {}'.format(file))
+        atomcount = _count_table_rows(mapped, orient_position, 5)
+
+        vector = np.empty([len(deriv_positions), atomcount, 3])
+        for step, position in enumerate(deriv_positions):
+            # skip the flag line and next 2 then capture the next natom lines
+            vector[step] = read_block(_table_lines(mapped, position, 3, atomcount), atomcount, slice(2, 5))
 
     # Gradient = -Force
     GRADVEC = -vector
 
+    if steps == 'last':
+        GRADVEC = GRADVEC[0]
+    elif steps is None:
+        GRADVEC = GRADVEC.reshape(-1, 3)
+
     return GRADVEC
 
 
-class _G09_GRAD_reg:
-    """ Regex for Gaussian 09 gradients """
-    _reg_nuclei_flag_SNO = re.compile(r'.*Standard orientation:.*')
-    _reg_nuclei_flag_INP = re.compile(r'.*Input orientation:.*')
-    _reg_deriv_flag = re.compile(r'.*Forces \(Hartrees/Bohr.*')
+@cached
+def hpmodes(file):
+    """
+    Parse a Gaussian 09 frequency calculation run with freq=hpmodes and recover the high-precision normal modes in one pass
+
+    returns a dictionary, with keys following cclib, containing
+        vibfreqs : frequencies in cm-1
+        vibrmasses : reduced masses in amu
+        vibfconsts : force constants in mDyne/A
+        vibirs : IR intensities in km/mol
+        vibramans : Raman activities in A^4/amu (only if calculated)
+        vibdisps : the (Frobenius) normalized cartesian displacements, as an (nmodes, natom, 3) array. These are not
+                   mass-weighted, divide by the square root of vibrmasses for the mass-weighted normal coordinates
+    """
+    labels = OrderedDict()
+    displacements = []
+    # Only the lines containing the triggers are read if the output has a sidecar index, see parseINDEX
+    positions = parseINDEX.trigger_offsets(file, _G09_HPMODES_lines.literals)
+    with open_output(file, 'r' if positions is None else 'rb') as incoming:
+        for line, following in parseINDEX.sections(incoming, positions):
+            flag = _G09_HPMODES_lines.classify(line)
+
+            # Number of atoms needed later on
+            if flag == 'natom':
+                atomcount = int(line.split('NAtoms=')[1].split()[0])
+
+            # The high-precision blocks (up to 5 modes each) start with 'Frequencies ---'
+            if flag == 'freqs':
+                nmodes = len(line.split('---')[1].split())
+                while 'Coord Atom Element:' not in line:
+                    label, values = line.split('---')
+                    labels.setdefault(label.strip(), []).extend(values.split())
+                    line = next(following)
+                # 3 * natom rows of coordinate, atom, element then one column per mode
+                block = read_block(following, 3 * atomcount, slice(3, 3 + nmodes))
+                displacements.append(block.reshape(atomcount, 3, nmodes).transpose(2, 0, 1))
+
+    if not displacements:
+        raise ValueError('No freq=hpmodes normal modes found in {}'.format(file))
+
+    HPMODES = OrderedDict()
+    for label, key in _G09_HPMODES_labels.items():
+        if label in labels:
+            HPMODES[key] = np.array(labels[label], dtype=float)
+    HPMODES['vibdisps'] = np.concatenate(displacements)
+
+    return HPMODES
+
+
+def write_hpmodes(HPMODES, basename):
+    """
+    Write the output of hpmodes to <basename>.hpmodes.npz, with the displacements also written separately
+    to <basename>.vibdisps.npy so that they can be memory-mapped (see load_hpmodes)
+    """
+    np.save('{}.vibdisps.npy'.format(basename), HPMODES['vibdisps'])
+    np.savez('{}.hpmodes.npz'.format(basename), **HPMODES)
+
+
+def load_hpmodes(basename, mmap_mode='r'):
+    """
+    Read normal modes written by write_hpmodes
+
+    mmap_mode is passed to np.load for the displacements, use None to read them into memory
+
+    returns a dictionary as from hpmodes
+    """
+    HPMODES = OrderedDict()
+    with np.load('{}.hpmodes.npz'.format(basename)) as stored:
+        for key in stored.files:
+            if key != 'vibdisps':
+                HPMODES[key] = stored[key]
+    HPMODES['vibdisps'] = np.load('{}.vibdisps.npy'.format(basename), mmap_mode=mmap_mode)
+    return HPMODES
+
+
+_G09_HPMODES_lines = LineClassifier([
+    ('natom', 'NAtoms='),
+    ('freqs', 'Frequencies ---')])
+_G09_HPMODES_labels = OrderedDict([('Frequencies', 'vibfreqs'), ('Reduced masses', 'vibrmasses'),
+                                   ('Force constants', 'vibfconsts'), ('IR Intensities', 'vibirs'),
+                                   ('Raman Activities', 'vibramans')])
+
+
+_G09_nuclei_flag_SNO = b'Standard orientation:'
+_G09_nuclei_flag_INP = b'Input orientation:'
+_G09_deriv_flag = b'Forces (Hartrees/Bohr)'
+
+
+def _find_all(mapped, flag):
+    """ Byte offsets of every occurrence of flag in a mapped file """
+    positions = []
+    position = mapped.find(flag)
+    while position != -1:
+        positions.append(position)
+        position = mapped.find(flag, position + len(flag))
+    return positions
+
+
+def _skip_lines(mapped, position, nlines):
+    """ Byte offset of the start of the line nlines after the one containing position """
+    for N in range(nlines):
+        position = mapped.find(b'\n', position) + 1
+    return position
+
+
+def _table_lines(mapped, position, skip, nlines):
+    """ The nlines lines of a table, starting skip lines after the one containing position, as bytes """
+    start = _skip_lines(mapped, position, skip)
+    end = _skip_lines(mapped, start, nlines)
+    return mapped[start:end]
 
-    __slots__ = ['SNO_flag', 'INPO_flag', 'deriv_flag']
 
-    def __init__(self, line):
-        self.INPO_flag = self._reg_nuclei_flag_INP.match(line)
-        self.SNO_flag = self._reg_nuclei_flag_SNO.match(line)
-        self.deriv_flag = self._reg_deriv_flag.match(line)
+def _count_table_rows(mapped, position, skip):
+    """ Count lines from skip lines after position until the end of the table is printed """
+    start = _skip_lines(mapped, position, skip)
+    end = mapped.find(b'------------', start)
+    return mapped[start:end].count(b'\n')
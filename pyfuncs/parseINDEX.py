@@ -0,0 +1,196 @@
+import os
+import re
+import json
+from parseFUNCS import map_output
+
+
+'''
+
+parseINDEX records where the sections of interest start in an output file, so that the parsers can seek straight to them
+
+A single scan finds every known section header for Gaussian 09, Q-Chem 4.4/5.0, Turbomole and ORCA and records the
+byte offset and line number of the start of each line containing one. The index is kept in a small sidecar file,
+<output>.sections.json, next to the output and is thrown away if the output changes size or modification time.
+
+Indexing is opt-in: sidecars are only written by build(), or by the parsers when indexing has been switched on
+with enable() or the CHEMSCRIPTS_INDEX environment variable. Existing sidecars are always used.
+
+parseQCHEM.gradient and parseGAUSSIAN.gradient (every step) seek to the blocks they need. The single-pass parsers
+(parseQCHEM.couplings and diabatisation, parseGAUSSIAN.hpmodes, parseTURBO.escf and atomcoords, parseORCA.SOCME) only
+read the lines containing their triggers, see sections(), skipping everything in between. A parser falls back to
+reading the whole output when there is no up to date index.
+
+'''
+
+# Section headers, grouped by the program printing them: the blocks the gradient parsers seek to and every trigger
+# of the single-pass parsers
+headers = {
+    'G09': ['Standard orientation:', 'Input orientation:', 'Forces (Hartrees/Bohr)', 'NAtoms=', 'Frequencies ---'],
+    'QCHEM': ['Standard Nuclear Orientation', 'between states', 'Total energy for state',
+              'total gradient after adding PCM contribution', 'CIS derivative coupling with ETF',
+              'cis_triplets', 'cis_der_numstate', '$derivative_coupling', 'Localization Code for CIS', '_cis_numstate',
+              'cis_n_roots', 'Convergence criterion met', 'final adiabatic', 'showmatrix adiabatH', 'showmatrix diabatH',
+              'Excited-State Multipoles, State'],
+    'TURBO': ['atomic coordinates', 'Total energy:', 'Excitation energy / cm^(-1):', 'velocity representation:',
+              'length representation:', 'mixed representation:', 'Two-component modus switched on ! '],
+    'ORCA': ['Number of roots to be determined', 'CALCULATED SOCME BETWEEN TRIPLETS AND SINGLET',
+             'ABSORPTION SPECTRUM VIA TRANSITION VELOCITY DIPOLE MOMENT'],
+}
+# Headers which the parsers match in any case (e.g. $rem variables), so are indexed in any case
+_ignorecase = ['cis_triplets', 'cis_der_numstate', '$derivative_coupling', 'Localization Code for CIS']
+
+_all_headers = [header for program in headers.values() for header in program]
+# One named group per header, so that a match made in any case is still recorded under its header
+_reg_headers = re.compile('|'.join(('(?P<h{}>(?i:{}))' if header in _ignorecase else '(?P<h{}>{})').format(number, re.escape(header))
+                                   for number, header in enumerate(_all_headers)).encode())
+_settings = {'enabled': None}
+
+
+def enable():
+    '''
+    Let the parsers build and write sidecar indices for outputs that do not have one yet
+    '''
+    _settings['enabled'] = True
+
+
+def disable():
+    '''
+    Stop the parsers from writing new sidecar indices. Existing ones are still used.
+    '''
+    _settings['enabled'] = False
+
+
+def _enabled():
+    if _settings['enabled'] is None:
+        return bool(os.environ.get('CHEMSCRIPTS_INDEX'))
+    return _settings['enabled']
+
+
+def sidecar(file):
+    '''
+    returns the name of the sidecar index for file
+    '''
+    return '{}.sections.json'.format(file)
+
+
+def scan(file):
+    '''
+    Scan an output once for every known section header
+
+    returns a dictionary of header: list of (byte offset, line number) of the lines containing that header,
+    line numbers counting from 0
+    '''
+    sections = {header: [] for header in _all_headers}
+    with map_output(file) as mapped:
+        line_number = 0
+        counted_to = 0
+        for match in _reg_headers.finditer(mapped):
+            line_start = mapped.rfind(b'\n', 0, match.start()) + 1
+            line_number += mapped[counted_to:line_start].count(b'\n')
+            counted_to = line_start
+            entry = (line_start, line_number)
+            section = sections[_all_headers[int(match.lastgroup[1:])]]
+            # A header appearing twice on the same line is only recorded once
+            if not section or section[-1] != entry:
+                section.append(entry)
+    return sections
+
+
+def build(file):
+    '''
+    Scan an output and write its sidecar index
+
+    returns the index, as from scan()
+    '''
+    filestat = os.stat(file)
+    sections = scan(file)
+    stored = {'size': filestat.st_size, 'mtime_ns': filestat.st_mtime_ns, 'sections': sections}
+    try:
+        with open(sidecar(file), 'w') as outgoing:
+            json.dump(stored, outgoing)
+    except OSError:
+        # e.g. read-only archive, the index is still returned
+        pass
+    return sections
+
+
+def load(file):
+    '''
+    Read the sidecar index of an output, if it exists and is up to date
+
+    returns the index, as from scan(), or None
+    '''
+    try:
+        with open(sidecar(file), 'r') as incoming:
+            stored = json.load(incoming)
+    except (OSError, ValueError):
+        return None
+    filestat = os.stat(file)
+    if stored.get('size') != filestat.st_size or stored.get('mtime_ns') != filestat.st_mtime_ns:
+        return None
+    # Written for a different set of headers
+    if sorted(stored.get('sections', {})) != sorted(_all_headers):
+        return None
+    return {header: [tuple(entry) for entry in entries] for header, entries in stored['sections'].items()}
+
+
+def _sections(file):
+    # The index of file, built if there is none and indexing is switched on, or None
+    sections = load(file)
+    if sections is None and _enabled():
+        sections = build(file)
+    return sections
+
+
+def offsets(file, header):
+    '''
+    Byte offsets of the lines of file containing header, for parsers to seek to
+
+    returns a list of offsets, or None if there is no index for the file (and indexing is switched off),
+    in which case the parser should fall back to scanning the file itself
+    '''
+    if header not in _all_headers:
+        raise KeyError('{} is not an indexed section header'.format(header))
+    sections = _sections(file)
+    if sections is None:
+        return None
+    return [offset for offset, line_number in sections[header]]
+
+
+def trigger_offsets(file, triggers):
+    '''
+    Byte offsets of the lines of file containing any of triggers (e.g. the literals of a parser's LineClassifier)
+
+    returns a sorted list of offsets, or None if there is no index for the file or it lists none of them,
+    in which case the parser should read the whole file (see sections)
+    '''
+    missing = [trigger for trigger in triggers if trigger not in _all_headers]
+    if missing:
+        raise KeyError('{} are not indexed section headers'.format(', '.join(missing)))
+    sections = _sections(file)
+    if sections is None:
+        return None
+    return sorted(set(offset for trigger in triggers for offset, line_number in sections[trigger])) or None
+
+
+def sections(incoming, positions):
+    '''
+    Iterate over the lines of an output that a single-pass parser acts on
+
+    incoming is the output opened with open_output, in text mode if positions is None, when every line is read, or in
+    binary mode for positions from trigger_offsets, when only the lines at those offsets are read. As every line the
+    parser acts on contains one of its triggers, both give the same result.
+
+    yields each line (str) and an iterator over the lines that follow it, which the parser may advance to read the
+    block under it. Lines it consumes this way are not yielded again, as when reading every line.
+    '''
+    if positions is None:
+        for line in incoming:
+            yield line, incoming
+        return
+    following = (line.decode() for line in iter(incoming.readline, b''))
+    for position in positions:
+        if position < incoming.tell():
+            continue
+        incoming.seek(position)
+        yield next(following), following
@@ -1,5 +1,10 @@
 import numpy as np
 import re
+from itertools import islice
+from parseFUNCS import LineClassifier, read_block, open_output
+from parseCACHE import cached
+import parseINDEX
+from batchFUNCS import batch_parse
 
 
 '''
@@ -7,6 +12,7 @@ parseORCA provides some additional functionality to, and is meant to work in con
 '''
 
 
+@cached
 def SOCME(file):
     """
     Parse an ORCA 4.1.0 file and recover SOC Matrix Elements from a CIS/TDA or RPA calculation
@@ -19,61 +25,35 @@ def SOCME(file):
         f_S, f_T : oscillator strengths of transitions to singlet or triplet states (0 by definition for triplets)
     """
 
-    with open(file, 'r') as incoming:
-        line = next(incoming)
-
-        while line:
-            reg_match = _ORCA4100_SOCME_reg(line)
-            if reg_match.NROOTS_flag:
+    # Only the lines containing the triggers are read if the output has a sidecar index, see parseINDEX
+    positions = parseINDEX.trigger_offsets(file, _ORCA4100_SOCME_lines.literals)
+    with open_output(file, 'r' if positions is None else 'rb') as incoming:
+        for line, following in parseINDEX.sections(incoming, positions):
+            flag = _ORCA4100_SOCME_lines.classify(line)
+            if flag == 'NROOTS':
                 nroots = int(line.split()[-1])
-                line_count = (nroots + 1) * nroots
-                SOCME_mag = np.zeros([nroots,nroots + 1], dtype=np.float_)
-                SOCME_x = np.zeros([nroots,nroots + 1], dtype=np.complex_)
-                SOCME_y = np.zeros([nroots,nroots + 1], dtype=np.complex_)
-                SOCME_z = np.zeros([nroots,nroots + 1], dtype=np.complex_)
-            if reg_match.SOCME_flag:
-                # Skip some lines following match
-                for N in range(5):
-                    line = next(incoming, None)
-                lines_done = 0
-                while lines_done < line_count:
-                    current_triplet = np.floor_divide(lines_done, nroots + 1)
-                    current_singlet = np.mod(lines_done, nroots + 1)
-                    soc_line = line.split()
-                    socme_X = np.complex(np.float(soc_line[8]), np.float(soc_line[10]))
-                    socme_Y = np.complex(np.float(soc_line[13]), np.float(soc_line[15]))
-                    socme_Z = np.complex(np.float(soc_line[3]), np.float(soc_line[5]))
-                    socme_mag = np.real(np.linalg.norm([socme_X, socme_Y, socme_Z]))
-                    # print('{}, {}: {}, {}, {}, {}'.format(current_triplet, current_singlet, socme_X, socme_Y, socme_Z, socme_mag))
-                    SOCME_x[current_triplet, current_singlet] = socme_X
-                    SOCME_y[current_triplet, current_singlet] = socme_Y
-                    SOCME_z[current_triplet, current_singlet] = socme_Z
-                    SOCME_mag[current_triplet, current_singlet] = socme_mag
-                    line = next(incoming, None)
-                    lines_done += 1
-            if reg_match.SF_states_flag:
-                line = next(incoming, None)
-                E_S = np.zeros(nroots)
-                E_T = np.zeros(nroots)
-                f_S = np.zeros(nroots)
+            if flag == 'SOCME':
                 # Skip some lines following match
                 for N in range(4):
-                    line = next(incoming, None)
-                lines_done = 0
-                while lines_done < nroots:
-                    singlets_line = line.split()
-                    E_S[lines_done] = singlets_line[1]
-                    f_S[lines_done] = singlets_line[3]
-                    line = next(incoming, None)
-                    lines_done += 1
-                lines_done = 0
-                while lines_done < nroots:
-                    triplets_line = line.split()
-                    E_T[lines_done] = triplets_line[1]
-                    line = next(incoming, None)
-                    lines_done += 1
-            # End of regex
-            line = next(incoming, None)
+                    line = next(following, None)
+                # One row per (triplet, singlet) pair, singlets varying fastest, including the ground state.
+                # Once the brackets and commas are dropped each row is T, S, Re Z, Im Z, Re X, Im X, Re Y, Im Y
+                block = ''.join(islice(following, (nroots + 1) * nroots)).translate(_SOCME_brackets)
+                socme = np.array(block.split(), dtype=float).reshape(nroots, nroots + 1, 8)
+                SOCME_z = socme[:, :, 2] + 1j * socme[:, :, 3]
+                SOCME_x = socme[:, :, 4] + 1j * socme[:, :, 5]
+                SOCME_y = socme[:, :, 6] + 1j * socme[:, :, 7]
+                SOCME_mag = np.sqrt(np.abs(SOCME_x)**2 + np.abs(SOCME_y)**2 + np.abs(SOCME_z)**2)
+            if flag == 'SF_states':
+                line = next(following, None)
+                # Skip some lines following match
+                for N in range(3):
+                    line = next(following, None)
+                # Singlets are printed first, then triplets
+                states = read_block(following, 2 * nroots, [1, 3])
+                E_S = states[:nroots, 0]
+                f_S = states[:nroots, 1]
+                E_T = states[nroots:, 0]
 
     SOCME = {}
     SOCME['x'] = SOCME_x
@@ -87,16 +67,28 @@ def SOCME(file):
 
     return SOCME
 
-class _ORCA4100_SOCME_reg:
-    """ Regex for Gaussian 09 gradients """
-    _reg_NROOTS_flag = re.compile(r'.*Number of roots to be determined.*')
-    _reg_SOCME_flag = re.compile(r'.*CALCULATED SOCME BETWEEN TRIPLETS AND SINGLETS*')
-    _reg_SF_states_flag = re.compile(r'\s\s+ABSORPTION SPECTRUM VIA TRANSITION VELOCITY DIPOLE MOMENTS*')
 
-    __slots__ = ['NROOTS_flag', 'SOCME_flag', 'SF_states_flag']
+def stack_SOCME(files, workers=1):
+    """
+    Parse SOC Matrix Elements from many ORCA 4.1.0 files, e.g. the geometries of a scan, and stack them
+
+    all files must have the same number of roots
+    workers is the number of processes used for parsing (see batchFUNCS.batch_parse)
+
+    returns a dictionary with the same keys as SOCME, each array having an extra leading axis over the files,
+    i.e. x, y, z and mag have shape (ngeom, nT, nS + 1)
+    """
+    results, errors = batch_parse(files, SOCME, workers=workers, progress=False)
+    if errors:
+        raise ValueError('Could not parse SOCMEs from: {}'.format(', '.join(errors)))
+    stacked = {key: np.stack([result[key] for result in results]) for key in results[0]}
+    return stacked
+
+
+_SOCME_brackets = str.maketrans('(),', '   ')
 
-    def __init__(self, line):
-        self.NROOTS_flag = self._reg_NROOTS_flag.match(line)
-        self.SOCME_flag = self._reg_SOCME_flag.match(line)
-        self.SF_states_flag = self._reg_SF_states_flag.match(line)
 
+_ORCA4100_SOCME_lines = LineClassifier([
+    ('NROOTS', 'Number of roots to be determined'),
+    ('SOCME', 'CALCULATED SOCME BETWEEN TRIPLETS AND SINGLET'),
+    ('SF_states', 'ABSORPTION SPECTRUM VIA TRANSITION VELOCITY DIPOLE MOMENT', re.compile(r'^\s\s+ABSORPTION SPECTRUM VIA TRANSITION VELOCITY DIPOLE MOMENT'))])
@@ -0,0 +1,66 @@
+import os
+import numpy as np
+from parseFUNCS import cmtoeV
+
+
+'''
+
+parsePYSOC reads the output of pysoc calculations (ene_out.dat and soc_out.dat) and calculates the mixing parameters
+between singlets and triplets from 2nd order perturbation theory, lambda = (SOC / delta E)**2, for all of the states
+of any number of geometries at once
+
+'''
+
+
+def load(directory='.'):
+    '''
+    Read ene_out.dat and soc_out.dat from a pysoc calculation, each in one go
+
+    returns a dictionary of
+        'singlets', 'triplets' : excited state energies in eV, S1 and T1 first
+        'soc' : (nsinglets + 1, ntriplets) array of the spin-orbit coupling in eV between S0, S1, ... and T1, T2, ...
+    '''
+    PYSOC = {}
+    energies = np.genfromtxt(os.path.join(directory, 'ene_out.dat'))[:, 1:]
+    PYSOC['singlets'] = energies[0]
+    PYSOC['triplets'] = energies[1]
+    soc = cmtoeV(np.atleast_1d(np.genfromtxt(os.path.join(directory, 'soc_out.dat'), usecols=3)))
+    ntriplets = len(PYSOC['triplets'])
+    if soc.size % ntriplets != 0:
+        raise ValueError('soc_out.dat in {} does not match the {} triplets of ene_out.dat'.format(directory, ntriplets))
+    PYSOC['soc'] = soc.reshape(-1, ntriplets)
+    return PYSOC
+
+
+def lambdas(PYSOC):
+    '''
+    Mixing parameters between every excited singlet and triplet, lambda = (SOC / delta E)**2
+
+    returns an (nsinglets, ntriplets) array, with S1-T1 at [0, 0]
+    '''
+    deltaE = np.abs(PYSOC['singlets'][:, np.newaxis] - PYSOC['triplets'])
+    mixing = (PYSOC['soc'][1:len(PYSOC['singlets']) + 1] / deltaE)**2
+    return mixing
+
+
+def stack_lambdas(directories):
+    '''
+    Mixing parameters for many geometries, each in its own directory
+
+    returns an (ngeom, nsinglets, ntriplets) array
+    '''
+    stacked = np.stack([lambdas(load(directory)) for directory in directories])
+    return stacked
+
+
+def significant(mixing, threshold=0.0):
+    '''
+    Find the mixing parameters above threshold, for a single geometry or a stack
+
+    returns an array of the indices of the entries above threshold, one row each with the state numbers counting from 1
+    (and the geometry counting from 0 for a stack), and an array of their values
+    '''
+    indices = np.argwhere(mixing > threshold)
+    values = mixing[tuple(indices.T)]
+    indices[:, -2:] += 1
+    return indices, values
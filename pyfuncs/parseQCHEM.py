@@ -1,7 +1,10 @@
 import numpy as np
 import re
 from collections import OrderedDict
+from itertools import islice
 from parseFUNCS import *
+from parseCACHE import cached
+import parseINDEX
 
 
 '''
@@ -26,98 +29,129 @@ def NACV(file):
     EXTRAS['state_energies'] = list of state energies
     EXTRAS['deltaE_Mi-to-Mj'] = set delta E values in case of later need
     """
+    COUPLINGS = couplings(file)
     NACVS = OrderedDict()
     EXTRAS = OrderedDict()
-    EXTRAS['state_energies'] = []
-    # defaults
-    EXTRAS['calc_mult'] = 'S'
-    with open(file, 'r') as incoming:
-        line = next(incoming)
+    EXTRAS['state_energies'] = COUPLINGS['state_energies'].tolist()
+    for key in ['calc_mult', 'calc_numstate', 'calc_states', 'natom']:
+        if key in COUPLINGS:
+            EXTRAS[key] = COUPLINGS[key]
+    for pair, (state_i, state_j) in enumerate(COUPLINGS['pairs']):
+        NACV_key = '{0}{1}-to-{0}{2}'.format(COUPLINGS['calc_mult'], state_i, state_j)
+        EXTRAS['deltaE_{}'.format(NACV_key)] = float(COUPLINGS['deltaE'][pair])
+        NACVS[NACV_key] = COUPLINGS['NACVwithETF'][pair]
 
-        while line:
-            reg_match = _QC_NACV_reg(line)
+    return NACVS, EXTRAS
+
+
+@cached
+def couplings(file):
+    """
+    Parse a Qchem 4.4 or 5.0 file and recover the couplings between every pair of states in a single pass
+
+    The couplings are packed in upper-triangular order, i.e. pairs (1, 2), (1, 3), ... (2, 3), ...,
+    into arrays of shape (npairs, natom, 3)
+
+    returns a dictionary containing
+        'DCnoETF' : derivative couplings, d_ij = <Psi_i|d/dR|Psi_j>, without the electron-translation factor
+        'NACV' : NACVs, h_ij = <Psi_i|dH/dR|Psi_j>, as printed (low precision, printed to 6 d.p.)
+        'DCwithETF' : derivative couplings including the electron-translation factor, see J. Chem. Phys., 2011, 135, 234105
+        'NACVwithETF' : NACVs recovered from DCwithETF * delta E_ij, in hartrees bohr-1 (this is what NACV returns)
+        'pairs' : (npairs, 2) array of the state numbers of each pair
+        'pair_index' : array such that pair_index[i, j] is the index of the pair of states i and j in the packed arrays,
+                       for both i < j and i > j, and -1 if no coupling between them was calculated
+        'state_energies' : array of the state energies, state 1 first
+        'deltaE' : array of E_j - E_i for each pair
+        'natom', 'calc_mult' and, if given in the input, 'calc_numstate' and 'calc_states', as for NACV
+    """
+    COUPLINGS = OrderedDict()
+    COUPLINGS['calc_mult'] = 'S'
+    state_energies = []
+    pairs = []
+    blocks = {'DCnoETF': [], 'NACV': [], 'DCwithETF': []}
+    # Only the lines containing the triggers are read if the output has a sidecar index, see parseINDEX
+    positions = parseINDEX.trigger_offsets(file, _QC_NACV_lines.literals)
+    with open_output(file, 'r' if positions is None else 'rb') as incoming:
+        for line, following in parseINDEX.sections(incoming, positions):
+            flag = _QC_NACV_lines.classify(line)
 
             # If not a triplet, then singlet
-            if reg_match.triplet:
-                EXTRAS['calc_mult'] = 'T'
+            if flag == 'triplet':
+                COUPLINGS['calc_mult'] = 'T'
 
             # Number of states NACV is calculated for
-            if reg_match.num_state:
-                EXTRAS['calc_numstate'] = reg_match.num_state.group().split()[1]
+            if flag == 'num_state':
+                COUPLINGS['calc_numstate'] = line.split()[1]
 
             # The states between which NACVs are calculated
-            if reg_match.states:
-                line = next(incoming, None)
-                line = next(incoming, None)
+            if flag == 'states':
+                line = next(following, None)
+                line = next(following, None)
                 state_string = re.search(r'^[^!]*', line)
-                EXTRAS['calc_states'] = np.array([int(i) for i in state_string.group().split()])
+                COUPLINGS['calc_states'] = np.array([int(i) for i in state_string.group().split()])
 
             # Get the state energies so can divide derivative coupling with ETF by delta Eij later
-            if reg_match.state_energy:
+            if flag == 'state_energy':
                 energy = re.findall(r'[+-][0-9]*[.][0-9]+', line)[0]
-                EXTRAS['state_energies'].append(float(energy))
+                state_energies.append(float(energy))
 
             # Number of atoms needed later on
-            if reg_match.SNO_flag:
-                line = next(incoming, None)
-                line = next(incoming, None)
-                line = next(incoming, None)
+            if flag == 'SNO':
+                line = next(following, None)
+                line = next(following, None)
+                line = next(following, None)
                 atomcount = 0
                 while '------------' not in line:
                     atomcount += 1
-                    line = next(incoming, None)
-                EXTRAS['natom'] = atomcount
-
-            # Figure out which coupling is being printed
-            if reg_match.coupling_flag:
-                state_i, state_j = re.findall('[0-9]+', line)
-                NACV_key = '{0}{1}-to-{0}{2}'.format(EXTRAS['calc_mult'], state_i, state_j)
-                vector = np.array([]).reshape(0, 3)
-                # Loop through the until derivative coupling with ETF is printed
-                while True:
-                    line = next(incoming, None)
-                    # Once at derivative coupling with ETF, skip through header then get next natoms lines and keep only the vector part
-                    if re.search(r'.*CIS derivative coupling with ETF.*', line):
-                        line = next(incoming, None)
-                        line = next(incoming, None)
-                        line = next(incoming, None)
-                        for i in range(EXTRAS['natom']):
-                            vector = np.append(vector, [np.array(line.split()[1:], dtype=float)], axis=0)
-                            line = next(incoming, None)
-                        break
-                # Figure out delta Eij and keep
-                delta_E = EXTRAS['state_energies'][int(state_j) - 1] - EXTRAS['state_energies'][int(state_i) - 1]
-                EXTRAS['deltaE_{}'.format(NACV_key)] = delta_E
-                # Multiply the DCwithETF by delta Eij to get NACV rather than derivative coupling
-                vector = np.multiply(vector, delta_E)
-                NACVS[NACV_key] = vector
-
-            # End of regex
-            line = next(incoming, None)
-
-    return NACVS, EXTRAS
-
-
-class _QC_NACV_reg:
-    """ Regex for Qchem 4.4 & 5.0 NACVs """
-    _reg_triplet = re.compile(r'cis_triplets.*true', re.IGNORECASE)
-    _reg_numstate = re.compile(r'cis_der_numstate.*', re.IGNORECASE)
-    _reg_states = re.compile(r'\$derivative_coupling', re.IGNORECASE)
-    _reg_coupling_flag = re.compile(r'.*between states.*')
-    _reg_state_energy = re.compile(r'.*Total energy for state.*')
-    _reg_nuclei_flag = re.compile(r'.*Standard Nuclear Orientation.*')
-
-    __slots__ = ['triplet', 'num_state', 'states', 'coupling_flag', 'state_energy', 'SNO_flag']
-
-    def __init__(self, line):
-        self.triplet = self._reg_triplet.match(line)
-        self.num_state = self._reg_numstate.match(line)
-        self.states = self._reg_states.match(line)
-        self.coupling_flag = self._reg_coupling_flag.match(line)
-        self.state_energy = self._reg_state_energy.match(line)
-        self.SNO_flag = self._reg_nuclei_flag.match(line)
-
-
+                    line = next(following, None)
+                COUPLINGS['natom'] = atomcount
+
+            # All three couplings for this pair follow, each as a table of natom lines
+            if flag == 'coupling':
+                state_i, state_j = [int(i) for i in re.findall('[0-9]+', line)]
+                natom = COUPLINGS['natom']
+                pair_lines = list(islice(following, _QC_DC_rows['DCwithETF'] + natom * 3))
+                if 'with ETF' not in pair_lines[_QC_DC_rows['DCwithETF'] + natom * 2 - 3]:
+                    raise ValueError('Unexpected layout of the couplings between states {} and {} in {}'.format(state_i, state_j, file))
+                for kind, first_row in _QC_DC_rows.items():
+                    start = first_row + natom * list(_QC_DC_rows).index(kind)
+                    blocks[kind].append(read_block(pair_lines[start:start + natom], natom, slice(1, 4)))
+                pairs.append((state_i, state_j))
+
+    # Pack into upper-triangular order, whatever order the pairs were printed in
+    order = sorted(range(len(pairs)), key=lambda pair: sorted(pairs[pair]))
+    pairs = np.array([pairs[pair] for pair in order], dtype=int).reshape(-1, 2)
+    # A file with no couplings gives empty arrays, as NACV always has
+    natom = COUPLINGS.get('natom', 0)
+    for kind in blocks:
+        COUPLINGS[kind] = np.array([blocks[kind][pair] for pair in order]).reshape(len(order), natom, 3)
+    COUPLINGS['pairs'] = pairs
+    COUPLINGS['pair_index'] = np.full([pairs.max(initial=0) + 1] * 2, -1, dtype=int)
+    COUPLINGS['pair_index'][pairs[:, 0], pairs[:, 1]] = np.arange(len(pairs))
+    COUPLINGS['pair_index'][pairs[:, 1], pairs[:, 0]] = np.arange(len(pairs))
+    COUPLINGS['state_energies'] = np.array(state_energies)
+    # Figure out delta Eij and keep
+    COUPLINGS['deltaE'] = COUPLINGS['state_energies'][pairs[:, 1] - 1] - COUPLINGS['state_energies'][pairs[:, 0] - 1]
+    # Multiply the DCwithETF by delta Eij to get NACV rather than derivative coupling
+    COUPLINGS['NACVwithETF'] = COUPLINGS['DCwithETF'] * COUPLINGS['deltaE'][:, np.newaxis, np.newaxis]
+
+    return COUPLINGS
+
+
+# Line (after the 'between states' line) on which each coupling table starts, plus natom for each preceding table
+_QC_DC_rows = OrderedDict([('DCnoETF', 10), ('NACV', 15), ('DCwithETF', 20)])
+
+
+_QC_NACV_lines = LineClassifier([
+    ('triplet', 'cis_triplets', re.compile(r'^cis_triplets.*true', re.IGNORECASE)),
+    ('num_state', 'cis_der_numstate', re.compile(r'^cis_der_numstate', re.IGNORECASE)),
+    ('states', '$derivative_coupling', re.compile(r'^\$derivative_coupling', re.IGNORECASE)),
+    ('coupling', 'between states'),
+    ('state_energy', 'Total energy for state'),
+    ('SNO', 'Standard Nuclear Orientation')])
+
+
+@cached
 def gradient(file):
     """
     Parse a Qchem 4.4 or 5.0 file and recover gradient vector
@@ -125,16 +159,23 @@ def gradient(file):
     returns a numpy array containing the gradient vector
     """
 
-    vector = np.array([]).reshape(0, 3)
+    # Seek straight to the gradients if the file has a sidecar index listing them, otherwise scan the file
+    SNO_positions = parseINDEX.offsets(file, 'Standard Nuclear Orientation')
+    if SNO_positions:
+        deriv_positions = parseINDEX.offsets(file, 'total gradient after adding PCM contribution')
+        if deriv_positions:
+            return _indexed_gradient(file, SNO_positions, deriv_positions)
 
-    with open(file, 'r') as incoming:
+    vectors = []
+
+    with open_output(file) as incoming:
         line = next(incoming)
 
         while line:
-            reg_match = _QC_GRAD_reg(line)
+            flag = _QC_GRAD_lines.classify(line)
 
             # Number of atoms needed later on
-            if reg_match.SNO_flag:
+            if flag == 'SNO':
                 line = next(incoming, None)
                 line = next(incoming, None)
                 line = next(incoming, None)
@@ -144,33 +185,142 @@ def gradient(file):
                     line = next(incoming, None)
 
             # Figure out which coupling is being printed
-            if reg_match.deriv_flag:
+            if flag == 'deriv':
                 # skip the flag line and next 3
                 line = next(incoming, None)
                 line = next(incoming, None)
                 line = next(incoming, None)
-                line = next(incoming, None)
                 # Once at gradient itself, capture the next natom lines
-                for i in range(atomcount):
-                    vector = np.append(vector, [np.array(line.split()[1:], dtype=float)], axis=0)
-                    line = next(incoming, None)
+                vectors.append(read_block(incoming, atomcount, slice(1, 4)))
 
             # End of regex
             line = next(incoming, None)
 
     # For some reason, two gradients are printed. At this time not clear which is correct. Assuming the 2nd one.
-    GRADVEC = vector[atomcount:]
+    # An output with no gradient gives an empty array
+    GRADVEC = np.concatenate(vectors)[atomcount:] if vectors else np.empty((0, 3))
 
     return GRADVEC
 
 
-class _QC_GRAD_reg:
-    """ Regex for Qchem 4.4 & 5.0 gradients """
-    _reg_nuclei_flag = re.compile(r'.*Standard Nuclear Orientation.*')
-    _reg_deriv_flag = re.compile(r'.*total gradient after adding PCM contribution.*')
+def _indexed_gradient(file, SNO_positions, deriv_positions):
+    """ gradient, reading only the blocks listed in the sidecar index """
+    with open_output(file, 'rb') as incoming:
+        # Number of atoms from the orientation table: skip the flag line and next 2
+        incoming.seek(SNO_positions[0])
+        for N in range(3):
+            incoming.readline()
+        atomcount = 0
+        while b'------------' not in incoming.readline():
+            atomcount += 1
+        vectors = []
+        for position in deriv_positions:
+            # skip the flag line and next 3
+            incoming.seek(position)
+            for N in range(4):
+                incoming.readline()
+            vectors.append(read_block(incoming, atomcount, slice(1, 4)))
+
+    # As above, the 2nd of the two printed gradients is kept
+    GRADVEC = np.concatenate(vectors)[atomcount:]
+
+    return GRADVEC
 
-    __slots__ = ['SNO_flag', 'deriv_flag']
 
-    def __init__(self, line):
-        self.SNO_flag = self._reg_nuclei_flag.match(line)
-        self.deriv_flag = self._reg_deriv_flag.match(line)
+_QC_GRAD_lines = LineClassifier([
+    ('SNO', 'Standard Nuclear Orientation'),
+    ('deriv', 'total gradient after adding PCM contribution')])
+
+
+@cached
+def diabatisation(file):
+    """
+    Parse a Qchem 4.4 or 5.0 CIS/TDA diabatisation (Boys or ER localisation) in a single pass, recovering everything
+    the Qchem44-EXTRACT_Loewdin.sh, _diabat.sh, _adiabat.sh and _scf.sh scripts extracted with one grep, sed or awk
+    each
+
+    The matrices are arranged as in the .rotmat, .adiabmat and .diabmat files those scripts wrote, i.e. filled column
+    by column in the order the elements are printed
+
+    returns a dictionary containing
+        'scf' : the (last) converged SCF energy in hartree
+        'state_energies' : array of the total energies of the excited states, in the order printed
+        'excitations' : array of the excitation energies in hartree of states 1 to nroots (as .adiabex)
+        'rotation' : (nstates, nstates) adiabatic -> diabatic rotation matrix
+        'adiabatic_H' : (nstates, nstates) Hamiltonian of the adiabatic states
+        'diabatic_H' : (nstates, nstates) Hamiltonian of the diabatic states
+        'dipoles' : (nprinted, nroots) array of the total dipole moment of each excited state, one row each time the
+                    excited-state multipoles are printed
+        'nstates' : the number of states in the diabatisation
+        'nroots' : the number of excited states calculated
+    """
+    DIABAT = OrderedDict()
+    scf = []
+    energies = {}
+    dipoles = {}
+    matrices = {'rotation': [], 'adiabatic_H': [], 'diabatic_H': []}
+    localised = False
+    # Only the lines containing the triggers are read if the output has a sidecar index, see parseINDEX
+    positions = parseINDEX.trigger_offsets(file, _QC_DIABAT_lines.literals)
+    with open_output(file, 'r' if positions is None else 'rb') as incoming:
+        for line, following in parseINDEX.sections(incoming, positions):
+            flag = _QC_DIABAT_lines.classify(line)
+
+            if flag == 'localisation':
+                localised = True
+
+            # Number of states in the diabatisation, the last number on the line
+            if flag == 'num_state':
+                DIABAT['nstates'] = int(re.search(r'([0-9]+)[^0-9]*$', line).group(1))
+
+            if flag == 'n_roots':
+                DIABAT['nroots'] = int(line.split()[-1])
+
+            if flag == 'scf':
+                scf.append(float(line.split()[1]))
+
+            if flag == 'state_energy':
+                fields = line.split()
+                energies.setdefault(int(fields[4].rstrip(':')), []).append(float(fields[5]))
+
+            # Matrix elements are the last 14 characters of their lines
+            if flag in matrices:
+                matrices[flag].append(float(line.rstrip('\r\n')[-14:]))
+
+            # The total dipole moment is 6 lines below the header
+            if flag == 'multipoles':
+                state = int(line.split('State')[-1].split()[0])
+                dipole_line = list(islice(following, 6))[-1]
+                dipoles.setdefault(state, []).append(float(dipole_line.split()[1]))
+
+    if not localised:
+        raise ValueError('{} is not a CIS diabatisation calculation'.format(file))
+    if not scf:
+        raise ValueError('No converged SCF energy found in {}'.format(file))
+
+    DIABAT['scf'] = scf[-1]
+    DIABAT.setdefault('nroots', len(energies))
+    # State by state, as the awk loop of Qchem44-EXTRACT_adiabat.sh
+    DIABAT['state_energies'] = np.array([energy for state in sorted(energies) for energy in energies[state]])
+    DIABAT['excitations'] = np.array([energy for state in sorted(energies) if state <= DIABAT['nroots'] for energy in energies[state]]) - DIABAT['scf']
+    nstates = DIABAT.get('nstates', int(round(np.sqrt(len(matrices['diabatic_H'])))))
+    DIABAT['nstates'] = nstates
+    for key, elements in matrices.items():
+        # column fills the matrices column by column, keep the last if printed more than once
+        DIABAT[key] = np.array(elements[len(elements) - nstates**2:]).reshape(nstates, nstates, order='F')
+    nprinted = min([len(values) for values in dipoles.values()], default=0)
+    DIABAT['dipoles'] = np.array([[dipoles[state][printed] for state in sorted(dipoles)] for printed in range(nprinted)]).reshape(nprinted, len(dipoles))
+
+    return DIABAT
+
+
+_QC_DIABAT_lines = LineClassifier([
+    ('localisation', 'Localization Code for CIS', re.compile(r'Entering the .*Localization Code for CIS', re.IGNORECASE)),
+    ('num_state', '_cis_numstate'),
+    ('n_roots', 'cis_n_roots'),
+    ('scf', 'Convergence criterion met'),
+    ('state_energy', 'Total energy for state'),
+    ('rotation', 'final adiabatic', re.compile(r'final adiabatic\s*->\s*diabatic')),
+    ('adiabatic_H', 'showmatrix adiabatH'),
+    ('diabatic_H', 'showmatrix diabatH'),
+    ('multipoles', 'Excited-State Multipoles, State')])
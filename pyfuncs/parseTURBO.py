@@ -1,6 +1,11 @@
-from numpy import loadtxt, nan, array, append, float
+from numpy import loadtxt, nan, array, append
 from re import findall, compile
+from os import stat
+from os.path import abspath
+from functools import lru_cache
 from parseFUNCS import *
+from parseCACHE import cached
+import parseINDEX
 
 
 '''
@@ -12,6 +17,7 @@ It has been tested with Turbomole version 7.2.
 '''
 
 
+@cached
 def atomcoords(file):
     '''
     Extract atomic coordinates from a Turbomole calculation
@@ -21,33 +27,117 @@ def atomcoords(file):
     # Set up constants and arrays
     autoangstr = 0.529177
     rawmatched = []
-    finmatched = array([]).reshape(0, 3)
     found = False
-    # Read file and keep only lines that match coordinate lines
-    readfile = open(file)
-    for line in readfile:
-        if found is True:
-            if not line.strip() == '':
-                rawmatched = append(rawmatched, line)
-            else:
-                break
-        if "atomic coordinates" in line:
-            found = True
-    readfile.close()
+    # Read file and keep only lines that match coordinate lines, starting from the first header if it is indexed
+    positions = parseINDEX.offsets(file, 'atomic coordinates')
+    with open_output(file, 'r' if not positions else 'rb') as readfile:
+        lines = readfile
+        if positions:
+            readfile.seek(positions[0])
+            lines = (line.decode() for line in readfile)
+        for line in lines:
+            if found is True:
+                if not line.strip() == '':
+                    rawmatched.append(line)
+                else:
+                    break
+            if "atomic coordinates" in line:
+                found = True
     # Clear up the strings from these lines and create a numpy array analagous to the one from cclib
-    for line in rawmatched:
-        coordline = array(line.split()[0:3]).astype(float)
-        finmatched = append(finmatched, [coordline * autoangstr], axis=0)
+    finmatched = read_block(rawmatched, len(rawmatched), slice(0, 3)) * autoangstr
     return finmatched
 
 
+class EscfResult:
+    """
+    All quantities of interest from a Turbomole escf output, collected in a single pass over the file
+
+    The attributes mirror the module level accessors:
+        gsenergy, esenergies : ground and excited state absolute energies in hartrees
+        excitations : excitation energies in cm-1
+        twoC : whether the calculation is 2C or not
+        oscvelrep, osclenrep, oscmixrep : oscillator strengths in each representation
+        tauvelrep, taulenrep, taumixrep : radiative lifetimes in each representation (nan unless 2C)
+    """
+
+    def __init__(self, file):
+        self.__dict__.update(_escf_tables(file))
+
+
+_escf_keys = {'Total energy:': 'energy',
+              'Excitation energy / cm^(-1):': 'excitation',
+              'velocity representation:': 'vel',
+              'length representation:': 'len',
+              'mixed representation:': 'mix'}
+_escf_twoC_flag = 'Two-component modus switched on ! '
+
+
+@cached
+def _escf_tables(file):
+    '''
+    Single pass over an escf output
+
+    returns a dictionary of the EscfResult attributes
+    '''
+    raw = {key: [] for key in _escf_keys.values()}
+    tables = {'twoC': False}
+    # Only the lines containing the flags are read if the output has a sidecar index, see parseINDEX
+    positions = parseINDEX.trigger_offsets(file, [_escf_twoC_flag] + list(_escf_keys))
+    with open_output(file, 'r' if positions is None else 'rb') as incoming:
+        for line, following in parseINDEX.sections(incoming, positions):
+            if _escf_twoC_flag in line:
+                tables['twoC'] = True
+                continue
+            if ':' not in line:
+                continue
+            for flag, key in _escf_keys.items():
+                if flag in line:
+                    raw[key].append(line.split(flag, 1)[1])
+                    break
+
+    energies = loadtxt(raw['energy'], ndmin=1)
+    tables['gsenergy'] = energies[0]
+    tables['esenergies'] = energies[1:]
+    tables['excitations'] = loadtxt(raw['excitation'])
+    velocity = loadtxt(raw['vel'])
+    length = loadtxt(raw['len'])
+    mixed = loadtxt(raw['mix'])
+    # Oscillator strength, lifetime and rotatory strength blocks share the same labels,
+    # the number of blocks printed per state depends on whether the calculation is 2C
+    if tables['twoC']:
+        tables['oscvelrep'], tables['tauvelrep'] = velocity[0::3], velocity[1::3]
+        tables['osclenrep'], tables['taulenrep'] = length[0::3], length[1::3]
+        tables['oscmixrep'], tables['taumixrep'] = mixed[0::2], mixed[1::2]
+    else:
+        tables['oscvelrep'], tables['tauvelrep'] = velocity[0::2], nan
+        tables['osclenrep'], tables['taulenrep'] = length[0::2], nan
+        tables['oscmixrep'], tables['taumixrep'] = mixed[0::1], nan
+    return tables
+
+
+@lru_cache(maxsize=64)
+def _cached_escf(file, mtime, size):
+    return EscfResult(file)
+
+
+def escf(file):
+    '''
+    Parse an escf output once and keep the result, so that repeated calls for the same (unmodified) file do not reread it
+
+    returns an EscfResult
+    '''
+    filestat = stat(file)
+    escfresult = _cached_escf(abspath(file), filestat.st_mtime_ns, filestat.st_size)
+    return escfresult
+
+
 def gsenergy(file):
     '''
     Extract ground state energy in hartrees
 
-    returns a string
+    returns a float
     '''
-    gs = loadtxt(findall('(?<=Total energy\:).*', open(file).read()))[0]
+    gs = escf(file).gsenergy
     return gs
 
 
@@ -55,9 +145,9 @@ def esenergies(file):
     '''
     Extract excited state absolute energies in hartrees. This only works for escf calculatons.
 
-    returns an array of strings
+    returns an array of floats
     '''
-    es = loadtxt(findall('(?<=Total energy\:).*', open(file).read()))[1:]
+    es = escf(file).esenergies
     return es
 
 
@@ -65,9 +155,9 @@ def excitations(file):
     '''
     Extract excitation energies in cm-1. This only works for escf calculations.
 
-    returns an array of strings
+    returns an array of floats
     '''
-    excitations = loadtxt(findall('(?<=Excitation energy \/ cm\^\(-1\)\:).*', open(file).read()))
+    excitations = escf(file).excitations
     return excitations
 
 
@@ -77,170 +167,58 @@ def twoCcheck(file):
 
     returns boolean
     '''
-    istwoC = False
-    with open(file, 'r') as f:
-        for line in f.readlines():
-            if 'Two-component modus switched on ! ' in line:
-                istwoC = True
+    istwoC = escf(file).twoC
     return istwoC
 
 
-def _oneCoscvelrep(file):
-    '''
-    Extract oscillator strengths in velocity representation from non-2C escf calculation.
-
-    returns array of strings
-    '''
-    velrep = loadtxt(findall('(?<=velocity representation\:).*', open(file).read()))[0::2]
-    return velrep
-
-
-def _oneCosclenrep(file):
-    '''
-    Extract oscillator strengths in length representation from non-2C escf calculation.
-
-    returns array of strings
-    '''
-    lenrep = loadtxt(findall('(?<=length representation\:).*', open(file).read()))[0::2]
-    return lenrep
-
-
-def _oneCoscmixrep(file):
-    '''
-    Extract oscillator strengths in mixed representation from non-2C escf calculation.
-
-    returns array of strings
-    '''
-    mixedrep = loadtxt(findall('(?<=mixed representation\:).*', open(file).read()))[0::1]
-    return mixedrep
-
-
-def _twoCoscvelrep(file):
-    '''
-    Extract oscillator strengths in velocity representation from 2C escf calculation.
-
-    returns array of strings
-    '''
-    velrep = loadtxt(findall('(?<=velocity representation\:).*', open(file).read()))[0::3]
-    return velrep
-
-
-def _twoCosclenrep(file):
-    '''
-    Extract oscillator strengths in length representation from 2C escf calculation.
-
-    returns array of strings
-    '''
-    lenrep = loadtxt(findall('(?<=length representation\:).*', open(file).read()))[0::3]
-    return lenrep
-
-
-def _twoCoscmixrep(file):
-    '''
-    Extract oscillator strengths in mixed representation from 2C escf calculation.
-
-    returns array of strings
-    '''
-    mixedrep = loadtxt(findall('(?<=mixed representation\:).*', open(file).read()))[0::2]
-    return mixedrep
-
-
-def _twoCtauvelrep(file):
-    '''
-    Extract radiative lifetimes in velocity representation from 2C escf calculation.
-
-    returns array of strings
-    '''
-    velrep = loadtxt(findall('(?<=velocity representation\:).*', open(file).read()))[1::3]
-    return velrep
-
-
-def _twoCtaulenrep(file):
-    '''
-    Extract radiative lifetimes in length representation from 2C escf calculation.
-
-    returns array of strings
-    '''
-    lenrep = loadtxt(findall('(?<=length representation\:).*', open(file).read()))[1::3]
-    return lenrep
-
-
-def _twoCtaumixrep(file):
-    '''
-    Extract radiative lifetimes in mixed representation from 2C escf calculation.
-
-    returns array of strings
-    '''
-    mixedrep = loadtxt(findall('(?<=mixed representation\:).*', open(file).read()))[1::2]
-    return mixedrep
-
-
 def oscvelrep(file):
-    if twoCcheck(file):
-        velrep = _twoCoscvelrep(file)
-    else:
-        velrep = _oneCoscvelrep(file)
+    velrep = escf(file).oscvelrep
     return velrep
 
 
 def osclenrep(file):
-    if twoCcheck(file):
-        lenrep = _twoCosclenrep(file)
-    else:
-        lenrep = _oneCosclenrep(file)
+    lenrep = escf(file).osclenrep
     return lenrep
 
 
 def oscmixrep(file):
-    if twoCcheck(file):
-        mixrep = _twoCoscmixrep(file)
-    else:
-        mixrep = _oneCoscmixrep(file)
+    mixrep = escf(file).oscmixrep
     return mixrep
 
 
 def tauvelrep(file):
-    if twoCcheck(file):
-        velrep = _twoCtauvelrep(file)
-    else:
-        velrep = nan
+    velrep = escf(file).tauvelrep
     return velrep
 
 
 def taulenrep(file):
-    if twoCcheck(file):
-        lenrep = _twoCtaulenrep(file)
-    else:
-        lenrep = nan
+    lenrep = escf(file).taulenrep
     return lenrep
 
 
 def taumixrep(file):
-    if twoCcheck(file):
-        mixrep = _twoCtaumixrep(file)
-    else:
-        mixrep = nan
+    mixrep = escf(file).taumixrep
     return mixrep
 
 
 def ricc2etenergies(file):
-    raw = findall('\|      [0-9].[0-9][0-9][0-9][0-9][0-9] \|      [0-9].[0-9][0-9][0-9][0-9][0-9] \|', open(file).read())
+    raw = findall('\|      [0-9].[0-9][0-9][0-9][0-9][0-9] \|      [0-9].[0-9][0-9][0-9][0-9][0-9] \|', read_output(file))
     cleaned = [compile(r"\|").sub("", s) for s in raw]
     etenergies = eVtocm(loadtxt(cleaned)[:, 0])
     return etenergies
 
 
 def ricc2etosclenrep(file):
-    osc = loadtxt(findall('(?<=       oscillator strength \(length gauge\)   \:).*', open(file).read()))
+    osc = loadtxt(findall('(?<=       oscillator strength \(length gauge\)   \:).*', read_output(file)))
     return osc
 
 
 def ricc2etoscvelrep(file):
-    osc = loadtxt(findall('(?<=       oscillator strength \(velocity gauge\) \:).*', open(file).read()))
+    osc = loadtxt(findall('(?<=       oscillator strength \(velocity gauge\) \:).*', read_output(file)))
     return osc
 
 
 def ricc2etoscmixrep(file):
-    osc = loadtxt(findall('(?<=       oscillator strength \(mixed gauge\)    \:).*', open(file).read()))
+    osc = loadtxt(findall('(?<=       oscillator strength \(mixed gauge\)    \:).*', read_output(file)))
     return osc
 
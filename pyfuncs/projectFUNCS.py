@@ -0,0 +1,107 @@
+import numpy as np
+import parseFUNCS as pF
+
+
+'''
+
+projectFUNCS projects coupling vectors (NACVs, derivative couplings, gradient differences) onto vibrational normal modes,
+replacing NACV_proj.py, PROJ_FREQ-to-NACME.m and SCALE_PROJ.m
+
+Every pair of states is projected onto every mode at once: the normalised couplings are flattened into an (npairs, 3N)
+matrix, the modes into a (3N, nmodes) matrix, and all of the overlaps are one matrix product
+
+'''
+
+# Memory in bytes the atomwise projections may take at once, as lineshapes.broaden
+_project_memory = 64 * 1024**2
+
+
+def _signed(overlaps, couplings, modes, max_memory):
+    return overlaps
+
+
+def _absolute(overlaps, couplings, modes, max_memory):
+    return np.abs(overlaps)
+
+
+def _squared(overlaps, couplings, modes, max_memory):
+    return overlaps**2
+
+
+def _sqrt_absolute(overlaps, couplings, modes, max_memory):
+    # As PROJ_FREQ-to-NACME.m, sqrt(|trace(NACME' * mode)|)
+    return np.sqrt(np.abs(overlaps))
+
+
+def _atomwise(overlaps, couplings, modes, max_memory):
+    # As NACV_proj.py, the sum over atoms of the absolute value of the dot product of each atom's vectors
+    # This cannot be a matrix product, so it is done pair by pair over chunks of modes, each (modes, atoms) block
+    # taking no more than max_memory bytes
+    projections = np.empty((len(couplings), len(modes)))
+    chunk = max(1, int(max_memory // (8 * max(couplings.shape[1], 1))))
+    for pair, coupling in enumerate(couplings):
+        for start in range(0, len(modes), chunk):
+            atomwise = np.einsum('ai,mai->ma', coupling, modes[start:start + chunk])
+            projections[pair, start:start + chunk] = np.abs(atomwise).sum(axis=-1)
+    return projections
+
+
+_projection_kinds = {'signed': _signed, 'absolute': _absolute, 'squared': _squared,
+                     'sqrt': _sqrt_absolute, 'atomwise': _atomwise}
+
+
+def project(couplings, modes, kind='absolute', max_memory=_project_memory):
+    '''
+    Project every coupling vector onto every normal mode
+
+    couplings are shaped (npairs, natom, 3), e.g. from parseQCHEM.couplings, and are Frobenius normalised here
+    modes are shaped (nmodes, natom, 3), e.g. vibdisps from parseGAUSSIAN.hpmodes or the memory-mapped tensor from
+    parseGAUSSIAN.load_hpmodes
+    kind is
+        'signed': the overlap of the normalised coupling with the mode
+        'absolute': its absolute value
+        'squared': its square
+        'sqrt': the square root of its absolute value, as PROJ_FREQ-to-NACME.m
+        'atomwise': the sum over atoms of the absolute values of the atomic dot products, as NACV_proj.py, which
+                    cannot be a single matrix product and is much slower, done in chunks that never take more than
+                    max_memory bytes
+
+    returns an array of projections shaped (npairs, nmodes)
+    '''
+    couplings = np.asarray(couplings, dtype=float)
+    if couplings.ndim == 2:
+        couplings = couplings[np.newaxis]
+    modes = np.asarray(modes, dtype=float)
+    if couplings.shape[1:] != modes.shape[1:]:
+        raise ValueError('Couplings for {} atoms cannot be projected onto modes for {} atoms'.format(couplings.shape[1], modes.shape[1]))
+    norms = np.linalg.norm(couplings.reshape(len(couplings), -1), axis=1)
+    couplings = couplings / norms[:, np.newaxis, np.newaxis]
+    overlaps = couplings.reshape(len(couplings), -1) @ modes.reshape(len(modes), -1).T
+    projections = _projection_kinds[kind](overlaps, couplings, modes, max_memory)
+    return projections
+
+
+def scale_projections(projections, vibfreqs):
+    '''
+    Scale projections by the frequencies of the modes and normalise them, as SCALE_PROJ.m
+
+    vibfreqs are in cm-1
+
+    returns the projections divided by the frequencies in hartree, and the same normalised so that the absolute values
+    for each pair sum to 1
+    '''
+    scaled = projections / pF.cmtohartree(np.asarray(vibfreqs, dtype=float))
+    normalised = scaled / np.abs(scaled).sum(axis=-1, keepdims=True)
+    return scaled, normalised
+
+
+def projection_table(couplings, modes, vibfreqs, kind='absolute', max_memory=_project_memory):
+    '''
+    Project, scale and normalise in one go, see project and scale_projections
+
+    returns a dictionary of 'projections', 'scaled' and 'normalised', each shaped (npairs, nmodes)
+    '''
+    TABLE = {}
+    TABLE['projections'] = project(couplings, modes, kind, max_memory)
+    TABLE['scaled'], TABLE['normalised'] = scale_projections(TABLE['projections'], vibfreqs)
+    return TABLE
@@ -0,0 +1,111 @@
+import numpy as np
+import parseFUNCS as pF
+import lineshapes
+
+
+'''
+
+resonanceraman calculates resonance Raman spectra within the short time approximation (STA), a.k.a.
+the excited state gradient approximation, for all normal modes, excited states and excitation wavelengths at once
+
+This follows Kane & Jansen, J. Phys. Chem. C, 2010, 114, 5541 dx.doi.org/10.1021/jp906152q
+The Raman amplitude of mode k excited at laser energy E_L is the sum over excited states e of
+    tdm_e**2 * frequency_k * displacement_ek * damping_e**2 / (E_e - E_L - i damping_e)**2
+and the intensity is 12 times its square modulus, which for a single state in exact resonance is lineshapes._STA_resonance_raman_prefac
+
+'''
+
+# globals
+_daltontoelectronmass = 1822.888486
+
+
+def project_gradients(gradients, vibdisps, vibrmasses):
+    '''
+    Project excited state gradients onto the normal modes, all with one matrix product
+
+    gradients are cartesian, in hartree / bohr, shaped (nstates, natom, 3)
+    vibdisps are the normalized cartesian displacements of the modes, shaped (nmodes, natom, 3),
+    with vibrmasses their reduced masses in amu, as from parseGAUSSIAN.hpmodes
+
+    returns the gradients along the mass-weighted normal coordinates in atomic units, shaped (nstates, nmodes)
+    '''
+    gradients = np.asarray(gradients, dtype=float)
+    vibdisps = np.asarray(vibdisps, dtype=float)
+    nmodes = vibdisps.shape[0]
+    # A unit step along the mass-weighted coordinate moves the atoms by vibdisps / sqrt(reduced mass)
+    projected = gradients.reshape(-1, vibdisps[0].size) @ vibdisps.reshape(nmodes, -1).T
+    projected = projected / np.sqrt(np.asarray(vibrmasses, dtype=float) * _daltontoelectronmass)
+    return projected
+
+
+def displacements(projected, vibfreqs):
+    '''
+    Dimensionless displacements of each excited state along each mode, from project_gradients
+
+    returns an array shaped (nstates, nmodes)
+    '''
+    displacement = lineshapes._STA_displacement(np.asarray(vibfreqs, dtype=float), projected)
+    return displacement
+
+
+def excitation_profile(laser_energies, state_energies, damping):
+    '''
+    Resonance denominators damping**2 / (E_e - E_L - i damping)**2, of magnitude 1 in exact resonance
+
+    laser_energies, state_energies and damping (a single value or one per state) must share units
+
+    returns a complex array shaped (nlasers, nstates)
+    '''
+    laser_energies = np.atleast_1d(np.asarray(laser_energies, dtype=float))
+    state_energies = np.asarray(state_energies, dtype=float)
+    damping = np.broadcast_to(np.asarray(damping, dtype=float), state_energies.shape)
+    detuning = state_energies - laser_energies[:, np.newaxis] - 1j * damping
+    profile = damping**2 / detuning**2
+    return profile
+
+
+def STA_intensities(laser_energies, state_energies, tdms, displacement, vibfreqs, damping):
+    '''
+    Resonance Raman intensities of every mode at every laser energy
+
+    tdms are the transition dipole moments of the states in atomic units, displacement as from displacements
+    and vibfreqs in cm-1. See excitation_profile for the energies.
+
+    returns an array shaped (nlasers, nmodes)
+    '''
+    weights = (np.asarray(tdms, dtype=float)**2)[:, np.newaxis] * displacement * np.asarray(vibfreqs, dtype=float)
+    amplitude = excitation_profile(laser_energies, state_energies, damping) @ weights
+    intensity = 12 * np.abs(amplitude)**2
+    return intensity
+
+
+def STA_map(grid, laser_wavelengths, state_energies, oscillator_strengths, gradients, vibdisps, vibrmasses, vibfreqs,
+            damping, FWHM, shape='Lorentzian', shape_parameter=None):
+    '''
+    Resonance Raman spectra for a whole scan of excitation wavelengths
+
+    grid is the Raman shift in cm-1, laser_wavelengths in nm
+    state_energies are the excitation energies of the states in hartree, with their oscillator_strengths
+    gradients, vibdisps and vibrmasses as for project_gradients, vibfreqs in cm-1
+    damping is the homogeneous linewidth of the excited states in hartree (a single value or one per state)
+    FWHM, shape and shape_parameter set the broadening of the Raman bands, as in lineshapes.broaden
+
+    returns the intensity map shaped (nlasers, grid points) and the stick intensities shaped (nlasers, nmodes)
+    '''
+    grid = np.asarray(grid, dtype=float)
+    state_energies = np.asarray(state_energies, dtype=float)
+    vibfreqs = np.asarray(vibfreqs, dtype=float)
+    laser_energies = pF.cmtohartree(1e7 / np.atleast_1d(np.asarray(laser_wavelengths, dtype=float)))
+    tdms = np.array([pF.osc_to_tdm(f, 0, energy) for f, energy in zip(oscillator_strengths, state_energies)])
+
+    displacement = displacements(project_gradients(gradients, vibdisps, vibrmasses), vibfreqs)
+    sticks = STA_intensities(laser_energies, state_energies, tdms, displacement, vibfreqs, damping)
+
+    # Every laser wavelength shares the band shapes, so the bands are evaluated once and the map is one matrix product
+    widths = [FWHM]
+    if shape in lineshapes._broaden_parameters:
+        widths.append(shape_parameter)
+    widths = [np.broadcast_to(np.asarray(width, dtype=float), vibfreqs.shape)[:, np.newaxis] for width in widths]
+    bands = lineshapes._broaden_shapes[shape](grid, vibfreqs[:, np.newaxis], *widths)
+    intensity_map = sticks @ bands
+    return intensity_map, sticks
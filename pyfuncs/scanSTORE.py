@@ -0,0 +1,301 @@
+import os
+import struct
+import zipfile
+import numpy as np
+import fitFUNCS as fF
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+'''
+
+scanSTORE keeps everything extracted from the calculations of a scan (geometries, energies, gradients, NACVs, rotation
+and diabatic matrices, SOCs, ...) in a single binary file, instead of one small text file per point and quantity
+
+Each point of the scan has a name (BLABLA_123_05l, from which the mode and Q are read, see fitFUNCS.scan_Q) and any
+number of quantities, each an array of the same shape at every point. Points are only ever appended.
+
+The store is an HDF5 file (.h5 or .hdf5, requires h5py) of resizable chunked datasets, or otherwise an uncompressed
+.npz to which each append adds new members, so that nothing already written is rewritten. Reads from an .npz memory-map
+its members in place, reads from an HDF5 file only read the rows selected. Either way np.load or h5py can read the file
+without this module. Quantities can be written back out to the legacy text files with export.
+
+'''
+
+# Legacy text files: quantity -> (extension, format) as written by the Qchem44-EXTRACT_ and Octave scripts
+_legacy_files = {'diabmat': ('diabmat', '% 1.10f'),
+                 'adiabmat': ('adiabmat', '% 1.12f'),
+                 'rotmat': ('rotmat', '% 1.12f'),
+                 'adiabex': ('adiabex', '% 1.12f'),
+                 'scf': ('scf', '% 1.10f'),
+                 'dipoles': ('dipoles', '% 1.4f'),
+                 'diadipoles': ('diadipoles', '% 1.4f'),
+                 'geometry': ('xyz', '% 1.10f'),
+                 'gradients': ('grad', '% 1.10f'),
+                 'NACV': ('mat', '% 1.10f'),
+                 'norms': ('norms', '% 1.10f'),
+                 'SOC': ('soc', '% 1.10f')}
+_hdf5_extensions = ('.h5', '.hdf5')
+_point_fields = ('name', 'mode', 'Q')
+# Size of the fixed part of a zip local file header, see the zip specification
+_zip_local_header = struct.Struct('<4s5H3L2H')
+
+
+def _npz_header(incoming, info):
+    '''
+    Read the .npy header of an uncompressed member of a zip archive, incoming being the archive opened for reading bytes
+
+    returns the shape, order and dtype of the array and the offset of its data in the archive
+    '''
+    incoming.seek(info.header_offset)
+    header = _zip_local_header.unpack(incoming.read(_zip_local_header.size))
+    incoming.seek(info.header_offset + _zip_local_header.size + header[-2] + header[-1])
+    version = np.lib.format.read_magic(incoming)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(incoming)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(incoming)
+    return shape, fortran_order, dtype, incoming.tell()
+
+
+def _npz_member(path, incoming, archive, info):
+    '''
+    Memory-map an uncompressed .npy member of a zip archive in place
+
+    returns the array, or reads it normally if it cannot be mapped (e.g. compressed)
+    '''
+    if info.compress_type != zipfile.ZIP_STORED:
+        with archive.open(info) as member:
+            return np.lib.format.read_array(member)
+    shape, fortran_order, dtype, offset = _npz_header(incoming, info)
+    if dtype.hasobject:
+        raise ValueError('{} in {} holds Python objects and cannot be memory-mapped'.format(info.filename, path))
+    if 0 in shape:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape, order='F' if fortran_order else 'C')
+
+
+def _npz_members(archive):
+    # The members of each key of an .npz store, in the order they were appended, from the directory of the zip alone
+    members = {}
+    for info in archive.infolist():
+        key, chunk = os.path.splitext(info.filename)[0].rsplit('/', 1)
+        members.setdefault(key, []).append((chunk, info))
+    return {key: [info for chunk, info in sorted(infos, key=lambda item: item[0])] for key, infos in members.items()}
+
+
+class ScanStore:
+    '''
+    A scan in a single .npz or HDF5 file, see above
+
+    append(names, **quantities) adds points, each quantity shaped (npoints, ...)
+    points() returns the names, modes and values of Q of all of the points
+    quantities() returns the names of the quantities stored
+    get(quantity, mode=None, Q=None, names=None) returns the indices of the selected points that have quantity and
+    their values
+    export(quantity, directory='.') writes the legacy text files
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.hdf5 = path.endswith(_hdf5_extensions)
+        if self.hdf5 and h5py is None:
+            raise ImportError('Reading or writing {} requires h5py, use an .npz store instead'.format(path))
+
+    # npz: the members are [quantity]/[chunk].npy and [quantity].index/[chunk].npy, the points are the quantities
+    # name, mode and Q, each chunk is one append
+    def _npz_chunks(self, keys):
+        '''
+        Memory-map the chunks of the given keys only, reading the directory of the zip once
+
+        returns a dictionary of the lists of chunks of the keys that are in the store
+        '''
+        if not os.path.exists(self.path):
+            return {}
+        with zipfile.ZipFile(self.path) as archive, open(self.path, 'rb') as incoming:
+            members = _npz_members(archive)
+            return {key: [_npz_member(self.path, incoming, archive, info) for info in members[key]] for key in keys if key in members}
+
+    def _npz_append(self, arrays):
+        chunk = 0
+        if os.path.exists(self.path):
+            # Only the headers of the stored arrays are read, to check the shapes
+            with zipfile.ZipFile(self.path) as archive, open(self.path, 'rb') as incoming:
+                members = _npz_members(archive)
+                chunk = len(members.get('name', []))
+                for key, array in arrays.items():
+                    if key in members:
+                        shape = _npz_header(incoming, members[key][0])[0]
+                        if shape[1:] != array.shape[1:]:
+                            raise ValueError('{} is shaped {} in {}, not {}'.format(key, shape[1:], self.path, array.shape[1:]))
+        with zipfile.ZipFile(self.path, 'a', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for key, array in arrays.items():
+                with archive.open('{}/{:06d}.npy'.format(key, chunk), 'w', force_zip64=True) as member:
+                    np.lib.format.write_array(member, np.ascontiguousarray(array), allow_pickle=False)
+
+    def _hdf5_append(self, arrays):
+        with h5py.File(self.path, 'a') as stored:
+            for key, array in arrays.items():
+                if array.dtype.kind == 'U':
+                    array = array.astype(h5py.string_dtype())
+                if key not in stored:
+                    stored.create_dataset(key, data=array, maxshape=(None,) + array.shape[1:], chunks=True)
+                    continue
+                dataset = stored[key]
+                if dataset.shape[1:] != array.shape[1:]:
+                    raise ValueError('{} is shaped {} in {}, not {}'.format(key, dataset.shape[1:], self.path, array.shape[1:]))
+                dataset.resize(len(dataset) + len(array), axis=0)
+                dataset[-len(array):] = array
+
+    def _read(self, keys):
+        # The whole of each of the stored arrays keys (memory-mapped chunks concatenated), None for those not stored
+        if self.hdf5:
+            stored = {}
+            if os.path.exists(self.path):
+                with h5py.File(self.path, 'r') as incoming:
+                    for key in keys:
+                        if key in incoming:
+                            dataset = incoming[key]
+                            # Strings come back as bytes unless asked for as str
+                            stored[key] = np.asarray(dataset.asstr()[()], dtype=str) if dataset.dtype.kind == 'O' else dataset[()]
+        else:
+            stored = {key: np.concatenate(chunks) for key, chunks in self._npz_chunks(keys).items()}
+        return {key: stored.get(key) for key in keys}
+
+    @staticmethod
+    def _points(stored):
+        POINTS = {}
+        for field, dtype in zip(_point_fields, (str, int, float)):
+            POINTS[field] = np.array([], dtype=dtype) if stored.get(field) is None else np.asarray(stored[field])
+        return POINTS
+
+    def points(self):
+        '''
+        returns a dictionary of the 'name', 'mode' and 'Q' of every point, in the order they were added
+        '''
+        return self._points(self._read(_point_fields))
+
+    def quantities(self):
+        '''
+        returns the names of the quantities in the store
+        '''
+        if self.hdf5:
+            if not os.path.exists(self.path):
+                return []
+            with h5py.File(self.path, 'r') as stored:
+                keys = list(stored.keys())
+        elif os.path.exists(self.path):
+            with zipfile.ZipFile(self.path) as archive:
+                keys = list(_npz_members(archive))
+        else:
+            keys = []
+        return sorted(key for key in keys if key not in _point_fields and not key.endswith('.index'))
+
+    def append(self, names, step=fF._Q_step, **quantities):
+        '''
+        Add points to the store, named BLABLA_123_05l (see fitFUNCS.scan_Q, step is the Q of one step)
+
+        Each of quantities is an array shaped (len(names), ...), not every quantity needs to be given for every point
+        '''
+        names = np.asarray(names, dtype=str).reshape(-1)
+        modes, Q = fF.scan_Q(names, step)
+        first = len(self.points()['name'])
+        arrays = {'name': names, 'mode': modes, 'Q': Q}
+        for quantity, values in quantities.items():
+            values = np.asarray(values)
+            if len(values) != len(names):
+                raise ValueError('{} has values for {} points, not {}'.format(quantity, len(values), len(names)))
+            arrays[quantity] = values
+            arrays['{}.index'.format(quantity)] = np.arange(first, first + len(names))
+        if self.hdf5:
+            self._hdf5_append(arrays)
+        else:
+            self._npz_append(arrays)
+
+    @staticmethod
+    def _select(POINTS, mode, Q, names):
+        selected = np.ones(len(POINTS['name']), dtype=bool)
+        if mode is not None:
+            selected &= np.isin(POINTS['mode'], np.atleast_1d(mode))
+        if Q is not None:
+            selected &= np.isclose(POINTS['Q'][:, np.newaxis], np.atleast_1d(Q)).any(axis=1)
+        if names is not None:
+            selected &= np.isin(POINTS['name'], np.atleast_1d(names))
+        return np.flatnonzero(selected)
+
+    def get(self, quantity, mode=None, Q=None, names=None):
+        '''
+        Read a quantity for the points of the given modes, values of Q and/or names (all of the points by default)
+
+        returns the indices of the points (see points) and an array of their values shaped (npoints, ...)
+        '''
+        index_key = '{}.index'.format(quantity)
+        keys = (index_key,) + _point_fields
+        if self.hdf5:
+            stored = self._read(keys)
+        else:
+            # One read of the directory of the zip, mapping only what is needed
+            chunks = self._npz_chunks(keys + (quantity,))
+            stored = {key: np.concatenate(chunks[key]) if key in chunks else None for key in keys}
+        index = stored[index_key]
+        if index is None:
+            raise KeyError('There is no {} in {}'.format(quantity, self.path))
+        rows = np.flatnonzero(np.isin(index, self._select(self._points(stored), mode, Q, names)))
+        if self.hdf5:
+            with h5py.File(self.path, 'r') as incoming:
+                values = incoming[quantity][rows] if len(rows) else np.empty((0,) + incoming[quantity].shape[1:])
+        else:
+            # Only the selected rows of the memory-mapped chunks are read
+            values = []
+            start = 0
+            for chunk in chunks[quantity]:
+                within = rows[(rows >= start) & (rows < start + len(chunk))] - start
+                values.append(np.asarray(chunk[within]))
+                start += len(chunk)
+            values = np.concatenate(values)
+        return index[rows], values
+
+    def export(self, quantity, directory='.', extension=None, fmt=None, mode=None, Q=None, names=None):
+        '''
+        Write [name].[extension] text files of a quantity for the selected points (all of them by default), in the
+        legacy format of the quantity where known
+
+        returns the names of the files written
+        '''
+        indices, values = self.get(quantity, mode, Q, names)
+        point_names = self.points()['name']
+        written = [write_legacy(point_names[index], quantity, value, directory, extension, fmt) for index, value in zip(indices, values)]
+        return written
+
+
+def write_legacy(name, quantity, value, directory='.', extension=None, fmt=None):
+    '''
+    Write one quantity of one point to [name].[extension], in the legacy format of the quantity where known
+
+    returns the name of the file written
+    '''
+    default_extension, default_fmt = _legacy_files.get(quantity, (quantity, '% 1.10f'))
+    extension = default_extension if extension is None else extension
+    fmt = default_fmt if fmt is None else fmt
+    file = os.path.join(directory, '{}.{}'.format(name, extension))
+    value = np.asarray(value)
+    np.savetxt(file, value.reshape(-1, value.shape[-1]) if value.ndim > 1 else value.reshape(-1, 1), fmt=fmt, delimiter='\t')
+    return file
+
+
+def from_legacy(store, names, quantities, step=fF._Q_step):
+    '''
+    Add the legacy text files [name].[extension] of the given quantities (see _legacy_files) for names to store in one
+    append, e.g. to convert an existing scan
+
+    returns the store
+    '''
+    arrays = {}
+    for quantity in quantities:
+        extension = _legacy_files.get(quantity, (quantity,))[0]
+        arrays[quantity] = np.stack([np.loadtxt('{}.{}'.format(name, extension)) for name in names])
+    store.append(names, step, **arrays)
+    return store